@@ -0,0 +1,397 @@
+﻿import argparse
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from Lab4.evaluate import ENV_ID, make_env
+
+# the write and read counters of a ring sit on their own cache lines
+_CACHE_LINE = 64
+RING_CAPACITY = 4096
+
+
+def transition_dtype(state_dim):
+    """
+    One step of an actor: the features of the state, the action taken, the shaped reward, the next state's
+    features and the action the actor chose there (-1 when done). The last transition of an episode also
+    carries the episode's env reward and its exploration percentages.
+    """
+    return np.dtype([
+        ("features", np.float32, (state_dim,)),
+        ("action", np.int64),
+        ("reward", np.float32),
+        ("next_features", np.float32, (state_dim,)),
+        ("next_action", np.int64),
+        ("done", np.bool_),
+        ("episode_reward", np.float32),
+        ("scanned_percentage", np.float32),
+        ("visited_percentage", np.float32),
+    ])
+
+
+class TransitionRing:
+    """
+    Single producer, single consumer ring of transitions in shared memory, without locks: the actor only
+    writes records and then advances the write counter, the learner only reads records below the write
+    counter and then advances the read counter. The counters are int64 that only grow (aligned 8 byte stores
+    are atomic), a record is in slot counter % capacity.
+    """
+
+    def __init__(self, state_dim, capacity=RING_CAPACITY, name=None):
+        self.dtype = transition_dtype(state_dim)
+        self.capacity = capacity
+        size = 2 * _CACHE_LINE + capacity * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self._write = np.ndarray(1, dtype=np.int64, buffer=self.shm.buf, offset=0)
+        self._read = np.ndarray(1, dtype=np.int64, buffer=self.shm.buf, offset=_CACHE_LINE)
+        self.records = np.ndarray(capacity, dtype=self.dtype, buffer=self.shm.buf, offset=2 * _CACHE_LINE)
+        if name is None:
+            self._write[0] = 0
+            self._read[0] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def push(self, features, action, reward, next_features, next_action, done, episode_reward=0.0,
+             scanned_percentage=0.0, visited_percentage=0.0):
+        """
+        Actor side, waits while the ring is full.
+        """
+        write = int(self._write[0])
+        while write - int(self._read[0]) >= self.capacity:
+            time.sleep(1e-4)
+        record = self.records[write % self.capacity]
+        record["features"] = features
+        record["action"] = action
+        record["reward"] = reward
+        record["next_features"] = next_features
+        record["next_action"] = next_action
+        record["done"] = done
+        record["episode_reward"] = episode_reward
+        record["scanned_percentage"] = scanned_percentage
+        record["visited_percentage"] = visited_percentage
+        self._write[0] = write + 1
+
+    def pending(self):
+        """
+        Learner side.
+        :return: copy of the records written and not yet released, oldest first
+        """
+        read = int(self._read[0])
+        write = int(self._write[0])
+        slots = np.arange(read, write) % self.capacity
+        return self.records[slots]
+
+    def release(self, count):
+        self._read[0] += count
+
+    def close(self, unlink=False):
+        del self._write, self._read, self.records
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class SharedWeights:
+    """
+    w, b and epsilon of the learner's model in shared memory, with a version counter used as a sequence lock:
+    publish makes it odd while copying and even after, an actor copies into scratch buffers and keeps the copy
+    only if the version was even and did not change during it. Also carries the stop flag of the actors.
+    """
+
+    def __init__(self, n_actions, state_dim, name=None):
+        size = _CACHE_LINE + (n_actions * state_dim + n_actions) * 4
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self._header = np.ndarray(2, dtype=np.int64, buffer=self.shm.buf, offset=0)
+        self._epsilon = np.ndarray(1, dtype=np.float64, buffer=self.shm.buf, offset=16)
+        self._w = np.ndarray((n_actions, state_dim), dtype=np.float32, buffer=self.shm.buf, offset=_CACHE_LINE)
+        self._b = np.ndarray(n_actions, dtype=np.float32, buffer=self.shm.buf,
+                             offset=_CACHE_LINE + n_actions * state_dim * 4)
+        self._scratch_w = np.empty((n_actions, state_dim), dtype=np.float32)
+        self._scratch_b = np.empty(n_actions, dtype=np.float32)
+        if name is None:
+            self._header[:] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def version(self):
+        return int(self._header[0])
+
+    @property
+    def stopped(self):
+        return self._header[1] != 0
+
+    def stop(self):
+        self._header[1] = 1
+
+    def publish(self, model):
+        self._header[0] += 1
+        self._w[:] = model.w
+        self._b[:] = model.b
+        self._epsilon[0] = model.epsilon
+        self._header[0] += 1
+
+    def read_into(self, model, known_version):
+        """
+        Copies the weights into model if they changed since known_version. A copy torn by a publish is
+        dropped, model keeps its weights and the next call tries again.
+        :return: the version of model's weights
+        """
+        version = int(self._header[0])
+        if version == known_version or version % 2:
+            return known_version
+        self._scratch_w[:] = self._w
+        self._scratch_b[:] = self._b
+        epsilon = float(self._epsilon[0])
+        if int(self._header[0]) != version:
+            return known_version
+        model.w[:] = self._scratch_w
+        model.b[:] = self._scratch_b
+        model.epsilon = epsilon
+        return version
+
+    def close(self, unlink=False):
+        del self._header, self._epsilon, self._w, self._b
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _actor_main(actor_id, n_actors, ring_name, weights_name, n_actions, state_dim, seed, env_id,
+                examinator_coefficients):
+    """
+    The loop of Trainer.train without the update: acts epsilon-greedy with the latest published weights and
+    pushes every step's transition. Episode k of actor i is reset with seed + i + k * n_actors.
+    """
+    from Lab4.examinator import Examinator
+    from Lab4.exploration_tracker import ExplorationTracker
+    from Lab4.sarsa import Sarsa
+    from Lab4.state import CompactState
+    from Lab4.trainer import ACTION_DUPLICATE_TOLERANCE, INITIAL_NOOP_STEPS, LastActionTracker, Trainer
+
+    env = make_env("rgb_array", env_id)
+    ring = TransitionRing(state_dim, name=ring_name)
+    weights = SharedWeights(n_actions, state_dim, name=weights_name)
+    model = Sarsa(n_actions)
+    version = weights.read_into(model, -1)
+    examinator = Examinator(examinator_coefficients)
+    exploration_tracker = ExplorationTracker(160, 210)
+    np.random.seed(seed + actor_id)
+
+    episode = 0
+    while not weights.stopped:
+        _ = env.reset(seed=seed + actor_id + episode * n_actors)
+        episode += 1
+        for j in range(0, INITIAL_NOOP_STEPS):  # skip initial no-op frames
+            _ = env.step(0)
+
+        last_action_tracker = LastActionTracker(space_size=ACTION_DUPLICATE_TOLERANCE)
+        exploration_tracker.reset()
+
+        featured_state = CompactState(env.render())
+        if featured_state.is_empty:
+            continue
+        state_vector = featured_state.as_vector()
+        distance_to_closest_enemy = featured_state.distance_from_player(
+            featured_state.closest_enemy) if featured_state.closest_enemy is not None else -1
+        version = weights.read_into(model, version)
+        action, _ = model.epsilon_greedy(state_vector)
+
+        done = False
+        ep_reward = 0
+        scanned_percentage = 0.0
+        visited_percentage = 0.0
+        while not done and not weights.stopped:
+            next_state, reward, terminated, truncated, _ = env.step(action)
+            next_featured_state = CompactState(next_state)
+            ep_reward += reward
+
+            if next_featured_state.is_empty:
+                done = True
+                shaped_reward = reward + Examinator.DEATH_PENALTY
+                next_features = state_vector
+                next_action = -1
+            else:
+                done = terminated or truncated or next_featured_state.player_box is None
+                next_features = next_featured_state.as_vector()
+                version = weights.read_into(model, version)
+                next_action, _ = model.epsilon_greedy(next_features)
+
+                visited_pixels, scanned_pixels = exploration_tracker.cover(next_featured_state)
+                visited_percentage = max(visited_percentage, next_featured_state.percentage_from_area(visited_pixels))
+                scanned_percentage = max(scanned_percentage, next_featured_state.percentage_from_area(scanned_pixels))
+
+                shaped_reward, distance_to_closest_enemy = Trainer._shape_reward(
+                    examinator, model, featured_state, next_featured_state, action, next_action, reward,
+                    last_action_tracker, distance_to_closest_enemy, scanned_pixels, visited_pixels)
+
+            ring.push(state_vector, action, shaped_reward, next_features, -1 if done else next_action, done,
+                      ep_reward, scanned_percentage, visited_percentage)
+
+            if not done:
+                featured_state = next_featured_state
+                state_vector = next_features
+                action = next_action
+                last_action_tracker.rec(action)
+
+    ring.close()
+    weights.close()
+
+
+def _learn_round(model, z_w, z_b, rows, records):
+    """
+    One SARSA(lambda) step for each of the actors in rows, TD errors from the current weights, then the traces
+    of the actors whose episode ended are cleared.
+    """
+    actions = records["action"]
+    next_actions = records["next_action"]
+    done = records["done"]
+    q = np.einsum("nd,nd->n", records["features"], model.w[actions]) + model.b[actions]
+    q_next = np.einsum("nd,nd->n", records["next_features"], model.w[next_actions]) + model.b[next_actions]
+    deltas = (records["reward"] + model.gamma * np.where(done, 0.0, q_next) - q).astype(np.float32)
+    model.td_update_batch(z_w, z_b, rows, records["features"], actions, deltas)
+    z_w[rows[done]] = 0.0
+    z_b[rows[done]] = 0.0
+
+
+def train_actor_learner(trainer, model, class_name, n_episodes=1000, n_actors=None, seed=0, env_id=ENV_ID):
+    """
+    Trainer.train_vectorized with the envs in actor processes: every actor plays its own env with the weights
+    the learner last published and sends its transitions through its TransitionRing; the learner (this
+    process) applies them with Sarsa.td_update_batch, one row per actor, keeping the eligibility traces of
+    each actor, and publishes w / b / epsilon through SharedWeights after each batch. The TD errors are
+    computed by the learner with its current weights. Only dense Sarsa, td_update_batch is needed.
+    :return: env steps per second
+    """
+    from Lab4.examinator import Examinator
+    from Lab4.trainer import Trainer
+
+    Trainer._check_batched_model(model)
+    n_actors = n_actors or os.cpu_count()
+    n_actions = model.n_actions
+    state_dim = model.state_dim
+    print(f"Training {class_name} agent with {n_actors} actors...")
+    decay_episodes, epsilon_decay_step = trainer._epsilon_schedule(model, n_episodes)
+    # unknown coefficients fail here rather than in the actors
+    Examinator(trainer.examinator_coefficients)
+
+    rings = [TransitionRing(state_dim) for _ in range(n_actors)]
+    weights = SharedWeights(n_actions, state_dim)
+    weights.publish(model)
+
+    context = multiprocessing.get_context("spawn")
+    actors = [context.Process(target=_actor_main, daemon=True,
+                              args=(k, n_actors, rings[k].name, weights.name, n_actions, state_dim, seed, env_id,
+                                    trainer.examinator_coefficients))
+              for k in range(n_actors)]
+    for actor in actors:
+        actor.start()
+
+    z_w = np.zeros((n_actors,) + model.w.shape, dtype=np.float32)
+    z_b = np.zeros((n_actors,) + model.b.shape, dtype=np.float32)
+    action_counts = np.zeros(n_actions, dtype=np.float32)
+    rewards = []
+    w_changes = []
+    scanned_pixels_by_episode_percentage = []
+    visited_pixels_by_episode_percentage = []
+    previous_w = model.w.copy()
+    log_step = max(1, n_episodes // 100)
+    env_steps = 0
+    start_time = None
+
+    try:
+        while len(rewards) < n_episodes:
+            batches = [ring.pending() for ring in rings]
+            counts = np.array([len(batch) for batch in batches])
+            if counts.sum() == 0:
+                for actor in actors:
+                    if not actor.is_alive():
+                        raise RuntimeError(f"Actor {actor.name} exited with code {actor.exitcode}")
+                time.sleep(5e-4)
+                continue
+            # the actors' start up (imports, numba cache) is not counted
+            start_time = start_time or time.perf_counter()
+
+            # round j takes the j-th pending transition of every actor, td_update_batch needs unique rows
+            rounds = np.concatenate([np.arange(count) for count in counts])
+            order = np.argsort(rounds, kind="stable")
+            all_records = np.concatenate(batches)[order]
+            all_rows = np.repeat(np.arange(n_actors), counts)[order]
+            bounds = np.searchsorted(rounds[order], np.arange(counts.max() + 1))
+            for j in range(counts.max()):
+                rows = all_rows[bounds[j]:bounds[j + 1]]
+                records = all_records[bounds[j]:bounds[j + 1]]
+                _learn_round(model, z_w, z_b, rows, records)
+                np.add.at(action_counts, records["action"], 1)
+                env_steps += len(rows)
+
+                for i in np.flatnonzero(records["done"]):
+                    rewards.append(float(records["episode_reward"][i]))
+                    scanned_pixels_by_episode_percentage.append(float(records["scanned_percentage"][i]))
+                    visited_pixels_by_episode_percentage.append(float(records["visited_percentage"][i]))
+                    finished_episodes = len(rewards)
+
+                    if finished_episodes > 1 and (finished_episodes - 1) % 5 == 0:
+                        Trainer._rebalance_action_biases(model, action_counts, n_actions, finished_episodes - 1,
+                                                         decay_episodes)
+                    model.epsilon = max(trainer.epsilon_min, model.epsilon - epsilon_decay_step)
+
+                    w_changes.append(np.mean(np.abs(model.w - previous_w)))
+                    previous_w = model.w.copy()
+
+                    if finished_episodes % log_step == 0:
+                        recent_max = float(np.max(rewards[-log_step:]))
+                        steps_per_second = env_steps / (time.perf_counter() - start_time)
+                        print(f"Episode {finished_episodes}/{n_episodes}: Max reward for period={recent_max:.2f}, "
+                              f"Eps={model.epsilon:.4f}, {steps_per_second:.1f} env steps/s")
+
+            for ring, batch in zip(rings, batches):
+                ring.release(len(batch))
+            weights.publish(model)
+    finally:
+        weights.stop()
+        deadline = time.perf_counter() + 10
+        while any(actor.is_alive() for actor in actors) and time.perf_counter() < deadline:
+            # unblock actors waiting on a full ring
+            for ring in rings:
+                ring.release(len(ring.pending()))
+            time.sleep(1e-2)
+        for actor in actors:
+            if actor.is_alive():
+                actor.terminate()
+            actor.join()
+        for ring in rings:
+            ring.close(unlink=True)
+        weights.close(unlink=True)
+
+    # no transition arrived (n_episodes=0): nothing was timed
+    elapsed = time.perf_counter() - start_time if start_time is not None else 0.0
+    steps_per_second = env_steps / elapsed if elapsed > 0 else 0.0
+    print(f"Throughput: {env_steps} env steps in {elapsed:.1f}s ({steps_per_second:.1f} env steps/s)")
+
+    n_finished = len(rewards)
+    trainer._report(n_finished, n_actions, action_counts, rewards, w_changes, scanned_pixels_by_episode_percentage,
+                    visited_pixels_by_episode_percentage)
+    model.save(trainer._file_name_for_class(class_name))
+    return steps_per_second
+
+
+if __name__ == "__main__":
+    from Lab4.sarsa import Sarsa
+    from Lab4.trainer import Trainer
+
+    parser = argparse.ArgumentParser(description="Train Sarsa with actor processes and one learner.")
+    parser.add_argument("class_name", nargs="?", default="Berzerk")
+    parser.add_argument("-n", "--episodes", type=int, default=1000)
+    parser.add_argument("-j", "--actors", type=int, default=None, help="actor processes, default one per cpu")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    train_actor_learner(Trainer(), Sarsa(18), args.class_name, args.episodes, args.actors, args.seed)
\ No newline at end of file
@@ -0,0 +1,49 @@
+﻿import os
+import sys
+import time
+
+import numpy as np
+
+from Lab4.actor_learner import _learn_round, train_actor_learner, transition_dtype
+from Lab4.sarsa import Sarsa
+from Lab4.state import VECTOR_STATE_SIZE
+from Lab4.trainer import Trainer
+
+LEARNER_ACTORS = 16
+LEARNER_ROUNDS = 2000
+
+
+def learner_capacity():
+    """
+    :return: transitions per second the learner applies, rounds of LEARNER_ACTORS synthetic transitions
+    """
+    rng = np.random.default_rng(0)
+    model = Sarsa(18)
+    z_w = np.zeros((LEARNER_ACTORS,) + model.w.shape, dtype=np.float32)
+    z_b = np.zeros((LEARNER_ACTORS,) + model.b.shape, dtype=np.float32)
+    records = np.zeros(LEARNER_ACTORS, dtype=transition_dtype(VECTOR_STATE_SIZE))
+    records["features"] = rng.random((LEARNER_ACTORS, VECTOR_STATE_SIZE))
+    records["next_features"] = rng.random((LEARNER_ACTORS, VECTOR_STATE_SIZE))
+    records["action"] = rng.integers(0, 18, LEARNER_ACTORS)
+    records["next_action"] = rng.integers(0, 18, LEARNER_ACTORS)
+    records["reward"] = rng.normal(size=LEARNER_ACTORS)
+    records["done"] = rng.random(LEARNER_ACTORS) < 0.01
+    rows = np.arange(LEARNER_ACTORS)
+    start = time.perf_counter()
+    for _ in range(LEARNER_ROUNDS):
+        _learn_round(model, z_w, z_b, rows, records)
+    return LEARNER_ACTORS * LEARNER_ROUNDS / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    Trainer._report = staticmethod(lambda *args: None)
+    n_episodes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    capacity = learner_capacity()
+    print(f"learner: {capacity:,.0f} transitions/s ({LEARNER_ACTORS} actors per round)")
+
+    single = None
+    for n_actors in sorted({1, 2, os.cpu_count()}):
+        steps_per_second = train_actor_learner(Trainer(), Sarsa(18), "benchmark", n_episodes, n_actors)
+        single = single or steps_per_second
+        print(f"== {n_actors} actors: {steps_per_second:,.0f} env steps/s, {steps_per_second / single:.2f}x "
+              f"of 1 actor ({os.cpu_count()} cpus)")
\ No newline at end of file
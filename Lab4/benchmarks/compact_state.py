@@ -0,0 +1,45 @@
+﻿import gc
+import time
+import tracemalloc
+
+import numpy as np
+
+from Lab4.benchmarks.distance_fields import record_frames
+from Lab4.state import State, CompactState, compact_states
+
+
+def bytes_per_state(build, frames):
+    """
+    Memory held by the built objects (everything allocated and still referenced), per frame.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    kept = build(frames)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return (after - before) / len(frames)
+
+
+def frames_per_second(build, frames):
+    build(frames)  # compile / warm up, State compiles basic_observation variants on the first frames
+    start = time.perf_counter()
+    build(frames)
+    return len(frames) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    frames = np.array(record_frames(42))
+
+    variants = [
+        ("State", lambda fs: [State(f) for f in fs]),
+        ("CompactState, index map", lambda fs: [CompactState(f, keep_index_map=True) for f in fs]),
+        ("CompactState", lambda fs: [CompactState(f) for f in fs]),
+        ("compact_states batch", compact_states),
+    ]
+    print(f"{len(frames)} frames")
+    for name, build in variants:
+        fps = frames_per_second(build, frames)
+        memory = bytes_per_state(build, frames)
+        print(f"{name:<24} {fps:>10,.0f} frames/s {memory:>10,.0f} bytes/state")
\ No newline at end of file
@@ -0,0 +1,75 @@
+﻿import time
+
+import ale_py
+import gymnasium as gym
+import numpy as np
+
+from Lab4.env_analizators import scan_observation, field_observation, distance_fields, fill_template, \
+    cut_empty_layers_in_frame, rgb_to_index, fill_holes, find_player_box, sprites_on_border, PORTAL_INDEX
+
+N_FRAMES = 2000
+
+gym.register_envs(ale_py)
+
+
+def record_frames(seed):
+    env = gym.make("ALE/Berzerk-v5", frameskip=4)
+    rng = np.random.default_rng(seed)
+    frames = []
+    obs, _ = env.reset(seed=seed)
+    while len(frames) < N_FRAMES:
+        frames.append(obs)
+        obs, _, terminated, truncated, _ = env.step(rng.integers(env.action_space.n))
+        if terminated or truncated:
+            obs, _ = env.reset()
+    env.close()
+    return frames
+
+
+def prepare(frames):
+    """
+    Filled index maps with a player, their box and the distance fields of their room, skipping frames where
+    the fields do not apply (sprites on the border or portal colored sprites).
+    """
+    samples, rooms = [], {}
+    for frame in frames:
+        frame = cut_empty_layers_in_frame(frame)
+        if frame.shape[0] == 0 or frame.shape[1] == 0 or sprites_on_border(frame):
+            continue
+        state, enemy_pixels = rgb_to_index(frame)
+        if np.any(state == PORTAL_INDEX):
+            continue
+        template = fill_template(state)
+        fill_holes(state)
+        box = find_player_box(state)
+        if box is None:
+            continue
+        key = template.tobytes()
+        if key not in rooms:
+            rooms[key] = (state, template, distance_fields(state, template))
+        samples.append((state, box, rooms[key][2], enemy_pixels > 0))
+    return samples, rooms
+
+
+def measure(fn, samples):
+    fn(samples[0])  # compile / warm up
+    start = time.perf_counter()
+    results = [fn(sample) for sample in samples]
+    return results, len(samples) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    samples, rooms = prepare(record_frames(42))
+
+    scan, scan_fps = measure(lambda sample: scan_observation(sample[0], sample[1]), samples)
+    field, field_fps = measure(lambda sample: field_observation(*sample), samples)
+    start = time.perf_counter()
+    for state, template, _ in rooms.values():
+        distance_fields(state, template)
+    build_us = (time.perf_counter() - start) / len(rooms) * 1e6
+
+    same = all(a == b for a, b in zip(scan, field))
+    print(f"{len(samples)} frames, {len(rooms)} rooms")
+    print(f"scan_observation:  {scan_fps:>10,.0f} frames/s")
+    print(f"field_observation: {field_fps:>10,.0f} frames/s ({field_fps / scan_fps:.1f}x), identical: {same}")
+    print(f"distance_fields:   {build_us:>10,.1f} us per room")
\ No newline at end of file
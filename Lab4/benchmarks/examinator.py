@@ -0,0 +1,128 @@
+﻿import time
+
+import numpy as np
+
+from Lab4.env_info import *
+from Lab4.benchmarks.distance_fields import record_frames
+from Lab4.examinator import Examinator
+from Lab4.state import CompactState, pack_states
+
+
+def examine_python(examinator, state, action, reward, prev_state, scanned_pixels=0, visited_pixels=0):
+    """
+    Examinator.examine before the compiled rules, method calls and list / dict lookups per step.
+    """
+    shaped_reward = reward / examinator.ENV_REWARD_DESCALE
+
+    shaped_reward += examinator.LIVING_PENALTY
+
+    if state.closest_enemy is not None:
+        enemy_dir = state.direction_to_player(state.closest_enemy)
+        required_action = FIRE_ACTIONS[1] + enemy_dir
+        if action != required_action and reward <= 0:
+            shaped_reward += examinator.NOT_SHOOT_ENEMY_PENALTY
+        if action == 0:
+            shaped_reward += examinator.STAY_IN_DANGER_PENALTY
+        if action == required_action:
+            shaped_reward += examinator.FIRE_ENEMY_BONUS
+    else:
+        if action not in FIRE_ACTIONS and action != 0:
+            shaped_reward += examinator.BONUS_FOR_NOT_SHOOT_NOWHERE
+
+    alive = state.player_box is not None
+    if not alive:
+        shaped_reward += examinator.DEATH_PENALTY
+
+    min_distance_to_wall = min(
+        state.center_of_player()[0] - state.up_wall[0],
+        state.down_wall[0] - state.center_of_player()[0],
+        state.center_of_player()[1] - state.left_wall[1],
+        state.right_wall[1] - state.center_of_player()[1]
+    )
+    if min_distance_to_wall > 15:
+        shaped_reward += examinator.FAR_FROM_WALL_BONUS
+
+    if action in MOVE_ACTIONS:
+        shaped_reward += examinator.BONUS_FOR_SCANNED_PIXEL * scanned_pixels
+        shaped_reward += examinator.BONUS_FOR_VISITED_PIXEL * visited_pixels
+
+        dir_to_closest_wall = state.get_direction_on_closest_wall()
+        action_components = ACTION_TO_DIRECTIONS.get(action, [])
+
+        if dir_to_closest_wall in action_components:
+            dist_to_wall = state.distance_to_closest_border()
+
+            if dist_to_wall < examinator.WALL_SAVE_DISTANCE:
+                shaped_reward += -1.0 * (15.0 / (dist_to_wall + 1.0))
+            else:
+                shaped_reward += examinator.GO_TO_WALL_PENALTY
+
+    if state.enemies == 0:
+        if not alive:
+            shaped_reward += examinator.DEATH_PENALTY
+            return shaped_reward
+        else:
+            shaped_reward += examinator.STABLE_BONUS_ON_CLEARED_LEVEL
+
+        if action in FIRE_ACTIONS:
+            shaped_reward += examinator.SHOOT_WHEN_NO_ENEMIES_PENALTY
+
+        distance_to_closest_wall = state.distance_to_closest_border()
+        if examinator.WALL_SAVE_DISTANCE < distance_to_closest_wall < 30:
+            shaped_reward += 0.15
+        elif 30 <= distance_to_closest_wall < 40:
+            shaped_reward += 0.07
+
+        if state.closest_portal is not None:
+            if prev_state.closest_portal is None:
+                shaped_reward += examinator.FIND_PORTAL_BONUS
+            else:
+                prev_distance = prev_state.distance_from_player(prev_state.closest_portal)
+                curr_distance = state.distance_from_player(state.closest_portal)
+                if curr_distance < prev_distance:
+                    shaped_reward += 1
+
+        if state.closest_portal is None and prev_state.closest_portal is not None:
+            shaped_reward += examinator.LOSE_PORTAL_PENALTY
+
+    return shaped_reward
+
+
+def transitions(states, rng):
+    """
+    Consecutive recorded states with random actions, rewards and exploration counts.
+    """
+    n = len(states) - 1
+    return (states[1:], rng.integers(0, 18, n), rng.choice([0.0, 0.0, 0.0, 50.0], n), states[:-1],
+            rng.integers(0, 300, n).astype(np.float64), rng.integers(0, 60, n).astype(np.float64))
+
+
+def best_of(f, repeats=5):
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = f()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+if __name__ == "__main__":
+    states = [CompactState(frame) for frame in record_frames(42)]
+    states = [s for s in states if not s.is_empty]
+    next_states, actions, rewards, prev_states, scanned, visited = transitions(states, np.random.default_rng(42))
+    n = len(actions)
+    examinator = Examinator()
+    steps = list(zip(next_states, actions, rewards, prev_states, scanned, visited))
+
+    python, python_seconds = best_of(lambda: [examine_python(examinator, s, a, r, p, sc, vi)
+                                              for s, a, r, p, sc, vi in steps])
+    compiled, compiled_seconds = best_of(lambda: [examinator.examine(s, a, None, r, p, sc, vi)
+                                                  for s, a, r, p, sc, vi in steps])
+    records, prev_records = pack_states(next_states), pack_states(prev_states)
+    batch, batch_seconds = best_of(lambda: examinator.examine_batch(records, actions, rewards, prev_records,
+                                                                    scanned, visited))
+
+    print(f"{n} transitions, identical rewards: {np.array_equal(python, compiled) and np.array_equal(python, batch)}")
+    for label, seconds in [("python rules", python_seconds), ("compiled, per step", compiled_seconds),
+                           ("compiled, one batch", batch_seconds)]:
+        print(f"  {label:<22} {seconds / n * 1e6:8.3f} us/transition {python_seconds / seconds:8.1f}x")
\ No newline at end of file
@@ -0,0 +1,131 @@
+﻿import time
+from types import SimpleNamespace
+
+import numba
+import numpy as np
+
+from Lab4.benchmarks.distance_fields import record_frames
+from Lab4.env_analizators import get_scanning_points
+from Lab4.exploration_tracker import ExplorationTracker
+from Lab4.state import CompactState
+
+EPISODE_FRAMES = 250
+
+
+@numba.njit
+def mark_scanned_line_int32(mask, r0, c0, r1, c1):
+    """
+    The tracker before the bit planes: one int32 per pixel, 1 = visited, 2 = scanned.
+    """
+    new_pixels = 0
+    if r0 == r1:
+        for c in range(min(c0, c1), max(c0, c1) + 1):
+            if 0 <= r0 < mask.shape[0] and 0 <= c < mask.shape[1]:
+                if mask[r0, c] == 0:
+                    mask[r0, c] = 2
+                    new_pixels += 1
+    elif c0 == c1:
+        for r in range(min(r0, r1), max(r0, r1) + 1):
+            if 0 <= r < mask.shape[0] and 0 <= c0 < mask.shape[1]:
+                if mask[r, c0] == 0:
+                    mask[r, c0] = 2
+                    new_pixels += 1
+    return new_pixels
+
+
+@numba.njit
+def mark_scanned_traces_int32(mask, box, up_wall, down_wall, left_wall, right_wall):
+    left_points, right_points, up_points, down_points = get_scanning_points(box)
+    new_pixels = 0
+    for point in left_points:
+        new_pixels += mark_scanned_line_int32(mask, point[0], point[1], left_wall[0], left_wall[1])
+    for point in right_points:
+        new_pixels += mark_scanned_line_int32(mask, point[0], point[1], right_wall[0], right_wall[1])
+    for point in up_points:
+        new_pixels += mark_scanned_line_int32(mask, point[0], point[1], up_wall[0], up_wall[1])
+    for point in down_points:
+        new_pixels += mark_scanned_line_int32(mask, point[0], point[1], down_wall[0], down_wall[1])
+    return new_pixels
+
+
+@numba.njit
+def mark_pixels_in_box_int32(mask, r_min, c_min, r_max, c_max):
+    r_min = max(0, min(r_min, mask.shape[0]))
+    c_min = max(0, min(c_min, mask.shape[1]))
+    r_max = max(0, min(r_max, mask.shape[0]))
+    c_max = max(0, min(c_max, mask.shape[1]))
+    new_pixels = 0
+    for r in range(r_min, r_max):
+        for c in range(c_min, c_max):
+            if mask[r, c] == 0:
+                mask[r, c] = 1
+                new_pixels += 1
+    return new_pixels
+
+
+class Int32Tracker:
+    def __init__(self, h, w):
+        self.space = np.zeros((w, h), dtype=np.int32)
+
+    def cover(self, state):
+        if state.player_box is None:
+            return 0, 0
+        r_min, c_min, r_max, c_max = state.player_box
+        new_visited = mark_pixels_in_box_int32(self.space, r_min, c_min, r_max, c_max)
+        new_scanned = mark_scanned_traces_int32(self.space, state.player_box, state.up_wall, state.down_wall,
+                                                state.left_wall, state.right_wall)
+        return new_visited, new_scanned
+
+
+def random_states(rng, n):
+    """
+    Boxes and walls anywhere, also partly outside the tracker and with rays that are not axis aligned.
+    """
+    states = []
+    for _ in range(n):
+        r, c = rng.integers(-10, 220), rng.integers(-10, 170)
+        box = (r, c, r + rng.integers(0, 30), c + rng.integers(0, 70))
+        walls = [tuple(int(v) for v in rng.integers(-20, 230, 2)) for _ in range(4)]
+        # mostly aligned with the box edges, as basic_observation returns them
+        if rng.random() < 0.8:
+            walls = [(walls[0][0], box[1]), (walls[1][0], box[3]), (box[0], walls[2][1]), (box[2], walls[3][1])]
+        states.append(SimpleNamespace(player_box=tuple(int(v) for v in box), up_wall=walls[0], down_wall=walls[1],
+                                      left_wall=walls[2], right_wall=walls[3]))
+    return states
+
+
+def run(episodes, make, reset):
+    """
+    :return: per step (visited, scanned) counts, seconds
+    """
+    counts = []
+    tracker = make()
+    start = time.perf_counter()
+    for episode in episodes:
+        tracker = reset(tracker)
+        for state in episode:
+            counts.append(tracker.cover(state))
+    return counts, time.perf_counter() - start
+
+
+def compare(name, episodes):
+    variants = [
+        ("int32, new per episode", lambda: Int32Tracker(160, 210), lambda t: Int32Tracker(160, 210)),
+        ("bit planes, reset", lambda: ExplorationTracker(160, 210), lambda t: t.reset() or t),
+    ]
+    results = []
+    for label, make, reset in variants:
+        run(episodes[:1], make, reset)  # compile / warm up
+        results.append((label,) + run(episodes, make, reset))
+    steps = sum(len(episode) for episode in episodes)
+    print(f"{name}: {steps} cover() calls, identical counts: {results[0][1] == results[1][1]}")
+    for label, _, seconds in results:
+        print(f"  {label:<24} {steps / seconds:>12,.0f} covers/s")
+
+
+if __name__ == "__main__":
+    states = [CompactState(frame) for frame in record_frames(42)]
+    compare("recorded frames", [states[i:i + EPISODE_FRAMES] for i in range(0, len(states), EPISODE_FRAMES)])
+
+    rng = np.random.default_rng(42)
+    compare("random boxes", [random_states(rng, 100) for _ in range(50)])
\ No newline at end of file
@@ -0,0 +1,48 @@
+﻿import os
+import sys
+import time
+
+import numpy as np
+
+from Lab4.featurized_env import FEATURES_KEY, make_vector_env
+from Lab4.state import CompactState
+
+
+def observation_bytes(observations):
+    if isinstance(observations, dict):
+        return sum(array[0].nbytes for array in observations.values())
+    return observations[0].nbytes
+
+
+def step_rate(n_envs, featurized, n_steps):
+    """
+    :return: vector steps of random actions per second up to the features of every env, bytes of one
+             env's observation
+    """
+    envs = make_vector_env(n_envs, featurized)
+    rng = np.random.default_rng(0)
+    observations, _ = envs.reset(seed=0)
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        observations, _, terminated, truncated, _ = envs.step(rng.integers(0, 18, n_envs))
+        if featurized:
+            features = observations[FEATURES_KEY]
+        else:
+            states = [CompactState(frame) for frame in observations]
+            features = [s.as_vector() for s in states if not s.is_empty]
+        done = terminated | truncated
+        if done.any():
+            observations, _ = envs.reset(options={"reset_mask": done})
+    elapsed = time.perf_counter() - start
+    envs.close()
+    return n_steps * n_envs / elapsed, observation_bytes(observations)
+
+
+if __name__ == "__main__":
+    n_steps = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    for n_envs in sorted({2, os.cpu_count()}):
+        frames_rate, frame_bytes = step_rate(n_envs, False, n_steps)
+        features_rate, features_bytes = step_rate(n_envs, True, n_steps)
+        print(f"== {n_envs} envs ({os.cpu_count()} cpus): RGB frames {frames_rate:,.0f} env steps/s "
+              f"({frame_bytes:,} B per observation), featurized {features_rate:,.0f} env steps/s "
+              f"({features_bytes:,} B), {features_rate / frames_rate:.2f}x")
\ No newline at end of file
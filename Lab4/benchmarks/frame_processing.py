@@ -0,0 +1,201 @@
+﻿import atexit
+import os
+import shutil
+import tempfile
+
+# allocation counters of numba's runtime, must be enabled before numba is imported
+os.environ.setdefault("NUMBA_NRT_STATS", "1")
+# an empty cache directory, so the compile ms column times compiling the kernels and not loading them from the
+# cache=True files of an earlier run
+os.environ["NUMBA_CACHE_DIR"] = tempfile.mkdtemp(prefix="numba-cache-")
+atexit.register(shutil.rmtree, os.environ["NUMBA_CACHE_DIR"], ignore_errors=True)
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+from numba.core.runtime import rtsys
+
+from Lab4.benchmarks.make_corpus import CORPUS_FILE
+from Lab4.env_analizators import cut_empty_layers_in_frame, rgb_to_index, fill_holes, find_player_box, \
+    basic_observation
+from Lab4.state import State, CompactState, states_as_vectors
+
+REPEATS = 5
+REGRESSION_TOLERANCE = 1.5
+
+
+def load_corpus():
+    data = np.load(CORPUS_FILE)
+    return data["frames"], data["categories"], [str(name) for name in data["category_names"]]
+
+
+def prepare_inputs(frames):
+    """
+    The arguments every function of the pipeline gets for every corpus frame, computed with the
+    previous stages. Frames where a stage does not apply (empty crop, no player) are left out of it.
+    """
+    cropped = [cut_empty_layers_in_frame(frame) for frame in frames]
+    cropped = [frame for frame in cropped if frame.shape[0] > 0 and frame.shape[1] > 0]
+    decoded = [rgb_to_index(frame)[0] for frame in cropped]
+    filled = [state.copy() for state in decoded]
+    for state in filled:
+        fill_holes(state)
+    boxes = [(state, find_player_box(state)) for state in filled]
+    with_player = [(state, box) for state, box in boxes if box is not None]
+    states = [State(frame) for frame in frames]
+    return {
+        "cut_empty_layers_in_frame": (cut_empty_layers_in_frame, [(frame,) for frame in frames]),
+        "rgb_to_index": (rgb_to_index, [(frame,) for frame in cropped]),
+        # fill_holes works in place, every call gets its own copy (made before timing)
+        "fill_holes": (fill_holes, [(state,) for state in decoded]),
+        "find_player_box": (find_player_box, [(state,) for state in filled]),
+        "basic_observation": (basic_observation, with_player),
+        "State": (State, [(frame,) for frame in frames]),
+        "State.as_vector": (State.as_vector, [(state,) for state in states if not state.is_empty]),
+        "CompactState": (CompactState, [(frame,) for frame in frames]),
+    }
+
+
+def compile_times(frame):
+    """
+    First call of every function on one frame, in pipeline order so a function's time does not include
+    compiling the stages before it. Functions that only call compiled kernels show their first-call overhead.
+    """
+    times = {}
+
+    def first_call(name, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        times[name] = time.perf_counter() - start
+        return result
+
+    cropped = first_call("cut_empty_layers_in_frame", cut_empty_layers_in_frame, frame)
+    state, _ = first_call("rgb_to_index", rgb_to_index, cropped)
+    first_call("fill_holes", fill_holes, state)
+    box = first_call("find_player_box", find_player_box, state)
+    first_call("basic_observation", basic_observation, state, box)
+    featured_state = first_call("State", State, frame)
+    first_call("State.as_vector", State.as_vector, featured_state)
+    first_call("CompactState", CompactState, frame)
+    return times
+
+
+def steady_state(fn, calls, copy_first_arg=False):
+    """
+    :return: per call latencies (s), numba runtime allocations per call, Python bytes allocated per call
+    """
+    runs = [[(call[0].copy(),) + call[1:] for call in calls] if copy_first_arg else calls
+            for _ in range(REPEATS + 1)]
+    latencies = []
+    for run in runs[:REPEATS]:
+        for args in run:
+            start = time.perf_counter()
+            fn(*args)
+            latencies.append(time.perf_counter() - start)
+
+    # allocations in a separate pass, tracemalloc slows down every allocation
+    nrt_before = rtsys.get_allocation_stats().alloc
+    tracemalloc.start()
+    for args in runs[REPEATS]:
+        fn(*args)
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    nrt_allocs = rtsys.get_allocation_stats().alloc - nrt_before
+    return np.array(latencies), nrt_allocs / len(calls), python_peak / len(calls)
+
+
+def per_category(frames, categories, category_names):
+    """
+    State(frame) latency per corpus category.
+    """
+    results = {}
+    for category, name in enumerate(category_names):
+        selected = frames[categories == category]
+        if len(selected) == 0:
+            continue
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            for frame in selected:
+                State(frame)
+        results[name] = (time.perf_counter() - start) / (REPEATS * len(selected))
+    return results
+
+
+def compare(results, baseline_file, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compares the fastest repeat of every function, the mean moves too much between runs on a busy machine.
+    :return: names of the functions more than tolerance times slower than in baseline_file
+    """
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    regressions = []
+    print(f"\nCompared with {baseline_file}:")
+    for name, result in results["functions"].items():
+        if name not in baseline["functions"]:
+            continue
+        ratio = result["best_us"] / baseline["functions"][name]["best_us"]
+        flag = "  REGRESSION" if ratio > tolerance else ""
+        print(f"  {name:<26} {ratio:5.2f}x{flag}")
+        if ratio > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency, throughput and allocations of the frame processing "
+                                                 "functions on the recorded frame corpus.")
+    parser.add_argument("--save", help="write the results as JSON")
+    parser.add_argument("--compare", help="JSON from --save to compare with, exits with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="latency ratio counted as a regression")
+    args = parser.parse_args()
+
+    frames, categories, category_names = load_corpus()
+    # a frame with a player, so every stage runs
+    compiled = compile_times(frames[np.flatnonzero(categories == category_names.index("playing"))[0]])
+    inputs = prepare_inputs(frames)
+
+    results = {"corpus_frames": len(frames), "functions": {}, "state_per_category_us": {}}
+    print(f"{len(frames)} corpus frames, {REPEATS} repeats")
+    print(f"{'function':<26} {'compile ms':>10} {'mean us':>9} {'p50 us':>9} {'p95 us':>9} {'frames/s':>10} "
+          f"{'nrt allocs':>10} {'py B/call':>10}")
+    for name, (fn, calls) in inputs.items():
+        latencies, nrt_allocs, python_bytes = steady_state(fn, calls, copy_first_arg=name == "fill_holes")
+        result = {
+            "compile_ms": compiled[name] * 1e3,
+            "mean_us": latencies.mean() * 1e6,
+            "p50_us": np.percentile(latencies, 50) * 1e6,
+            "p95_us": np.percentile(latencies, 95) * 1e6,
+            # mean of the fastest repeat, the steadiest number on a shared machine
+            "best_us": latencies.reshape(REPEATS, -1).mean(axis=1).min() * 1e6,
+            "frames_per_second": 1.0 / latencies.mean(),
+            "nrt_allocs_per_call": nrt_allocs,
+            "python_bytes_per_call": python_bytes,
+        }
+        results["functions"][name] = result
+        print(f"{name:<26} {result['compile_ms']:>10.1f} {result['mean_us']:>9.1f} {result['p50_us']:>9.1f} "
+              f"{result['p95_us']:>9.1f} {result['frames_per_second']:>10,.0f} {nrt_allocs:>10.1f} "
+              f"{python_bytes:>10,.0f}")
+
+    start = time.perf_counter()
+    states_as_vectors(frames[:1])
+    batch_compile = time.perf_counter() - start
+    start = time.perf_counter()
+    states_as_vectors(frames)
+    batch_fps = len(frames) / (time.perf_counter() - start)
+    results["states_as_vectors"] = {"compile_ms": batch_compile * 1e3, "frames_per_second": batch_fps}
+    print(f"{'states_as_vectors batch':<26} {batch_compile * 1e3:>10.1f} {'':>9} {'':>9} {'':>9} {batch_fps:>10,.0f}")
+
+    print("\nState(frame) per corpus category:")
+    for name, seconds in per_category(frames, categories, category_names).items():
+        results["state_per_category_us"][name] = seconds * 1e6
+        print(f"  {name:<16} {seconds * 1e6:>8.1f} us")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.compare and compare(results, args.compare, args.tolerance):
+        raise SystemExit(1)
\ No newline at end of file
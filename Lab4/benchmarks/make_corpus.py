@@ -0,0 +1,112 @@
+﻿import os
+
+import ale_py
+import gymnasium as gym
+import numpy as np
+
+from Lab4.env_analizators import cut_empty_layers_in_frame
+from Lab4.state import State
+
+CORPUS_FILE = os.path.join(os.path.dirname(__file__), "data", "berzerk_frames.npz")
+
+EMPTY_ROOM = 0
+CROWDED_ROOM = 1
+DEATH = 2
+ROOM_TRANSITION = 3
+PLAYING = 4
+CATEGORY_NAMES = ["empty room", "crowded room", "death", "room transition", "playing"]
+
+FRAMES_PER_CATEGORY = 40
+N_STEPS = 20_000
+
+gym.register_envs(ale_py)
+
+
+def summarize(frame):
+    """
+    :return: what categorize needs of a frame: is empty, has a player, enemies, shape of the crop
+    """
+    state = State(frame)
+    if state.is_empty:
+        return True, False, 0, (0, 0)
+    return False, state.player_box is not None, state.enemies, cut_empty_layers_in_frame(frame).shape[:2]
+
+
+def categorize(summaries, dones):
+    """
+    EMPTY_ROOM: player and no enemies, CROWDED_ROOM: the most enemies seen, DEATH: the player is gone
+    (or the episode ends within a few frames), ROOM_TRANSITION: the crop changes or is empty (scrolling).
+    :param summaries: summarize of every frame
+    """
+    categories = np.full(len(summaries), PLAYING)
+    enemies = np.array([summary[2] for summary in summaries])
+    crowded_threshold = np.quantile(enemies, 0.95)
+    dying = np.zeros(len(summaries), dtype=bool)
+    for i in np.flatnonzero(dones):
+        dying[max(0, i - 8):i + 1] = True
+
+    for i, (is_empty, has_player, _, shape) in enumerate(summaries):
+        if is_empty or (i > 0 and shape != summaries[i - 1][3]):
+            categories[i] = ROOM_TRANSITION
+        elif not has_player or dying[i]:
+            categories[i] = DEATH
+        elif enemies[i] >= max(crowded_threshold, 1):
+            categories[i] = CROWDED_ROOM
+        elif enemies[i] == 0:
+            categories[i] = EMPTY_ROOM
+    return categories
+
+
+def play(seed):
+    """
+    N_STEPS random steps, the same frames for the same seed.
+    :return: generator of (frame, done)
+    """
+    env = gym.make("ALE/Berzerk-v5", frameskip=4)
+    rng = np.random.default_rng(seed)
+    env.reset(seed=seed)
+    for _ in range(N_STEPS):
+        obs, _, terminated, truncated, _ = env.step(rng.integers(env.action_space.n))
+        yield obs, terminated or truncated
+        if terminated or truncated:
+            env.reset()
+    env.close()
+
+
+def record(seed, keep):
+    """
+    Replays play(seed) keeping only the frames at the sorted indices keep, 20,000 frames would be 2 GB.
+    """
+    frames = np.empty((len(keep), 210, 160, 3), dtype=np.uint8)
+    n = 0
+    for i, (frame, _) in enumerate(play(seed)):
+        if n < len(keep) and keep[n] == i:
+            frames[n] = frame
+            n += 1
+    return frames
+
+
+if __name__ == "__main__":
+    summaries, dones = [], []
+    for frame, done in play(7):
+        summaries.append(summarize(frame))
+        dones.append(done)
+    categories = categorize(summaries, np.array(dones))
+
+    rng = np.random.default_rng(7)
+    picked = []
+    for category, name in enumerate(CATEGORY_NAMES):
+        candidates = np.flatnonzero(categories == category)
+        take = rng.choice(candidates, min(FRAMES_PER_CATEGORY, len(candidates)), replace=False)
+        picked.extend(sorted(take))
+        print(f"{name:<16} {len(candidates):>6} frames, {len(take)} kept")
+
+    # the frames in category order as before, recorded in step order
+    order = np.argsort(picked, kind="stable")
+    frames = np.empty((len(picked), 210, 160, 3), dtype=np.uint8)
+    frames[order] = record(7, np.array(picked)[order])
+
+    os.makedirs(os.path.dirname(CORPUS_FILE), exist_ok=True)
+    np.savez_compressed(CORPUS_FILE, frames=frames, categories=categories[picked],
+                        category_names=np.array(CATEGORY_NAMES))
+    print(f"Saved {len(picked)} frames to {CORPUS_FILE}")
\ No newline at end of file
@@ -0,0 +1,98 @@
+﻿import time
+
+import cv2
+import numba
+import numpy as np
+
+from Lab4.env_analizators import rgb_to_index
+from Lab4.env_info import *
+from Lab4.play.play import prepare_state_categorical_inner_onehot, CONST_COLOR_PLAYER, CONST_COLOR_WALL, \
+    CONST_COLOR_ENEMY, CAT_EMPTY, CAT_PLAYER, CAT_WALL, CAT_ENEMY
+
+N_FRAMES = 2000
+FRAME_H, FRAME_W = 210, 160
+
+
+@numba.njit
+def rgb_to_index_branches(frame):
+    """
+    The if/elif per-pixel decoder that rgb_to_index used before the palette lookup table.
+    """
+    state = np.zeros((frame.shape[0], frame.shape[1]), dtype=np.uint8)
+    enemy_pixel_count = 0
+    for i in range(frame.shape[0]):
+        for j in range(frame.shape[1]):
+            pixel = frame[i, j]
+            if pixel[0] == WALL_COLOR[0]:
+                state[i, j] = WALL_INDEX
+            elif pixel[0] == ENEMY_COLOR[0]:
+                state[i, j] = ENEMY_INDEX
+                enemy_pixel_count += 1
+            elif pixel[0] == PLAYER_COLOR[0]:
+                state[i, j] = PLAYER_INDEX
+            elif pixel[0] == PORTAL_COLOR[0]:
+                state[i, j] = PORTAL_INDEX
+            else:
+                state[i, j] = EMPTY_INDEX
+    return state, enemy_pixel_count
+
+
+@numba.njit
+def onehot_branches(obs_resized, h, w):
+    """
+    The full-RGB comparison chain that prepare_state_categorical used before the palette lookup table.
+    """
+    new_obs = np.full((h, w, 4), 0, dtype=np.uint8)
+    for i in range(h):
+        for j in range(w):
+            pixel = obs_resized[i, j]
+            if (pixel[0] == CONST_COLOR_PLAYER[0] and
+                    pixel[1] == CONST_COLOR_PLAYER[1] and
+                    pixel[2] == CONST_COLOR_PLAYER[2]):
+                new_obs[i, j, CAT_PLAYER] = 1
+            elif (pixel[0] == CONST_COLOR_WALL[0] and
+                  pixel[1] == CONST_COLOR_WALL[1] and
+                  pixel[2] == CONST_COLOR_WALL[2]):
+                new_obs[i, j, CAT_WALL] = 1
+            elif (pixel[0] == CONST_COLOR_ENEMY[0] and
+                  pixel[1] == CONST_COLOR_ENEMY[1] and
+                  pixel[2] == CONST_COLOR_ENEMY[2]):
+                new_obs[i, j, CAT_ENEMY] = 1
+            else:
+                new_obs[i, j, CAT_EMPTY] = 1
+    return new_obs
+
+
+def synthetic_frames(rng):
+    """
+    Mostly black frames with palette colors and a few look-alike colors (same red, other green/blue).
+    """
+    colors = np.array([EMPTY_COLOR, WALL_COLOR, ENEMY_COLOR, PLAYER_COLOR, PORTAL_COLOR,
+                       (84, 0, 0), (210, 0, 0), (232, 232, 74)], dtype=np.uint8)
+    weights = np.array([0.85, 0.06, 0.03, 0.02, 0.01, 0.01, 0.01, 0.01])
+    picks = rng.choice(len(colors), size=(N_FRAMES, FRAME_H, FRAME_W), p=weights)
+    return colors[picks]
+
+
+def measure(fn, frames):
+    fn(frames[0])  # compile / warm up
+    start = time.perf_counter()
+    results = [fn(frame) for frame in frames]
+    return results, len(frames) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    frames = synthetic_frames(np.random.default_rng(42))
+
+    old, old_fps = measure(rgb_to_index_branches, frames)
+    new, new_fps = measure(rgb_to_index, frames)
+    same = all(np.array_equal(a[0], b[0]) and a[1] == b[1] for a, b in zip(old, new))
+    print(f"rgb_to_index   if/elif: {old_fps:>10,.0f} frames/s   lut: {new_fps:>10,.0f} frames/s "
+          f"({new_fps / old_fps:.1f}x), identical: {same}")
+
+    resized = np.array([cv2.resize(frame, (21, 21), interpolation=cv2.INTER_NEAREST) for frame in frames])
+    old, old_fps = measure(lambda obs: onehot_branches(obs, 21, 21), resized)
+    new, new_fps = measure(lambda obs: prepare_state_categorical_inner_onehot(obs, 21, 21), resized)
+    same = all(np.array_equal(a, b) for a, b in zip(old, new))
+    print(f"one-hot 21x21  if/elif: {old_fps:>10,.0f} frames/s   lut: {new_fps:>10,.0f} frames/s "
+          f"({new_fps / old_fps:.1f}x), identical: {same}")
\ No newline at end of file
@@ -0,0 +1,55 @@
+﻿import time
+
+from Lab4.benchmarks.distance_fields import record_frames
+from Lab4.examinator import Examinator
+from Lab4.exploration_tracker import ExplorationTracker
+from Lab4.profiling import NullProfiler, StageProfiler
+from Lab4.sarsa import Sarsa
+from Lab4.state import CompactState
+from Lab4.trainer import PROFILE_STAGES
+
+REPEATS = 200_000
+
+
+def hook_cost(profiler):
+    """
+    :return: seconds of the start + lap calls of one Trainer.train step
+    """
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        t = profiler.start()
+        for stage in range(len(PROFILE_STAGES)):
+            t = profiler.lap(stage, t)
+    return (time.perf_counter() - start) / REPEATS
+
+
+def step_cost(frames):
+    """
+    :return: seconds per step of the work between the hooks except env.step, over recorded frames
+    """
+    model = Sarsa(18)
+    examinator = Examinator()
+    tracker = ExplorationTracker(160, 210)
+    previous = CompactState(frames[0])
+    start = time.perf_counter()
+    for frame in frames[1:]:
+        state = CompactState(frame)
+        if state.is_empty:
+            continue
+        features = state.as_vector()
+        action, q_values = model.epsilon_greedy(features)
+        visited, scanned = tracker.cover(state)
+        examinator.examine(state, action, model, 0.0, previous, scanned, visited)
+        model.td_update(features, action, 0.1)
+        previous = state
+    return (time.perf_counter() - start) / (len(frames) - 1)
+
+
+if __name__ == "__main__":
+    frames = record_frames(42)
+    step_cost(frames[:10])
+    step = min(step_cost(frames) for _ in range(3))
+    print(f"training step without env.step: {step * 1e6:.1f} us")
+    for label, profiler in [("off (NullProfiler)", NullProfiler()), ("on (StageProfiler)", StageProfiler(PROFILE_STAGES))]:
+        cost = min(hook_cost(profiler) for _ in range(3))
+        print(f"  profiling {label:<20} {cost * 1e6:6.2f} us per step, {cost / step:6.2%} of the step")
\ No newline at end of file
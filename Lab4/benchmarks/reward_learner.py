@@ -0,0 +1,78 @@
+﻿import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from Lab4.play.combineData import DATA_KEYS
+from Lab4.play.findCoeff import find_reward_weights, find_reward_weights_streaming, extract_features_batch, \
+    CAT_EMPTY, H, W
+
+N_TRANSITIONS = 100_000
+CHUNK_SIZE = 10_000
+
+
+def synthetic_expert_data(rng, n):
+    """
+    One-hot states with a player and a few enemies. The expert mostly moves and rarely walks into walls,
+    kills now and then and keeps away from enemies, so every feature carries some signal.
+    """
+    states = np.zeros((n, H, W, 4), dtype=np.uint8)
+    states[:, :, :, CAT_EMPTY] = 1
+    player = rng.integers(1, H - 1, (n, 2))
+    enemies = rng.integers(0, H, (n, 3, 2))
+    rows = np.arange(n)
+    for k in range(3):
+        states[rows, enemies[:, k, 0], enemies[:, k, 1]] = (0, 0, 0, 1)
+    states[rows, player[:, 0], player[:, 1]] = (0, 1, 0, 0)
+
+    actions = np.where(rng.random(n) < 0.8, rng.integers(2, 10, n), rng.choice([0, 1, 10, 11], n)).astype(np.int32)
+    next_states = states.copy()
+    moved = (actions >= 2) & (actions <= 9) & (rng.random(n) > 0.05)
+    step = rng.choice([-1, 1], (n, 2))
+    new_player = np.where(moved[:, None], player + step, player)
+    next_states[rows, player[:, 0], player[:, 1]] = (1, 0, 0, 0)
+    next_states[rows, new_player[:, 0], new_player[:, 1]] = (0, 1, 0, 0)
+    killed = rng.random(n) < 0.1
+    next_states[rows[killed], enemies[killed, 0, 0], enemies[killed, 0, 1]] = (1, 0, 0, 0)
+    died = rng.random(n) < 0.01
+    next_states[rows[died], new_player[died, 0], new_player[died, 1]] = (1, 0, 0, 0)
+    return {"states": states, "actions": actions, "rewards": np.zeros(n, dtype=np.float32),
+            "next_states": next_states, "dones": died}
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    weights = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return weights, elapsed, peak / 2 ** 20
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(42)
+    with tempfile.TemporaryDirectory() as data_dir:
+        data = synthetic_expert_data(rng, N_TRANSITIONS)
+        for key in DATA_KEYS:
+            np.save(os.path.join(data_dir, key + ".npy"), data[key])
+        del data
+
+        extract_features_batch(np.zeros((1, H, W, 4), np.uint8), np.zeros(1, np.int32),
+                               np.zeros((1, H, W, 4), np.uint8))  # compile
+        batch, batch_s, batch_mb = measure(lambda: find_reward_weights(data_dir))
+        stream, stream_s, stream_mb = measure(lambda: find_reward_weights_streaming(data_dir, chunk_size=CHUNK_SIZE))
+
+        # agreement of the expert / other decisions on a fresh sample
+        test = synthetic_expert_data(rng, 20_000)
+        X, y = extract_features_batch(test["states"], test["actions"], test["next_states"])
+        agreement = np.mean(np.sign(X @ batch) == np.sign(X @ stream))
+        cosine = batch @ stream / (np.linalg.norm(batch) * np.linalg.norm(stream))
+
+    print(f"\n{N_TRANSITIONS} transitions")
+    print(f"LinearSVC:     {batch_s:6.1f} s, peak {batch_mb:7.1f} MiB")
+    print(f"SGD streaming: {stream_s:6.1f} s, peak {stream_mb:7.1f} MiB (chunks of {CHUNK_SIZE})")
+    print(f"cosine similarity of the weights: {cosine:.4f}, same decision on {agreement:.1%} of rows, "
+          f"norm ratio {np.linalg.norm(stream) / np.linalg.norm(batch):.1f}")
\ No newline at end of file
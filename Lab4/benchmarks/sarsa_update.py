@@ -0,0 +1,58 @@
+﻿import time
+
+import numpy as np
+
+from Lab4.sarsa import Sarsa
+from Lab4.state import VECTOR_STATE_SIZE
+
+N_STEPS = 200_000
+N_ACTIONS = 18
+
+
+def numpy_update(model, features, action, delta):
+    """
+    The TD(lambda) step as it is written in the training loop before Sarsa.td_update.
+    """
+    phi_w, phi_b = model.phi_from_state_action(features, action)
+
+    model.z_w = (model.gamma * model.lmbda * model.z_w) + phi_w
+    model.z_b = (model.gamma * model.lmbda * model.z_b) + phi_b
+
+    model.w += model.alpha * delta * model.z_w
+    model.b += model.alpha * delta * model.z_b
+
+    model.w *= (1.0 - model.weight_decay)
+    model.b *= (1.0 - model.weight_decay)
+
+    model.z_w = np.clip(model.z_w, -model.z_clip, model.z_clip)
+    model.z_b = np.clip(model.z_b, -model.z_clip, model.z_clip)
+
+
+def fused_update(model, features, action, delta):
+    model.td_update(features, action, delta)
+
+
+def run(update, features, actions, deltas):
+    model = Sarsa(N_ACTIONS)
+    update(model, features[0], actions[0], deltas[0])  # compile / warm up
+
+    start = time.perf_counter()
+    for i in range(len(actions)):
+        update(model, features[i], actions[i], deltas[i])
+    elapsed = time.perf_counter() - start
+    return model, len(actions) / elapsed
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(42)
+    features = rng.random((N_STEPS, VECTOR_STATE_SIZE), dtype=np.float32)
+    actions = rng.integers(0, N_ACTIONS, N_STEPS)
+    deltas = rng.normal(size=N_STEPS).astype(np.float32)
+
+    numpy_model, numpy_sps = run(numpy_update, features, actions, deltas)
+    fused_model, fused_sps = run(fused_update, features, actions, deltas)
+
+    same = np.array_equal(numpy_model.w, fused_model.w) and np.array_equal(numpy_model.b, fused_model.b)
+    print(f"numpy loop:   {numpy_sps:>12,.0f} steps/s")
+    print(f"td_update:    {fused_sps:>12,.0f} steps/s ({fused_sps / numpy_sps:.1f}x)")
+    print(f"identical weights: {same}")
\ No newline at end of file
@@ -0,0 +1,67 @@
+﻿import time
+
+import numpy as np
+
+from Lab4.play.play import categorical_active_features
+from Lab4.sarsa import Sarsa, SparseSarsa
+
+N_STEPS = 20_000
+N_ACTIONS = 18
+GRID_SIZES = [21, 42, 84]
+
+
+def onehot_grids(rng, size, n):
+    """
+    Mostly empty one-hot grids with about as many walls, enemies and player cells as a 21x21 Berzerk state,
+    whatever the grid size, so only the number of features grows.
+    """
+    grids = np.zeros((n, size, size, 4), dtype=np.uint8)
+    grids[:, :, :, 0] = 1
+    for grid in grids:
+        cells = rng.choice(size * size, 40, replace=False)
+        grid.reshape(-1, 4)[cells] = np.eye(4, dtype=np.uint8)[rng.integers(1, 4, len(cells))]
+    return grids
+
+
+def dense_sarsa(n_features):
+    model = Sarsa(N_ACTIONS)
+    model.state_dim = n_features
+    model.w = np.zeros((N_ACTIONS, n_features), dtype=np.float32)
+    model.z_w = np.zeros_like(model.w)
+    return model
+
+
+def run(model, features, actions, deltas):
+    """
+    What a training step costs the model: Q of the next state for the action choice, then the TD step.
+    """
+    model.epsilon_greedy(features[0])
+    model.td_update(features[0], actions[0], deltas[0])  # compile / warm up
+    start = time.perf_counter()
+    for i in range(len(actions)):
+        model.epsilon_greedy(features[i])
+        model.td_update(features[i], actions[i], deltas[i])
+    return (time.perf_counter() - start) / len(actions) * 1e6
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(42)
+    actions = rng.integers(0, N_ACTIONS, N_STEPS)
+    deltas = rng.normal(size=N_STEPS).astype(np.float32)
+
+    print(f"{'grid':>8}{'features':>10}{'active':>8}{'dense us/step':>15}{'sparse us/step':>16}{'max |w| diff':>14}")
+    for size in GRID_SIZES:
+        grids = onehot_grids(rng, size, N_STEPS)
+        active = [categorical_active_features(grid) for grid in grids]
+        n_features = grids[0].size
+        dense_features = np.zeros((N_STEPS, n_features), dtype=np.float32)
+        for row, indices in zip(dense_features, active):
+            row[indices] = 1.0
+
+        dense, sparse = dense_sarsa(n_features), SparseSarsa(N_ACTIONS, n_features)
+        dense.epsilon = sparse.epsilon = 0.1
+        dense_us = run(dense, dense_features, actions, deltas)
+        sparse_us = run(sparse, active, actions, deltas)
+        diff = np.abs(dense.w - sparse.w).max()
+        print(f"{size:>5}^2 {n_features:>9,}{np.mean([len(a) for a in active]):>8.0f}{dense_us:>15.1f}"
+              f"{sparse_us:>16.1f}{diff:>14.1e}")
\ No newline at end of file
@@ -0,0 +1,45 @@
+﻿import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# runs in a fresh interpreter, what a training script pays before its first step
+PROBE = """
+import json, time
+start = time.perf_counter()
+import numpy as np
+from Lab4.benchmarks.make_corpus import CORPUS_FILE
+from Lab4.state import State
+from Lab4.sarsa import Sarsa
+imported = time.perf_counter()
+frame = np.load(CORPUS_FILE)["frames"][0]
+features = State(frame).as_vector()
+first_state = time.perf_counter()
+Sarsa(18).td_update(features, 0, 0.0)
+first_update = time.perf_counter()
+print(json.dumps({"import": imported - start, "first State": first_state - imported,
+                  "first td_update": first_update - first_state, "total": first_update - start}))
+"""
+
+
+def probe(cache_dir):
+    env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_DIR, env.get("PYTHONPATH")]))
+    out = subprocess.run([sys.executable, "-c", PROBE], env=env, cwd=REPO_DIR, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    # a fresh cache directory, so the first run compiles everything and the second loads it
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cold = probe(cache_dir)
+        warm = probe(cache_dir)
+
+    print(f"{'':<16}{'cold cache':>12}{'warm cache':>12}")
+    for stage in cold:
+        print(f"{stage:<16}{cold[stage]:>11.2f}s{warm[stage]:>11.2f}s")
+    print(f"startup {cold['total'] / warm['total']:.1f}x faster with the cache")
\ No newline at end of file
@@ -0,0 +1,88 @@
+﻿import time
+import tracemalloc
+
+import numpy as np
+
+from Lab4.benchmarks.make_corpus import CORPUS_FILE
+from Lab4.sarsa import Sarsa, TileCodedSarsa
+from Lab4.state import CompactState
+from Lab4.tile_coding import TileCoder
+
+FEATURE_COUNTS = [1_000, 10_000, 100_000]
+N_STEPS = 20_000
+N_DENSE_STEPS = 500
+N_ACTIONS = 18
+
+
+def corpus_vectors():
+    states = [CompactState(frame) for frame in np.load(CORPUS_FILE)["frames"]]
+    return np.array([state.as_vector() for state in states if not state.is_empty])
+
+
+def dense_sarsa(n_features):
+    """
+    Sarsa over the same binary features as a dense 0/1 vector, what the tile coding costs without sparsity.
+    """
+    model = Sarsa(N_ACTIONS)
+    model.state_dim = n_features
+    model.w = np.zeros((N_ACTIONS, n_features), dtype=np.float32)
+    model.z_w = np.zeros_like(model.w)
+    return model
+
+
+def run_tiles(model, vectors, actions, deltas, n_steps):
+    """
+    A training step: action choice on the next state, then the TD step on the state.
+    :return: us per step
+    """
+    model.epsilon_greedy(vectors[0])
+    model.td_update(vectors[0], actions[0], deltas[0])  # compile / warm up
+    start = time.perf_counter()
+    for i in range(1, n_steps):
+        model.epsilon_greedy(vectors[i % len(vectors)])
+        model.td_update(vectors[(i - 1) % len(vectors)], actions[i], deltas[i])
+    return (time.perf_counter() - start) / (n_steps - 1) * 1e6
+
+
+def run_dense(model, coder, vectors, actions, deltas, n_steps):
+    dense = np.zeros((len(vectors), coder.n_features), dtype=np.float32)
+    for row, indices in zip(dense, coder.encode_batch(vectors)):
+        np.add.at(row, indices, 1.0)
+    return run_tiles(model, dense, actions, deltas, n_steps)
+
+
+def td_update_allocations(model, vectors, actions, deltas):
+    """
+    :return: bytes allocated by 1000 td_update calls (after warm up)
+    """
+    model.td_update(vectors[0], actions[0], deltas[0])
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    for i in range(1000):
+        model.td_update(vectors[i % len(vectors)], actions[i], deltas[i])
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return peak
+
+
+if __name__ == "__main__":
+    vectors = corpus_vectors()
+    rng = np.random.default_rng(42)
+    actions = rng.integers(0, N_ACTIONS, N_STEPS)
+    deltas = rng.normal(size=N_STEPS)
+
+    n_active = TileCoder().n_active
+    print(f"{len(vectors)} corpus states, {n_active} active tiles per state")
+    for n_features in FEATURE_COUNTS:
+        print(f"  {n_features:>7,} features: {TileCoder(n_features).moved_tiles(vectors):.3f} colliding tiles per "
+              f"state, {n_active * (n_active - 1) / (2 * n_features):.3f} expected")
+    print(f"{'features':>10}{'tile Sarsa us/step':>20}{'dense us/step':>15}{'td_update peak alloc':>22}")
+    for n_features in FEATURE_COUNTS:
+        coder = TileCoder(n_features)
+        model = TileCodedSarsa(N_ACTIONS, coder)
+        model.epsilon = 0.1
+        sparse_us = run_tiles(model, vectors, actions, deltas, N_STEPS)
+        dense_us = run_dense(dense_sarsa(n_features), coder, vectors, actions, deltas, N_DENSE_STEPS)
+        allocated = td_update_allocations(TileCodedSarsa(N_ACTIONS, coder), vectors, actions, deltas)
+        print(f"{n_features:>10,}{sparse_us:>20.1f}{dense_us:>15.1f}{allocated:>20,} B")
\ No newline at end of file
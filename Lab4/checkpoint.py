@@ -0,0 +1,86 @@
+﻿import os
+import queue
+import threading
+
+import numpy as np
+
+
+def random_state_arrays():
+    """
+    :return: the state of numpy's global generator (epsilon-greedy draws from it) as arrays for np.savez
+    """
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return {"rng_keys": keys, "rng_pos": pos, "rng_has_gauss": has_gauss, "rng_cached_gaussian": cached_gaussian}
+
+
+def restore_random_state(data):
+    np.random.set_state(("MT19937", data["rng_keys"], int(data["rng_pos"]), int(data["rng_has_gauss"]),
+                         float(data["rng_cached_gaussian"])))
+
+
+def save_atomic(file_name, arrays):
+    """
+    np.savez into a temporary file next to file_name, then renames it over file_name, so a crash while
+    writing leaves the previous checkpoint intact.
+    """
+    tmp_name = f"{file_name}.tmp"
+    with open(tmp_name, "wb") as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_name, file_name)
+
+
+class CheckpointWriter:
+    """
+    Writes checkpoints with save_atomic in a background thread. submit only queues the arrays, which must be
+    copies the training loop no longer changes. If the previous checkpoint is still being written, a newer
+    one waiting in the queue replaces the older, so a slow disk never blocks the training loop.
+    Errors of the writer are raised by the next submit or by close.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.written = 0
+        self._queue = queue.Queue(maxsize=1)
+        self._error = None
+        self._thread = threading.Thread(target=self._write_loop, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def _write_loop(self):
+        while True:
+            arrays = self._queue.get()
+            if arrays is None:
+                return
+            try:
+                save_atomic(self.file_name, arrays)
+                self.written += 1
+            except Exception as error:
+                self._error = error
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def submit(self, arrays):
+        self._raise_error()
+        try:
+            self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        self._queue.put(arrays)
+
+    def close(self):
+        """
+        Waits for the queued checkpoint to be written.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
\ No newline at end of file
@@ -2,27 +2,67 @@
 import numpy as np
 from Lab4.env_info import *
 
-@numba.njit
-def rgb_to_index(frame):
-    state = np.zeros((frame.shape[0], frame.shape[1]), dtype=np.uint8)
-    enemy_pixel_count = 0
+def make_palette_lut(palette):
+    """
+    Builds a 256-entry lookup table keyed by the red channel. Every color that is not in the palette maps to 0.
+    :param palette: sequence of (rgb color, index) pairs, red values must be distinct
+    :return: (256,) index for each red value, (256, 3) full palette color for each red value
+    """
+    lut = np.zeros(256, dtype=np.uint8)
+    lut_rgb = np.zeros((256, 3), dtype=np.uint8)
+    for color, index in palette:
+        red = int(color[0])
+        if lut[red] != 0:
+            raise ValueError(f"Palette colors must have distinct red values, {red} is used twice")
+        lut[red] = index
+        lut_rgb[red] = color
+    return lut, lut_rgb
+
+STATE_PALETTE_LUT, _ = make_palette_lut([
+    (WALL_COLOR, WALL_INDEX),
+    (ENEMY_COLOR, ENEMY_INDEX),
+    (PLAYER_COLOR, PLAYER_INDEX),
+    (PORTAL_COLOR, PORTAL_INDEX),
+])
+
+@numba.njit(cache=True)
+def decode_palette(frame, lut, count_index):
+    """
+    Maps every pixel to lut[red] in one gather pass.
+    :return: index map, number of pixels decoded as count_index
+    """
+    state = np.empty((frame.shape[0], frame.shape[1]), dtype=np.uint8)
+    counted_pixels = 0
     for i in range(frame.shape[0]):
         for j in range(frame.shape[1]):
-            pixel = frame[i, j]
-            if pixel[0] == WALL_COLOR[0]:
-                state[i, j] = WALL_INDEX
-            elif pixel[0] == ENEMY_COLOR[0]:
-                state[i, j] = ENEMY_INDEX
-                enemy_pixel_count += 1
-            elif pixel[0] == PLAYER_COLOR[0]:
-                state[i, j] = PLAYER_INDEX
-            elif pixel[0] == PORTAL_COLOR[0]:
-                state[i, j] = PORTAL_INDEX
-            else:
-                state[i, j] = EMPTY_INDEX
-    return state, enemy_pixel_count
+            index = lut[frame[i, j, 0]]
+            state[i, j] = index
+            counted_pixels += index == count_index
+    return state, counted_pixels
+
+@numba.njit(cache=True)
+def decode_palette_exact(frame, lut, lut_rgb, count_index):
+    """
+    decode_palette that also requires green and blue to match the palette color, otherwise the pixel maps to 0.
+    :return: index map, number of pixels decoded as count_index
+    """
+    state = np.empty((frame.shape[0], frame.shape[1]), dtype=np.uint8)
+    counted_pixels = 0
+    for i in range(frame.shape[0]):
+        for j in range(frame.shape[1]):
+            red = frame[i, j, 0]
+            index = lut[red]
+            if frame[i, j, 1] != lut_rgb[red, 1] or frame[i, j, 2] != lut_rgb[red, 2]:
+                index = 0
+            state[i, j] = index
+            counted_pixels += index == count_index
+    return state, counted_pixels
+
+@numba.njit(cache=True)
+def rgb_to_index(frame):
+    return decode_palette(frame, STATE_PALETTE_LUT, ENEMY_INDEX)
 
-@numba.njit
+@numba.njit(cache=True)
 def _int_linspace(start, stop, count):
     arr = np.empty(count, dtype=np.int32)
     if count == 1:
@@ -33,7 +73,7 @@ def _int_linspace(start, stop, count):
         arr[k] = int(start + k * step)
     return arr
 
-@numba.njit
+@numba.njit(cache=True)
 def find_player_box(state):
     player_positions = np.argwhere(state == PLAYER_INDEX)
 
@@ -45,7 +85,24 @@ def find_player_box(state):
     box = (np.min(i_pos), np.min(j_pos), np.max(i_pos), np.max(j_pos))
     return box
 
-@numba.njit
+@numba.njit(cache=True)
+def find_player_box_in(state, i_min, j_min, i_max, j_max):
+    """
+    find_player_box restricted to the inclusive region, without the argwhere allocation and the Optional return.
+    :return: has_player, (i_min, j_min, i_max, j_max)
+    """
+    box_i_min, box_j_min = state.shape[0], state.shape[1]
+    box_i_max, box_j_max = -1, -1
+    for i in range(max(0, i_min), min(state.shape[0] - 1, i_max) + 1):
+        for j in range(max(0, j_min), min(state.shape[1] - 1, j_max) + 1):
+            if state[i, j] == PLAYER_INDEX:
+                box_i_min = min(box_i_min, i)
+                box_j_min = min(box_j_min, j)
+                box_i_max = max(box_i_max, i)
+                box_j_max = max(box_j_max, j)
+    return box_i_max >= 0, (box_i_min, box_j_min, box_i_max, box_j_max)
+
+@numba.njit(cache=True)
 def get_scanning_points(box):
     """
     :return: left_search_points, right_search_points, up_search_points, down_search_points
@@ -60,11 +117,12 @@ def get_scanning_points(box):
 
     return left_search_points, right_search_points, up_search_points, down_search_points
 
-@numba.njit
-def basic_observation(state, box):
-    if box is None:
-        return None, None, None, None, None, None
-
+@numba.njit(cache=True)
+def scan_observation(state, box):
+    """
+    basic_observation without Optional results, so it can be used from other kernels.
+    :return: l_wall, r_wall, u_wall, d_wall, has_enemy, closest_enemy, has_portal, closest_portal
+    """
     left_search_points, right_search_points, up_search_points, down_search_points = get_scanning_points(box)
 
     l_wall = (left_search_points[0][0], 0)
@@ -74,8 +132,9 @@ def basic_observation(state, box):
 
     reach_l, reach_r, reach_u, reach_d = False, False, False, False
 
-    closest_enemy = None
-    closest_portal = None
+    has_enemy, has_portal = False, False
+    closest_enemy = (0, 0)
+    closest_portal = (0, 0)
 
     i = 0
     while True:
@@ -91,10 +150,12 @@ def basic_observation(state, box):
                     l_wall = cord
                 if material == PORTAL_INDEX:
                     reach_l = True
-                    if closest_portal is None:
+                    if not has_portal:
+                        has_portal = True
                         closest_portal = cord
                 elif material == ENEMY_INDEX:
-                    if closest_enemy is None:
+                    if not has_enemy:
+                        has_enemy = True
                         closest_enemy = cord
 
                 if reach_l:
@@ -109,10 +170,12 @@ def basic_observation(state, box):
                     r_wall = cord
                 elif material == PORTAL_INDEX:
                     reach_r = True
-                    if closest_portal is None:
+                    if not has_portal:
+                        has_portal = True
                         closest_portal = cord
                 elif material == ENEMY_INDEX:
-                    if closest_enemy is None:
+                    if not has_enemy:
+                        has_enemy = True
                         closest_enemy = cord
 
                 if reach_r:
@@ -127,10 +190,12 @@ def basic_observation(state, box):
                     u_wall = cord
                 elif material == PORTAL_INDEX:
                     reach_u = True
-                    if closest_portal is None:
+                    if not has_portal:
+                        has_portal = True
                         closest_portal = cord
                 elif material == ENEMY_INDEX:
-                    if closest_enemy is None:
+                    if not has_enemy:
+                        has_enemy = True
                         closest_enemy = cord
 
                 if reach_u:
@@ -145,10 +210,12 @@ def basic_observation(state, box):
                     d_wall = cord
                 if material == PORTAL_INDEX:
                     reach_d = True
-                    if closest_portal is None:
+                    if not has_portal:
+                        has_portal = True
                         closest_portal = cord
                 elif material == ENEMY_INDEX:
-                    if closest_enemy is None:
+                    if not has_enemy:
+                        has_enemy = True
                         closest_enemy = cord
 
                 if reach_d:
@@ -158,48 +225,253 @@ def basic_observation(state, box):
             break
         i += 1
 
-    return l_wall, r_wall, u_wall, d_wall, closest_enemy, closest_portal
+    return l_wall, r_wall, u_wall, d_wall, has_enemy, closest_enemy, has_portal, closest_portal
+
+@numba.njit(cache=True)
+def basic_observation(state, box):
+    if box is None:
+        return None, None, None, None, None, None
 
-@numba.njit
+    l_wall, r_wall, u_wall, d_wall, has_enemy, closest_enemy, has_portal, closest_portal = scan_observation(state, box)
+    return (l_wall, r_wall, u_wall, d_wall,
+            closest_enemy if has_enemy else None,
+            closest_portal if has_portal else None)
+
+FIELD_LEFT = 0
+FIELD_RIGHT = 1
+FIELD_UP = 2
+FIELD_DOWN = 3
+
+@numba.njit(cache=True)
+def _sweep_row(fields, state, template, i):
+    width = state.shape[1]
+    left = 0
+    for j in range(width):
+        if (state[i, j] == WALL_INDEX or state[i, j] == PORTAL_INDEX or
+                template[i, j] == WALL_INDEX or template[i, j] == PORTAL_INDEX):
+            left = 0
+        fields[FIELD_LEFT, i, j] = left
+        left += 1
+    right = 0
+    for j in range(width - 1, -1, -1):
+        if (state[i, j] == WALL_INDEX or state[i, j] == PORTAL_INDEX or
+                template[i, j] == WALL_INDEX or template[i, j] == PORTAL_INDEX):
+            right = 0
+        fields[FIELD_RIGHT, i, j] = right
+        right += 1
+
+@numba.njit(cache=True)
+def _sweep_column(fields, state, template, j):
+    height = state.shape[0]
+    up = 0
+    for i in range(height):
+        if (state[i, j] == WALL_INDEX or state[i, j] == PORTAL_INDEX or
+                template[i, j] == WALL_INDEX or template[i, j] == PORTAL_INDEX):
+            up = 0
+        fields[FIELD_UP, i, j] = up
+        up += 1
+    down = 0
+    for i in range(height - 1, -1, -1):
+        if (state[i, j] == WALL_INDEX or state[i, j] == PORTAL_INDEX or
+                template[i, j] == WALL_INDEX or template[i, j] == PORTAL_INDEX):
+            down = 0
+        fields[FIELD_DOWN, i, j] = down
+        down += 1
+
+@numba.njit(cache=True)
+def distance_fields(state, template):
+    """
+    For every pixel, the number of steps to the nearest wall or portal (or the map edge) to the left, right,
+    up and down, built with one linear sweep per direction. A pixel stops the ray if it is a wall or a portal
+    in state or in the fill template, so the fields stay valid while sprites move over filled holes.
+    :return: (4, h, w) int16 array indexed by FIELD_LEFT, FIELD_RIGHT, FIELD_UP, FIELD_DOWN
+    """
+    fields = np.empty((4, state.shape[0], state.shape[1]), dtype=np.int16)
+    for i in range(state.shape[0]):
+        _sweep_row(fields, state, template, i)
+    for j in range(state.shape[1]):
+        _sweep_column(fields, state, template, j)
+    return fields
+
+@numba.njit(cache=True)
+def update_distance_fields(fields, state, template, old_state, old_template):
+    """
+    Brings distance_fields(old_state, old_template) up to date with (state, template) in place, sweeping
+    again only the rows and columns where a wall or portal appeared or disappeared.
+    :return: number of pixels whose obstacle changed
+    """
+    height, width = state.shape
+    dirty_rows = np.zeros(height, dtype=np.bool_)
+    dirty_columns = np.zeros(width, dtype=np.bool_)
+    changed = 0
+    for i in range(height):
+        for j in range(width):
+            stop = (state[i, j] == WALL_INDEX or state[i, j] == PORTAL_INDEX or
+                    template[i, j] == WALL_INDEX or template[i, j] == PORTAL_INDEX)
+            old_stop = (old_state[i, j] == WALL_INDEX or old_state[i, j] == PORTAL_INDEX or
+                        old_template[i, j] == WALL_INDEX or old_template[i, j] == PORTAL_INDEX)
+            if stop != old_stop:
+                dirty_rows[i] = True
+                dirty_columns[j] = True
+                changed += 1
+    for i in range(height):
+        if dirty_rows[i]:
+            _sweep_row(fields, state, template, i)
+    for j in range(width):
+        if dirty_columns[j]:
+            _sweep_column(fields, state, template, j)
+    return changed
+
+@numba.njit(cache=True)
+def _ray_reach(state, fields, direction, i, j, di, dj):
+    """
+    Steps until the ray from (i, j) reaches a wall, a portal or the edge of state, jumping with the distance
+    field. Stops of the field that are not obstacles in state (a filled hole covered by a sprite) are skipped.
+    """
+    height, width = state.shape
+    k = 0
+    while True:
+        k += fields[direction, i + k * di, j + k * dj]
+        ii, jj = i + k * di, j + k * dj
+        material = state[ii, jj]
+        if material == WALL_INDEX or material == PORTAL_INDEX:
+            return k
+        if (di == -1 and ii == 0) or (di == 1 and ii == height - 1) or (dj == -1 and jj == 0) or (dj == 1 and jj == width - 1):
+            return k
+        k += 1
+
+@numba.njit(cache=True)
+def _first_enemy_step(state, rows, cols, di, dj, reach, reach_point, include_reach_point):
+    """
+    First step at which a ray of the direction meets an enemy, checking the rays in order at every step like
+    basic_observation does. At the reach step only the rays before reach_point (and reach_point itself if
+    include_reach_point) are checked.
+    :return: step (-1 if none), enemy cord
+    """
+    for k in range(reach + 1):
+        for p in range(len(rows)):
+            if k == reach and (p > reach_point or (p == reach_point and not include_reach_point)):
+                break
+            ii, jj = rows[p] + k * di, cols[p] + k * dj
+            if state[ii, jj] == ENEMY_INDEX:
+                return k, (ii, jj)
+    return -1, (0, 0)
+
+@numba.njit(cache=True)
+def field_observation(state, box, fields, find_enemies):
+    """
+    scan_observation using precomputed distance_fields for the walls and portals, results are identical.
+    Enemies are searched only along the scanned rays and only if find_enemies.
+    :return: l_wall, r_wall, u_wall, d_wall, has_enemy, closest_enemy, has_portal, closest_portal
+    """
+    height, width = state.shape
+    rows = _int_linspace(box[0], box[2], 4).astype(np.int64)
+    cols = _int_linspace(box[1], box[3], 2).astype(np.int64)
+
+    # per direction: ray start rows / cols, step, field, whether a portal on the edge still counts as portal
+    directions = (
+        (rows, np.full(4, box[1], dtype=np.int64), 0, -1, FIELD_LEFT, True),
+        (rows, np.full(4, box[3], dtype=np.int64), 0, 1, FIELD_RIGHT, False),
+        (np.full(2, box[0], dtype=np.int64), cols, -1, 0, FIELD_UP, False),
+        (np.full(2, box[2], dtype=np.int64), cols, 1, 0, FIELD_DOWN, True),
+    )
+    walls = [(rows[0], np.int64(0)), (rows[0], np.int64(width - 1)), (np.int64(0), cols[0]), (np.int64(height - 1), cols[0])]
+
+    has_portal, has_enemy = False, False
+    portal_step, enemy_step = 0, 0
+    closest_portal = (np.int64(0), np.int64(0))
+    closest_enemy = (np.int64(0), np.int64(0))
+
+    for d in range(4):
+        ray_rows, ray_cols, di, dj, field, if_branches = directions[d]
+
+        reach, reach_point = -1, 0
+        for p in range(len(ray_rows)):
+            k = _ray_reach(state, fields, field, ray_rows[p], ray_cols[p], di, dj)
+            if reach == -1 or k < reach:
+                reach, reach_point = k, p
+
+        cord = (ray_rows[reach_point] + reach * di, ray_cols[reach_point] + reach * dj)
+        material = state[cord]
+        on_edge = (di == -1 and cord[0] == 0) or (di == 1 and cord[0] == height - 1) or \
+                  (dj == -1 and cord[1] == 0) or (dj == 1 and cord[1] == width - 1)
+        if material == WALL_INDEX or on_edge:
+            walls[d] = cord
+        if material == PORTAL_INDEX and (if_branches or not (material == WALL_INDEX or on_edge)):
+            if not has_portal or reach < portal_step:
+                has_portal, portal_step, closest_portal = True, reach, cord
+
+        if find_enemies:
+            step, enemy = _first_enemy_step(state, ray_rows, ray_cols, di, dj, reach, reach_point, if_branches)
+            if step != -1 and (not has_enemy or step < enemy_step):
+                has_enemy, enemy_step, closest_enemy = True, step, enemy
+
+    return walls[0], walls[1], walls[2], walls[3], has_enemy, closest_enemy, has_portal, closest_portal
+
+@numba.njit(cache=True)
 def cut_empty_layers_in_frame(frame):
     skip_layers = 0
     while True:
-        if np.array_equal(frame[skip_layers][skip_layers], EMPTY_COLOR):
+        if skip_layers < min(frame.shape[0], frame.shape[1]) and np.array_equal(frame[skip_layers][skip_layers], EMPTY_COLOR):
             skip_layers += 1
         else:
             break
     frame = frame[skip_layers:-skip_layers, skip_layers:-skip_layers]
+    if frame.shape[0] == 0 or frame.shape[1] == 0:
+        return frame
 
     skip_layers_from_bottom = 0
     while True:
-        if np.array_equal(frame[-(skip_layers_from_bottom + 1)][-(skip_layers_from_bottom + 1)], EMPTY_COLOR):
+        if skip_layers_from_bottom < min(frame.shape[0], frame.shape[1]) and np.array_equal(frame[-(skip_layers_from_bottom + 1)][-(skip_layers_from_bottom + 1)], EMPTY_COLOR):
             skip_layers_from_bottom += 1
         else:
             break
     frame = frame[:-skip_layers_from_bottom, :]
     return frame
 
-@numba.njit
-def fill_part(matrix, a, b, c, d, fill_value):
+@numba.njit(cache=True)
+def part_bounds(matrix, a, b, c, d):
+    """
+    :return: min_i, max_i, min_j, max_j of the rectangle spanned by a, b, c, d, clipped to the matrix
+    """
     rows, cols = matrix.shape
     min_i = max(0, min(a[0], b[0], c[0], d[0]))
     max_i = min(rows - 1, max(a[0], b[0], c[0], d[0]))
     min_j = max(0, min(a[1], b[1], c[1], d[1]))
     max_j = min(cols - 1, max(a[1], b[1], c[1], d[1]))
+    return min_i, max_i, min_j, max_j
 
+@numba.njit(cache=True)
+def fill_rect(matrix, min_i, max_i, min_j, max_j, fill_value):
     for ii in range(min_i, max_i + 1):
         for jj in range(min_j, max_j + 1):
             if matrix[ii, jj] == EMPTY_INDEX:
                 matrix[ii, jj] = fill_value
 
-@numba.njit
+@numba.njit(cache=True)
+def fill_part(matrix, a, b, c, d, fill_value):
+    min_i, max_i, min_j, max_j = part_bounds(matrix, a, b, c, d)
+    fill_rect(matrix, min_i, max_i, min_j, max_j, fill_value)
+
+@numba.njit(cache=True)
 def fill_holes(state):
+    fill_holes_recorded(state, np.empty((0, 5), dtype=np.int32))
+
+@numba.njit(cache=True)
+def fill_holes_recorded(state, plan):
+    """
+    fill_holes that also writes every filled rectangle as (min_i, max_i, min_j, max_j, material) into plan,
+    in fill order, as long as plan has rows left. The rectangles only depend on the border pixels, so
+    apply_fill_plan replays them on any frame with the same border.
+    :return: number of filled rectangles
+    """
     PORTAL_MIN_LENGHT = 3
     PORTAL_WIDTH = 0
     WALL_WIDTH = 3
 
+    n_rects = 0
     if state[0][0] != WALL_INDEX:
-        return
+        return n_rects
 
     P = 2 * (state.shape[0] + state.shape[1])
 
@@ -244,7 +516,15 @@ def fill_holes(state):
                 else:
                     raise ValueError("Unexpected wall pixel not on border")
 
-                fill_part(state, A, B, C, D, material_to_fill)
+                min_i, max_i, min_j, max_j = part_bounds(state, A, B, C, D)
+                fill_rect(state, min_i, max_i, min_j, max_j, material_to_fill)
+                if n_rects < plan.shape[0]:
+                    plan[n_rects, 0] = min_i
+                    plan[n_rects, 1] = max_i
+                    plan[n_rects, 2] = min_j
+                    plan[n_rects, 3] = max_j
+                    plan[n_rects, 4] = material_to_fill
+                n_rects += 1
 
             last_wall_pixel = (i, j)
 
@@ -258,4 +538,111 @@ def fill_holes(state):
             j -= 1
 
         if i == 0 and j == 0:
-            break
\ No newline at end of file
+            break
+
+    return n_rects
+
+@numba.njit(cache=True)
+def border_hash(state):
+    """
+    64-bit FNV-1a hash of the border pixels and the shape, the part of the room fill_holes depends on.
+    """
+    h = np.uint64(14695981039346656037)
+    prime = np.uint64(1099511628211)
+    height, width = state.shape
+    h = (h ^ np.uint64(height)) * prime
+    h = (h ^ np.uint64(width)) * prime
+    for i in range(height):
+        h = (h ^ np.uint64(state[i, 0])) * prime
+        h = (h ^ np.uint64(state[i, width - 1])) * prime
+    for j in range(1, width - 1):
+        h = (h ^ np.uint64(state[0, j])) * prime
+        h = (h ^ np.uint64(state[height - 1, j])) * prime
+    return h
+
+@numba.njit(cache=True)
+def apply_fill_plan(state, plan):
+    for k in range(plan.shape[0]):
+        fill_rect(state, plan[k, 0], plan[k, 1], plan[k, 2], plan[k, 3], plan[k, 4])
+
+@numba.njit(cache=True)
+def fill_plan_template(shape, plan):
+    """
+    Fill template (see fill_template) built from a recorded fill plan instead of the wall pixels.
+    """
+    template = np.zeros(shape, dtype=np.uint8)
+    apply_fill_plan(template, plan)
+    return template
+
+@numba.njit(cache=True)
+def fill_template(state):
+    """
+    What fill_holes writes into each empty pixel of the room, computed from the wall pixels only.
+    For a frame without sprites on the border, fill_holes(state) equals state where it is not empty
+    and the template elsewhere.
+    """
+    template = np.zeros_like(state)
+    for i in range(state.shape[0]):
+        for j in range(state.shape[1]):
+            if state[i, j] == WALL_INDEX:
+                template[i, j] = WALL_INDEX
+    fill_holes(template)
+    return template
+
+@numba.njit(cache=True)
+def sprites_on_border(frame):
+    """
+    :return: True if any pixel on the frame border decodes to something other than empty or wall
+    """
+    height, width = frame.shape[0], frame.shape[1]
+    for i in range(height):
+        for j in (0, width - 1):
+            index = STATE_PALETTE_LUT[frame[i, j, 0]]
+            if index != EMPTY_INDEX and index != WALL_INDEX:
+                return True
+    for j in range(width):
+        for i in (0, height - 1):
+            index = STATE_PALETTE_LUT[frame[i, j, 0]]
+            if index != EMPTY_INDEX and index != WALL_INDEX:
+                return True
+    return False
+
+@numba.njit(cache=True)
+def patch_changed_pixels(frame, prev_red, state, template):
+    """
+    Re-decodes only the pixels whose red value differs from prev_red and writes them into the filled
+    index map, taking the fill template where a pixel became empty. prev_red is updated in place.
+    Stops early if a wall or portal pixel appeared or disappeared, the caller has to rebuild the room then.
+    :return: walls_changed, changed pixels, enemy pixel delta, player_changed, changed box (i_min, j_min, i_max, j_max)
+    """
+    changed = 0
+    enemy_delta = 0
+    player_changed = False
+    i_min, j_min = state.shape[0], state.shape[1]
+    i_max, j_max = -1, -1
+    for i in range(state.shape[0]):
+        for j in range(state.shape[1]):
+            red = frame[i, j, 0]
+            old_red = prev_red[i, j]
+            if red == old_red:
+                continue
+
+            old_index = STATE_PALETTE_LUT[old_red]
+            new_index = STATE_PALETTE_LUT[red]
+            if old_index == WALL_INDEX or new_index == WALL_INDEX or old_index == PORTAL_INDEX or new_index == PORTAL_INDEX:
+                return True, changed, enemy_delta, player_changed, (i_min, j_min, i_max, j_max)
+
+            enemy_delta += int(new_index == ENEMY_INDEX) - int(old_index == ENEMY_INDEX)
+            if old_index == PLAYER_INDEX or new_index == PLAYER_INDEX:
+                player_changed = True
+
+            prev_red[i, j] = red
+            state[i, j] = new_index if new_index != EMPTY_INDEX else template[i, j]
+
+            changed += 1
+            i_min = min(i_min, i)
+            j_min = min(j_min, j)
+            i_max = max(i_max, i)
+            j_max = max(j_max, j)
+
+    return False, changed, enemy_delta, player_changed, (i_min, j_min, i_max, j_max)
\ No newline at end of file
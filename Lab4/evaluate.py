@@ -0,0 +1,171 @@
+﻿import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+ENV_ID = "ALE/Berzerk-v5"
+BOOTSTRAP_SAMPLES = 10000
+
+# per worker process, set by _init_worker
+_worker = None
+
+
+def make_env(render_mode=None, env_id=ENV_ID):
+    import ale_py
+    import gymnasium as gym
+
+    gym.register_envs(ale_py)
+    return gym.make(env_id, render_mode=render_mode)
+
+
+def load_agent(weights_file):
+    """
+    Sarsa.load for the as_vector() policy of run_episode: Sarsa or TileCodedSarsa, not a SparseSarsa over
+    the play.py grids.
+    """
+    from Lab4.sarsa import Sarsa, SparseSarsa, TileCodedSarsa
+
+    agent = Sarsa.load(weights_file)
+    if isinstance(agent, SparseSarsa) and not isinstance(agent, TileCodedSarsa):
+        raise TypeError(f"{weights_file} holds a SparseSarsa over active feature indices, not State.as_vector()")
+    return agent
+
+
+def run_episode(env, agent, builder, seed=None, max_steps=None):
+    """
+    Plays one greedy episode, the policy of run.py: action 0 on empty frames, argmax Q otherwise.
+    :return: score, number of steps, action counts
+    """
+    observation, _ = env.reset(seed=seed)
+    builder.reset()
+    action_counts = np.zeros(env.action_space.n, dtype=np.int64)
+    score = 0.0
+    steps = 0
+    done = False
+    while not done and (max_steps is None or steps < max_steps):
+        featured_state = builder.build(observation)
+        if featured_state.is_empty:
+            action = 0
+        else:
+            action, _ = agent.epsilon_greedy(featured_state.as_vector())
+        action_counts[action] += 1
+        observation, reward, terminated, truncated, _ = env.step(action)
+        done = terminated or truncated
+        score += reward
+        steps += 1
+    return score, steps, action_counts
+
+
+def _init_worker(weights_file, render_mode, env_id):
+    global _worker
+    from Lab4.room_cache import RoomCache
+    from Lab4.state import IncrementalStateBuilder
+
+    agent = load_agent(weights_file)
+    agent.restrict_exploration()
+    _worker = (make_env(render_mode, env_id), agent, IncrementalStateBuilder(room_cache=RoomCache()))
+
+
+def _run_seed(args):
+    seed, max_steps = args
+    env, agent, builder = _worker
+    score, steps, action_counts = run_episode(env, agent, builder, seed, max_steps)
+    return seed, score, steps, action_counts
+
+
+def score_statistics(scores, confidence=0.95, seed=0):
+    """
+    Mean, spread and a percentile bootstrap confidence interval of the mean. Episode scores are far
+    from normal (mostly multiples of 50, long right tail), so the interval is not taken from the std.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    n = len(scores)
+    if n == 0:
+        raise ValueError("score_statistics needs at least one score")
+    means = np.random.default_rng(seed).choice(scores, size=(BOOTSTRAP_SAMPLES, n)).mean(axis=1)
+    tail = (1.0 - confidence) / 2 * 100
+    return {
+        "episodes": n,
+        "mean": float(scores.mean()),
+        "std": float(scores.std(ddof=1)) if n > 1 else 0.0,
+        "sem": float(scores.std(ddof=1) / np.sqrt(n)) if n > 1 else 0.0,
+        "median": float(np.median(scores)),
+        "min": float(scores.min()),
+        "max": float(scores.max()),
+        "confidence": confidence,
+        "ci_low": float(np.percentile(means, tail)),
+        "ci_high": float(np.percentile(means, 100 - tail)),
+    }
+
+
+def evaluate(weights_file, n_episodes=1000, n_workers=None, seed=0, max_steps=None, render_mode=None,
+             env_id=ENV_ID):
+    """
+    Plays n_episodes greedy episodes over a pool of processes. Episode i is reset with seed + i, so the
+    result does not depend on the number of workers or the order episodes finish in.
+    :param render_mode: None or "rgb_array", the observations are the same
+    :return: summary dict, see score_statistics, with action histogram and per episode results
+    """
+    if n_episodes < 1:
+        raise ValueError(f"n_episodes must be at least 1, got {n_episodes}")
+    n_workers = n_workers or os.cpu_count()
+    start = time.perf_counter()
+    tasks = [(seed + i, max_steps) for i in range(n_episodes)]
+    # spawn: workers start clean of the parent's numba threads and load the kernels from the cache
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(n_workers, initializer=_init_worker, initargs=(weights_file, render_mode, env_id)) as pool:
+        results = sorted(pool.imap_unordered(_run_seed, tasks))
+    elapsed = time.perf_counter() - start
+
+    scores = [score for _, score, _, _ in results]
+    lengths = np.array([steps for _, _, steps, _ in results])
+    action_counts = np.sum([counts for _, _, _, counts in results], axis=0)
+
+    summary = score_statistics(scores)
+    summary.update({
+        "weights": os.path.abspath(weights_file),
+        "env": env_id,
+        "seed": seed,
+        "max_steps": max_steps,
+        "workers": n_workers,
+        "seconds": elapsed,
+        "steps": int(lengths.sum()),
+        "mean_episode_steps": float(lengths.mean()),
+        "action_counts": action_counts.tolist(),
+        "action_fractions": (action_counts / max(1, action_counts.sum())).tolist(),
+        "episode_results": [{"seed": s, "score": float(score), "steps": steps} for s, score, steps, _ in results],
+    })
+    return summary
+
+
+def print_summary(summary):
+    print(f"{summary['episodes']} episodes in {summary['seconds']:.1f}s "
+          f"({summary['steps'] / summary['seconds']:,.0f} env steps/s, {summary['workers']} workers)")
+    print(f"score {summary['mean']:.1f} +- {summary['std']:.1f}, "
+          f"{summary['confidence']:.0%} CI of the mean [{summary['ci_low']:.1f}, {summary['ci_high']:.1f}], "
+          f"median {summary['median']:.0f}, min {summary['min']:.0f}, max {summary['max']:.0f}")
+    print(f"action fractions: {np.round(summary['action_fractions'], 3)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate saved Sarsa weights on many headless episodes.")
+    parser.add_argument("weights", nargs="?", default="sarsa-weights-berzerk.npz")
+    parser.add_argument("-n", "--episodes", type=int, default=1000)
+    parser.add_argument("-j", "--workers", type=int, default=None, help="processes, default one per cpu")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first episode")
+    parser.add_argument("--max-steps", type=int, default=None, help="cut episodes after this many steps")
+    parser.add_argument("--render", choices=["none", "rgb_array"], default="none")
+    parser.add_argument("-o", "--output", default=None, help="JSON summary file")
+    args = parser.parse_args()
+    if args.episodes < 1:
+        parser.error(f"-n/--episodes must be at least 1, got {args.episodes}")
+
+    summary = evaluate(args.weights, args.episodes, args.workers, args.seed, args.max_steps,
+                       None if args.render == "none" else args.render)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=1)
\ No newline at end of file
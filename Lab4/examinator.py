@@ -0,0 +1,217 @@
+﻿import numba
+import numpy as np
+
+from Lab4.env_info import *
+from Lab4.state import (COMPACT_STATE_SIZE, _IS_EMPTY, _HAS_PLAYER, _PLAYER_BOX, _LEFT_WALL, _RIGHT_WALL, _UP_WALL,
+                        _DOWN_WALL, _HAS_ENEMY, _CLOSEST_ENEMY, _HAS_PORTAL, _CLOSEST_PORTAL, _ENEMIES)
+
+N_ACTIONS = 1 + len(FIRE_ACTIONS) + len(MOVE_ACTIONS)
+FIRE_ACTION_MASK = np.isin(np.arange(N_ACTIONS), FIRE_ACTIONS)
+MOVE_ACTION_MASK = np.isin(np.arange(N_ACTIONS), MOVE_ACTIONS)
+
+
+def _action_direction_mask():
+    """
+    :return: bool [action, direction], True if the move action goes towards the (UP, RIGHT, LEFT, DOWN) direction
+    """
+    mask = np.zeros((N_ACTIONS, 4), dtype=np.bool_)
+    for action, directions in ACTION_TO_DIRECTIONS.items():
+        mask[action, directions] = True
+    return mask
+
+
+ACTION_DIRECTION_MASK = _action_direction_mask()
+# fire action towards direction d is FIRE_TOWARDS + d
+FIRE_TOWARDS = FIRE_ACTIONS[1]
+# direction_to_player of an object above / level with / below (row) and left / level / right (column) of the player
+_DIRECTION_FROM_PLAYER = np.array([[UPLEFT_DIRECTION, UP_DIRECTION, UPRIGHT_DIRECTION],
+                                   [LEFT_DIRECTION, -1, RIGHT_DIRECTION],
+                                   [DOWNLEFT_DIRECTION, DOWN_DIRECTION, DOWNRIGHT_DIRECTION]], dtype=np.int64)
+
+# Examinator attributes in the order of the coefficient vector of the kernels
+COEFFICIENT_NAMES = ["ENV_REWARD_DESCALE", "LIVING_PENALTY", "NOT_SHOOT_ENEMY_PENALTY", "STAY_IN_DANGER_PENALTY",
+                     "FIRE_ENEMY_BONUS", "BONUS_FOR_NOT_SHOOT_NOWHERE", "DEATH_PENALTY", "WALL_SAVE_DISTANCE",
+                     "FAR_FROM_WALL_BONUS", "BONUS_FOR_SCANNED_PIXEL", "BONUS_FOR_VISITED_PIXEL",
+                     "WALL_PROXIMITY_PENALTY_SCALE", "GO_TO_WALL_PENALTY", "STABLE_BONUS_ON_CLEARED_LEVEL",
+                     "SHOOT_WHEN_NO_ENEMIES_PENALTY", "NEAR_WALL_DISTANCE", "NEAR_WALL_BONUS", "MID_WALL_DISTANCE",
+                     "MID_WALL_BONUS", "FIND_PORTAL_BONUS", "APPROACH_PORTAL_BONUS", "LOSE_PORTAL_PENALTY",
+                     "FAR_FROM_WALL_DISTANCE"]
+(_DESCALE, _LIVING, _NOT_SHOOT_ENEMY, _STAY_IN_DANGER, _FIRE_ENEMY, _NOT_SHOOT_NOWHERE, _DEATH, _WALL_SAVE_DISTANCE,
+ _FAR_FROM_WALL, _SCANNED_PIXEL, _VISITED_PIXEL, _WALL_PROXIMITY_SCALE, _GO_TO_WALL, _CLEARED_LEVEL,
+ _SHOOT_WHEN_NO_ENEMIES, _NEAR_WALL_DISTANCE, _NEAR_WALL, _MID_WALL_DISTANCE, _MID_WALL, _FIND_PORTAL,
+ _APPROACH_PORTAL, _LOSE_PORTAL, _FAR_FROM_WALL_DISTANCE) = range(len(COEFFICIENT_NAMES))
+
+
+@numba.njit(cache=True)
+def _examine_row(state, prev_state, action, reward, scanned_pixels, visited_pixels, coefficients):
+    """
+    Examinator.examine on COMPACT_STATE_DTYPE rows of the state and the previous state. The center of the
+    player and the wall distances are computed once, the action tests are lookups in the action masks
+    (global arrays, frozen into the compiled code).
+    """
+    alive = state[_HAS_PLAYER] == 1
+    center_i = (np.int64(state[_PLAYER_BOX]) + state[_PLAYER_BOX + 2]) // 2 if alive else 0
+    center_j = (np.int64(state[_PLAYER_BOX + 1]) + state[_PLAYER_BOX + 3]) // 2 if alive else 0
+    # in the order of get_direction_on_closest_wall: UP, RIGHT, LEFT, DOWN
+    closest_wall = 0
+    wall_distance = center_i - state[_UP_WALL]
+    for direction, distance in enumerate((state[_RIGHT_WALL + 1] - center_j, center_j - state[_LEFT_WALL + 1],
+                                          state[_DOWN_WALL] - center_i)):
+        if distance < wall_distance:
+            closest_wall = direction + 1
+            wall_distance = distance
+
+    shaped_reward = reward / coefficients[_DESCALE] + coefficients[_LIVING]
+
+    if state[_HAS_ENEMY] == 1:
+        enemy_i = state[_CLOSEST_ENEMY]
+        enemy_j = state[_CLOSEST_ENEMY + 1]
+        # direction_to_player of the closest enemy
+        if enemy_i < state[_PLAYER_BOX]:
+            vertical = 0
+        elif enemy_i > state[_PLAYER_BOX + 2]:
+            vertical = 2
+        else:
+            vertical = 1
+        if enemy_j < state[_PLAYER_BOX + 1]:
+            horizontal = 0
+        elif enemy_j > state[_PLAYER_BOX + 3]:
+            horizontal = 2
+        else:
+            horizontal = 1
+        required_action = FIRE_TOWARDS + _DIRECTION_FROM_PLAYER[vertical, horizontal]
+        if action != required_action and reward <= 0:
+            shaped_reward += coefficients[_NOT_SHOOT_ENEMY]
+        if action == 0:
+            shaped_reward += coefficients[_STAY_IN_DANGER]
+        if action == required_action:
+            shaped_reward += coefficients[_FIRE_ENEMY]
+    elif not FIRE_ACTION_MASK[action] and action != 0:
+        shaped_reward += coefficients[_NOT_SHOOT_NOWHERE]
+
+    if not alive:
+        shaped_reward += coefficients[_DEATH]
+
+    if wall_distance > coefficients[_FAR_FROM_WALL_DISTANCE]:
+        shaped_reward += coefficients[_FAR_FROM_WALL]
+
+    if MOVE_ACTION_MASK[action]:
+        shaped_reward += coefficients[_SCANNED_PIXEL] * scanned_pixels
+        shaped_reward += coefficients[_VISITED_PIXEL] * visited_pixels
+        if ACTION_DIRECTION_MASK[action, closest_wall]:
+            if wall_distance < coefficients[_WALL_SAVE_DISTANCE]:
+                shaped_reward += -1.0 * (coefficients[_WALL_PROXIMITY_SCALE] / (wall_distance + 1.0))
+            else:
+                shaped_reward += coefficients[_GO_TO_WALL]
+
+    if state[_ENEMIES] == 0:
+        if not alive:
+            return shaped_reward + coefficients[_DEATH]
+        shaped_reward += coefficients[_CLEARED_LEVEL]
+
+        if FIRE_ACTION_MASK[action]:
+            shaped_reward += coefficients[_SHOOT_WHEN_NO_ENEMIES]
+
+        # rewarding to be near walls when no enemies to find portals
+        if coefficients[_WALL_SAVE_DISTANCE] < wall_distance < coefficients[_NEAR_WALL_DISTANCE]:
+            shaped_reward += coefficients[_NEAR_WALL]
+        elif coefficients[_NEAR_WALL_DISTANCE] <= wall_distance < coefficients[_MID_WALL_DISTANCE]:
+            shaped_reward += coefficients[_MID_WALL]
+
+        had_portal = prev_state[_HAS_PORTAL] == 1
+        if state[_HAS_PORTAL] == 1:
+            if not had_portal:
+                shaped_reward += coefficients[_FIND_PORTAL]
+            else:
+                # distance_from_player of the previous state, -1 without a player
+                prev_distance = -1.0
+                if prev_state[_IS_EMPTY] == 0 and prev_state[_HAS_PLAYER] == 1:
+                    prev_i = (np.int64(prev_state[_PLAYER_BOX]) + prev_state[_PLAYER_BOX + 2]) // 2
+                    prev_j = (np.int64(prev_state[_PLAYER_BOX + 1]) + prev_state[_PLAYER_BOX + 3]) // 2
+                    prev_distance = np.sqrt((prev_i - prev_state[_CLOSEST_PORTAL]) ** 2 +
+                                            (prev_j - prev_state[_CLOSEST_PORTAL + 1]) ** 2)
+                distance = np.sqrt((center_i - state[_CLOSEST_PORTAL]) ** 2 +
+                                   (center_j - state[_CLOSEST_PORTAL + 1]) ** 2)
+                if distance < prev_distance:
+                    shaped_reward += coefficients[_APPROACH_PORTAL]
+        elif had_portal:
+            shaped_reward += coefficients[_LOSE_PORTAL]
+
+    return shaped_reward
+
+
+@numba.njit(cache=True)
+def _examine_rows(states, prev_states, actions, rewards, scanned_pixels, visited_pixels, coefficients, out):
+    for n in range(states.shape[0]):
+        out[n] = _examine_row(states[n], prev_states[n], actions[n], rewards[n], scanned_pixels[n],
+                              visited_pixels[n], coefficients)
+
+
+class Examinator:
+    """
+    Reward shaping of one step, the rules in _examine_row with the class attributes below as coefficients
+    (COEFFICIENT_NAMES). The coefficient vector is taken when the Examinator is created, so set changed
+    coefficients on the class or the instance before that, or pass coefficients.
+    """
+    WALL_SAVE_DISTANCE = 15
+
+    ENV_REWARD_DESCALE = 18
+
+    NOT_SHOOT_ENEMY_PENALTY = -2.5
+    LIVING_PENALTY = -0.0482
+    DEATH_PENALTY = -25
+    STAY_IN_DANGER_PENALTY = -0.4
+    FIRE_ENEMY_BONUS = 1.2
+    FAR_FROM_WALL_DISTANCE = 15
+    FAR_FROM_WALL_BONUS = 0.15
+    MOVE_BONUS = 0.018
+    BONUS_FOR_NOT_SHOOT_NOWHERE = 0.05
+    GO_TO_WALL_PENALTY = -0.15
+    WALL_PROXIMITY_PENALTY_SCALE = 15.0
+    SHOOT_WHEN_NO_ENEMIES_PENALTY = -0.3
+    STABLE_BONUS_ON_CLEARED_LEVEL = 0.05
+    NEAR_WALL_DISTANCE = 30
+    NEAR_WALL_BONUS = 0.15
+    MID_WALL_DISTANCE = 40
+    MID_WALL_BONUS = 0.07
+    BONUS_FOR_SCANNED_PIXEL = 0.0002
+    BONUS_FOR_VISITED_PIXEL = 0.005
+    FIND_PORTAL_BONUS = 15.0
+    APPROACH_PORTAL_BONUS = 1.0
+    LOSE_PORTAL_PENALTY = -5.0
+
+    def __init__(self, coefficients=None):
+        """
+        :param coefficients: dict of COEFFICIENT_NAMES to values replacing the attributes
+        """
+        coefficients = coefficients or {}
+        unknown = set(coefficients) - set(COEFFICIENT_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown Examinator coefficients: {sorted(unknown)}")
+        self.coefficients = np.array([coefficients.get(name, getattr(self, name)) for name in COEFFICIENT_NAMES],
+                                     dtype=np.float64)
+
+    def examine(self, state, action, model, reward, prev_state, scanned_pixels=0, visited_pixels=0):
+        return _examine_row(state.compact_row(), prev_state.compact_row(), int(action), float(reward),
+                            float(scanned_pixels), float(visited_pixels), self.coefficients)
+
+    def examine_batch(self, states, actions, rewards, prev_states, scanned_pixels=None, visited_pixels=None):
+        """
+        examine for N transitions in one call, e.g. to score recorded transitions with other coefficients.
+        :param states, prev_states: (N,) COMPACT_STATE_DTYPE records, as from compact_states or pack_states
+        :param scanned_pixels, visited_pixels: (N,) new pixels of the exploration tracker, 0 if None
+        :return: (N,) float64 shaped rewards
+        """
+        n = len(states)
+        no_pixels = np.zeros(n, dtype=np.float64)
+        out = np.empty(n, dtype=np.float64)
+        _examine_rows(_as_rows(states), _as_rows(prev_states), np.asarray(actions, dtype=np.int64),
+                      np.asarray(rewards, dtype=np.float64),
+                      no_pixels if scanned_pixels is None else np.asarray(scanned_pixels, dtype=np.float64),
+                      no_pixels if visited_pixels is None else np.asarray(visited_pixels, dtype=np.float64),
+                      self.coefficients, out)
+        return out
+
+
+def _as_rows(records):
+    return np.ascontiguousarray(records).view(np.int16).reshape(len(records), COMPACT_STATE_SIZE)
\ No newline at end of file
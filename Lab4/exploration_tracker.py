@@ -2,36 +2,76 @@
 import numpy as np
 
 from Lab4.env_analizators import get_scanning_points
-from Lab4.state import State
+from Lab4.state import StateFeatures
+
+WORD_BITS = 64
+VISITED_PLANE = 0
+SCANNED_PLANE = 1
+ALL_BITS = np.uint64(0xFFFFFFFFFFFFFFFF)
 
 
 @numba.njit
-def mark_scanned_line(mask, r0, c0, r1, c1):
+def _popcount(x):
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+@numba.njit
+def _span_bits(word, c_start, c_end):
+    """
+    Bits of columns c_start..c_end (inclusive) that fall into the given word.
+    """
+    lo = max(c_start - word * WORD_BITS, 0)
+    hi = min(c_end - word * WORD_BITS, WORD_BITS - 1)
+    if lo > hi:
+        return np.uint64(0)
+    return (ALL_BITS >> np.uint64(WORD_BITS - 1 - hi + lo)) << np.uint64(lo)
+
+
+@numba.njit(cache=True)
+def refresh_rows(planes, row_epoch, epoch, r_start, r_end):
+    """
+    Clears the rows r_start..r_end (clipped) that are left over from an earlier epoch.
+    """
+    for r in range(max(r_start, 0), min(r_end, planes.shape[1] - 1) + 1):
+        if row_epoch[r] != epoch:
+            for word in range(planes.shape[2]):
+                planes[VISITED_PLANE, r, word] = 0
+                planes[SCANNED_PLANE, r, word] = 0
+            row_epoch[r] = epoch
+
+
+@numba.njit(cache=True)
+def mark_scanned_line(planes, n_cols, r0, c0, r1, c1):
     """
     Marks pixels along a scan ray as 'seen'.
     Returns number of newly seen pixels.
     """
+    height = planes.shape[1]
     new_pixels = 0
     if r0 == r1: # Horizontal line
-        c_start = min(c0, c1)
-        c_end = max(c0, c1)
-        for c in range(c_start, c_end + 1):
-             if 0 <= r0 < mask.shape[0] and 0 <= c < mask.shape[1]:
-                if mask[r0, c] == 0:
-                    mask[r0, c] = 2
-                    new_pixels += 1
+        c_start = max(min(c0, c1), 0)
+        c_end = min(max(c0, c1), n_cols - 1)
+        if 0 <= r0 < height:
+            for word in range(c_start // WORD_BITS, c_end // WORD_BITS + 1):
+                new = _span_bits(word, c_start, c_end) & ~(planes[VISITED_PLANE, r0, word] |
+                                                           planes[SCANNED_PLANE, r0, word])
+                planes[SCANNED_PLANE, r0, word] |= new
+                new_pixels += np.int64(_popcount(new))
     elif c0 == c1: # Vertical line
-        r_start = min(r0, r1)
-        r_end = max(r0, r1)
-        for r in range(r_start, r_end + 1):
-            if 0 <= r < mask.shape[0] and 0 <= c0 < mask.shape[1]:
-                if mask[r, c0] == 0:
-                    mask[r, c0] = 2
+        if 0 <= c0 < n_cols:
+            word = c0 // WORD_BITS
+            bit = np.uint64(1) << np.uint64(c0 % WORD_BITS)
+            for r in range(max(min(r0, r1), 0), min(max(r0, r1), height - 1) + 1):
+                if (planes[VISITED_PLANE, r, word] | planes[SCANNED_PLANE, r, word]) & bit == 0:
+                    planes[SCANNED_PLANE, r, word] |= bit
                     new_pixels += 1
     return new_pixels
 
-@numba.njit
-def mark_scanned_traces_from_box(mask, box, up_wall, down_wall, left_wall, right_wall):
+@numba.njit(cache=True)
+def mark_scanned_traces_from_box(planes, n_cols, box, up_wall, down_wall, left_wall, right_wall):
     """
     Marks the scan lines from the player box to the walls.
     Returns number of newly seen pixels.
@@ -40,45 +80,95 @@ def mark_scanned_traces_from_box(mask, box, up_wall, down_wall, left_wall, right
     new_pixels = 0
 
     for point in left_points:
-        new_pixels += mark_scanned_line(mask, point[0], point[1], left_wall[0], left_wall[1])
+        new_pixels += mark_scanned_line(planes, n_cols, point[0], point[1], left_wall[0], left_wall[1])
     for point in right_points:
-        new_pixels += mark_scanned_line(mask, point[0], point[1], right_wall[0], right_wall[1])
+        new_pixels += mark_scanned_line(planes, n_cols, point[0], point[1], right_wall[0], right_wall[1])
     for point in up_points:
-        new_pixels += mark_scanned_line(mask, point[0], point[1], up_wall[0], up_wall[1])
+        new_pixels += mark_scanned_line(planes, n_cols, point[0], point[1], up_wall[0], up_wall[1])
     for point in down_points:
-        new_pixels += mark_scanned_line(mask, point[0], point[1], down_wall[0], down_wall[1])
+        new_pixels += mark_scanned_line(planes, n_cols, point[0], point[1], down_wall[0], down_wall[1])
 
     return new_pixels
 
-@numba.njit
-def mark_pixels_in_box(mask, r_min, c_min, r_max, c_max):
+@numba.njit(cache=True)
+def mark_pixels_in_box(planes, n_cols, r_min, c_min, r_max, c_max):
     """
-    Marks the rectangular area covered by the player.
+    Marks the rectangular area covered by the player (r_max and c_max excluded).
     Returns the number of *newly* visited pixels.
     """
-    r_min = max(0, min(r_min, mask.shape[0]))
-    c_min = max(0, min(c_min, mask.shape[1]))
-    r_max = max(0, min(r_max, mask.shape[0]))
-    c_max = max(0, min(c_max, mask.shape[1]))
+    height = planes.shape[1]
+    r_min = max(0, min(r_min, height))
+    c_min = max(0, min(c_min, n_cols))
+    r_max = max(0, min(r_max, height))
+    c_max = max(0, min(c_max, n_cols))
 
     new_pixels = 0
-    for r in range(r_min, r_max):
-        for c in range(c_min, c_max):
-            if mask[r, c] == 0:
-                mask[r, c] = 1 # 1 = Visited by Player Body
-                new_pixels += 1
+    if c_min < c_max:
+        for r in range(r_min, r_max):
+            for word in range(c_min // WORD_BITS, (c_max - 1) // WORD_BITS + 1):
+                new = _span_bits(word, c_min, c_max - 1) & ~(planes[VISITED_PLANE, r, word] |
+                                                             planes[SCANNED_PLANE, r, word])
+                planes[VISITED_PLANE, r, word] |= new
+                new_pixels += np.int64(_popcount(new))
     return new_pixels
 
+
+@numba.njit(cache=True)
+def cover_box(planes, row_epoch, epoch, n_cols, box, up_wall, down_wall, left_wall, right_wall):
+    """
+    mark_pixels_in_box and then mark_scanned_traces_from_box, after refreshing every row they can reach.
+    :return: new visited pixels, new scanned pixels
+    """
+    refresh_rows(planes, row_epoch, epoch,
+                 min(box[0], up_wall[0], down_wall[0], left_wall[0], right_wall[0]),
+                 max(box[2], up_wall[0], down_wall[0], left_wall[0], right_wall[0]))
+    new_visited = mark_pixels_in_box(planes, n_cols, box[0], box[1], box[2], box[3])
+    new_scanned = mark_scanned_traces_from_box(planes, n_cols, box, up_wall, down_wall, left_wall, right_wall)
+    return new_visited, new_scanned
+
+
 class ExplorationTracker:
+    """
+    Pixels of the room the player has covered in the current episode, as two bit planes of
+    (rows, words of 64 columns): visited (under the player box) and scanned (on the scan rays to the
+    walls). A pixel is counted once, in the plane that covered it first.
+    reset() only starts a new epoch, rows of an older epoch are cleared the first time they are used.
+    """
+
     def __init__(self, h, w):
         self.height = h
         self.width = w
-        self.space = np.zeros((w, h), dtype=np.int32)
+        # indexed as (row, col), with rows being the second argument as the trainer passes (160, 210)
+        self.planes = np.zeros((2, w, (h + WORD_BITS - 1) // WORD_BITS), dtype=np.uint64)
+        self.row_epoch = np.zeros(w, dtype=np.int64)
+        self.epoch = 0
 
     def reset(self):
-        self.space = np.zeros((self.width, self.height), dtype=np.int32)
+        self.epoch += 1
+
+    @property
+    def visited(self):
+        """
+        :return: bool (rows, cols) mask of the pixels visited by the player box
+        """
+        return self._unpack(VISITED_PLANE)
+
+    @property
+    def scanned(self):
+        """
+        :return: bool (rows, cols) mask of the pixels only seen by the scan rays
+        """
+        return self._unpack(SCANNED_PLANE)
 
-    def cover(self, state: State):
+    def _unpack(self, plane):
+        words = np.where((self.row_epoch == self.epoch)[:, None], self.planes[plane], np.uint64(0))
+        bits = np.unpackbits(words.view(np.uint8), axis=1, bitorder="little")
+        return bits[:, :self.height].astype(np.bool_)
+
+    def covered_pixels(self):
+        return int(self.visited.sum() + self.scanned.sum())
+
+    def cover(self, state: StateFeatures):
         """
         :return: new visited pixels, new scanned pixels
         """
@@ -86,9 +176,6 @@ class ExplorationTracker:
         if state.player_box is None:
             return 0, 0
 
-        r_min, c_min, r_max, c_max = state.player_box
-        new_visited = mark_pixels_in_box(self.space, r_min, c_min, r_max, c_max)
-
-        new_scanned = mark_scanned_traces_from_box(self.space, state.player_box, state.up_wall, state.down_wall, state.left_wall, state.right_wall)
-
-        return new_visited, new_scanned
\ No newline at end of file
+        new_visited, new_scanned = cover_box(self.planes, self.row_epoch, self.epoch, self.height, state.player_box,
+                                             state.up_wall, state.down_wall, state.left_wall, state.right_wall)
+        return int(new_visited), int(new_scanned)
\ No newline at end of file
@@ -0,0 +1,85 @@
+﻿import functools
+
+import gymnasium as gym
+import numpy as np
+
+from Lab4.evaluate import ENV_ID, make_env
+from Lab4.exploration_tracker import ExplorationTracker
+from Lab4.state import COMPACT_STATE_SIZE, VECTOR_STATE_SIZE, CompactState
+
+# keys of the observations of FeaturizeObservation
+FEATURES_KEY = "features"
+COMPACT_KEY = "compact"
+COVERAGE_KEY = "coverage"
+
+
+def is_featurized(space):
+    """
+    :return: True if space is the observation space of FeaturizeObservation
+    """
+    return isinstance(space, gym.spaces.Dict) and COMPACT_KEY in space.spaces
+
+
+class FeaturizeObservation(gym.ObservationWrapper):
+    """
+    Replaces the (210, 160, 3) RGB frame by what the trainer makes of it: the State as_vector features, the
+    compact row of CompactState (the input of the Examinator and of the episode bookkeeping) and the pixels the
+    frame adds to the ExplorationTracker (visited, scanned). Wrapping the envs of an AsyncVectorEnv runs the
+    featurization in the workers, in parallel with each other, and sends about 100 bytes per step instead of
+    100 KB of frame.
+    The tracker follows the episodes of Trainer.train_vectorized: it is reset on the skip_steps-th step after
+    reset (the first state of the episode, after the initial no-ops) and covers the non-empty frames after it.
+    """
+
+    def __init__(self, env, skip_steps):
+        super().__init__(env)
+        self.skip_steps = skip_steps
+        self.exploration_tracker = ExplorationTracker(160, 210)
+        self._steps = 0
+        self.observation_space = gym.spaces.Dict({
+            FEATURES_KEY: gym.spaces.Box(-np.inf, np.inf, shape=(VECTOR_STATE_SIZE,), dtype=np.float32),
+            COMPACT_KEY: gym.spaces.Box(np.iinfo(np.int16).min, np.iinfo(np.int16).max, shape=(COMPACT_STATE_SIZE,),
+                                        dtype=np.int16),
+            COVERAGE_KEY: gym.spaces.Box(0, 160 * 210, shape=(2,), dtype=np.int32),
+        })
+
+    def reset(self, **kwargs):
+        # observation counts the frame of reset as step 0
+        self._steps = -1
+        return super().reset(**kwargs)
+
+    def observation(self, observation):
+        self._steps += 1
+        featured_state = CompactState(observation)
+        features = np.zeros(VECTOR_STATE_SIZE, dtype=np.float32)
+        coverage = np.zeros(2, dtype=np.int32)
+        if not featured_state.is_empty:
+            features[:] = featured_state.as_vector()
+        if self._steps == self.skip_steps:
+            self.exploration_tracker.reset()
+        elif self._steps > self.skip_steps and not featured_state.is_empty:
+            coverage[:] = self.exploration_tracker.cover(featured_state)
+        return {FEATURES_KEY: features, COMPACT_KEY: featured_state.compact_row(), COVERAGE_KEY: coverage}
+
+
+def make_featurized_env(env_id=ENV_ID, skip_steps=None):
+    """
+    :param skip_steps: steps after reset before the episode starts, INITIAL_NOOP_STEPS of the trainer by default
+    """
+    if skip_steps is None:
+        from Lab4.trainer import INITIAL_NOOP_STEPS
+
+        skip_steps = INITIAL_NOOP_STEPS
+    return FeaturizeObservation(make_env(None, env_id), skip_steps)
+
+
+def make_vector_env(n_envs, featurized=True, env_id=ENV_ID):
+    """
+    :return: AsyncVectorEnv of n_envs envs for Trainer.train_vectorized, with observations of
+             FeaturizeObservation if featurized, RGB frames otherwise
+    """
+    from gymnasium.vector import AsyncVectorEnv, AutoresetMode
+
+    env_fn = functools.partial(make_featurized_env, env_id) if featurized else functools.partial(make_env, None,
+                                                                                                  env_id)
+    return AsyncVectorEnv([env_fn] * n_envs, autoreset_mode=AutoresetMode.DISABLED)
\ No newline at end of file
@@ -1,5 +1,12 @@
 ﻿import numpy as np
 import glob
+import hashlib
+import os
+import zipfile
+
+DATA_KEYS = ("states", "actions", "rewards", "next_states", "dones")
+# recorded since compact states (recorder.EpisodeRecorder), kept by combine_datasets_streaming if every file has them
+OPTIONAL_KEYS = ("compact_states", "next_compact_states")
 
 
 def combine_datasets(file_pattern="expert_data*.npz", output_file="combined_expert_data.npz"):
@@ -81,7 +88,175 @@ def combine_datasets(file_pattern="expert_data*.npz", output_file="combined_expe
     print(f"File saved to: {output_file}")
 
 
+def read_npz_headers(file_path):
+    """
+    Reads shape and dtype of every array in an .npz file from the .npy headers, without loading the data.
+    :return: {key: (shape, dtype)}
+    """
+    headers = {}
+    with zipfile.ZipFile(file_path) as archive:
+        for name in archive.namelist():
+            with archive.open(name) as f:
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+            headers[name[:-len(".npy")] if name.endswith(".npy") else name] = (shape, dtype)
+    return headers
+
+
+def _check_headers(headers, reference):
+    """
+    :return: error message if the file does not have the keys, dtypes and per-transition shapes of reference
+    """
+    missing = [key for key in DATA_KEYS if key not in headers]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    lengths = {headers[key][0][0] for key in DATA_KEYS}
+    if len(lengths) != 1:
+        return f"arrays of different lengths {sorted(lengths)}"
+    if reference is not None:
+        for key in DATA_KEYS:
+            (shape, dtype), (ref_shape, ref_dtype) = headers[key], reference[key]
+            if dtype != ref_dtype or shape[1:] != ref_shape[1:]:
+                return f"{key} is {dtype}{list(shape[1:])}, expected {ref_dtype}{list(ref_shape[1:])}"
+    return None
+
+
+def _common_optional_keys(file_headers):
+    """
+    :return: the OPTIONAL_KEYS every file has, one row per transition with the dtype and shape of the first file
+    """
+    first = file_headers[0]
+    keys = []
+    for key in OPTIONAL_KEYS:
+        if not any(key in headers for headers in file_headers):
+            continue
+        if all(key in headers and headers[key][0][0] == headers["actions"][0][0] and
+               headers[key][1] == first[key][1] and headers[key][0][1:] == first[key][0][1:]
+               for headers in file_headers):
+            keys.append(key)
+        else:
+            print(f"Not combining {key}: not in every file with the same dtype and shape")
+    return tuple(keys)
+
+
+def _transition_digests(data):
+    """
+    Hash of every (state, action, reward, next_state, done) transition of one file.
+    """
+    states, actions, rewards, next_states, dones = (data[key] for key in DATA_KEYS)
+    return [hashlib.blake2b(states[i].tobytes() + actions[i].tobytes() + rewards[i].tobytes() +
+                            next_states[i].tobytes() + dones[i].tobytes(), digest_size=16).digest()
+            for i in range(len(actions))]
+
+
+def combine_datasets_streaming(file_pattern="expert_data*.npz", output_dir="combined_expert_data",
+                               deduplicate=False):
+    """
+    combine_datasets without holding the data in memory. The first pass reads only the array headers
+    (and, with deduplicate, hashes the transitions one file at a time), the output arrays are then
+    preallocated as .npy memmaps in output_dir and filled one file at a time, so memory stays at about
+    one input file. With deduplicate, the set of 16-byte digests of all transitions kept so far is held
+    too, about 100 bytes per transition of the whole dataset, small next to the frames but growing with it.
+    Files with other keys, dtypes or shapes than the first one are skipped. The OPTIONAL_KEYS are combined
+    too if all files have them with the same dtype and shape.
+    Load the result with load_combined.
+    """
+    file_list = sorted(glob.glob(file_pattern))
+
+    if not file_list:
+        print(f"No files found matching pattern: {file_pattern}")
+        return
+
+    print(f"Found {len(file_list)} files to combine:")
+    for f in file_list:
+        print(f"  - {f}")
+
+    # --- Pass 1: shapes, dtypes and which transitions to keep ---
+    reference = None
+    sources = []
+    seen = set()
+    duplicates = 0
+    for file_path in file_list:
+        try:
+            headers = read_npz_headers(file_path)
+        except Exception as e:
+            print(f"Error reading {file_path}: {e}")
+            continue
+
+        error = _check_headers(headers, reference)
+        if error is not None:
+            print(f"Skipping {file_path}: {error}")
+            continue
+        reference = reference or headers
+
+        num_transitions = headers["actions"][0][0]
+        keep = None
+        if deduplicate:
+            keep = np.zeros(num_transitions, dtype=bool)
+            with np.load(file_path) as data:
+                for i, digest in enumerate(_transition_digests(data)):
+                    if digest not in seen:
+                        seen.add(digest)
+                        keep[i] = True
+            duplicates += num_transitions - int(keep.sum())
+        sources.append((file_path, num_transitions, keep, headers))
+
+    if not sources:
+        print("No data was loaded. Exiting.")
+        return
+
+    total_transitions = sum(n if keep is None else int(keep.sum()) for _, n, keep, _ in sources)
+    keys = DATA_KEYS + _common_optional_keys([headers for _, _, _, headers in sources])
+
+    # --- Pass 2: copy into preallocated memmaps ---
+    print(f"\nCopying {total_transitions} transitions into {output_dir}...")
+    os.makedirs(output_dir, exist_ok=True)
+    for key in set(OPTIONAL_KEYS) - set(keys):
+        # load_combined would take the file of an earlier run for this one's
+        if os.path.exists(os.path.join(output_dir, key + ".npy")):
+            os.remove(os.path.join(output_dir, key + ".npy"))
+    outputs = {}
+    for key in keys:
+        shape, dtype = reference[key]
+        outputs[key] = np.lib.format.open_memmap(os.path.join(output_dir, key + ".npy"), mode="w+",
+                                                 dtype=dtype, shape=(total_transitions,) + tuple(shape[1:]))
+
+    offset = 0
+    for file_path, num_transitions, keep, _ in sources:
+        print(f"Copying {num_transitions} transitions from {file_path}...")
+        count = num_transitions if keep is None else int(keep.sum())
+        with np.load(file_path) as data:
+            for key in keys:
+                # one array of one file in memory at a time
+                values = data[key]
+                outputs[key][offset:offset + count] = values if keep is None else values[keep]
+        offset += count
+
+    for array in outputs.values():
+        array.flush()
+
+    print("\n--- Report ---")
+    print(f"Total files combined: {len(sources)} of {len(file_list)}")
+    if deduplicate:
+        print(f"Duplicate transitions dropped: {duplicates}")
+    print(f"Total transitions saved: {total_transitions}")
+    print(f"States array shape: {outputs['states'].shape}")
+    print(f"Actions array shape: {outputs['actions'].shape}")
+    print(f"Files saved to: {output_dir}")
+
+
+def load_combined(output_dir="combined_expert_data"):
+    """
+    The arrays written by combine_datasets_streaming as read-only memmaps, same keys as the .npz files.
+    """
+    return {key: np.load(os.path.join(output_dir, key + ".npy"), mmap_mode="r") for key in DATA_KEYS + OPTIONAL_KEYS
+            if key in DATA_KEYS or os.path.exists(os.path.join(output_dir, key + ".npy"))}
+
+
 if __name__ == "__main__":
     # Assumes your files are named "expert_data_1.npz", "expert_data_2.npz", etc.
-    combine_datasets(file_pattern="expert_data*.npz",
-                     output_file="combined_expert_data.npz")
\ No newline at end of file
+    combine_datasets_streaming(file_pattern="expert_data*.npz",
+                               output_dir="combined_expert_data")
\ No newline at end of file
@@ -1,7 +1,11 @@
 ﻿import numpy as np
 import numba
+from sklearn.linear_model import SGDClassifier
 from sklearn.svm import LinearSVC
 import glob
+import os
+
+from Lab4.play.combineData import load_combined
 
 # --- Constants for State Preprocessing ---
 # (Must match your agent's preprocessing)
@@ -17,7 +21,7 @@ MOVE_ACTIONS = [2, 3, 4, 5, 6, 7, 8, 9]
 
 # --- Helper functions to analyze states ---
 # These are needed to calculate our features.
-@numba.njit
+@numba.njit(cache=True)
 def _find_entities(state):
     """
     Finds player and enemies from a single (21, 21, 4) one-hot state.
@@ -36,7 +40,7 @@ def _find_entities(state):
     return player_pos, enemy_coords
 
 
-@numba.njit
+@numba.njit(cache=True)
 def _get_min_distance(player_pos, enemies):
     """Calculates min distance to an enemy."""
     if player_pos is None or len(enemies) == 0:
@@ -52,7 +56,7 @@ def _get_min_distance(player_pos, enemies):
 
 
 # --- The Core Feature Engineering Function ---
-@numba.njit
+@numba.njit(cache=True)
 def extract_features(state, action, next_state):
     """
     Calculates the feature vector for a single (s, a, s') transition.
@@ -114,21 +118,142 @@ def extract_features(state, action, next_state):
     ], dtype=np.float32)
 
 
-# --- Main IRL Function ---
-def find_reward_weights(data_file="combined_expert_data.npz", num_actions=18):
+# --- Batched Feature Extraction ---
+@numba.njit(cache=True)
+def _entity_summary(state):
+    """
+    What extract_features uses from _find_entities / _get_min_distance, without allocating.
+    :return: has_player, (player_y, player_x), num_enemies, has_min_distance, min_distance
+    """
+    h, w = state.shape[0], state.shape[1]
+    has_player = False
+    player_y, player_x = 0, 0
+    num_enemies = 0
+    for i in range(h):
+        for j in range(w):
+            if state[i, j, CAT_PLAYER] == 1 and not has_player:
+                has_player = True
+                player_y, player_x = i, j
+            if state[i, j, CAT_ENEMY] == 1:
+                num_enemies += 1
+
+    min_dist = 999
+    if has_player and num_enemies > 0:
+        for i in range(h):
+            for j in range(w):
+                if state[i, j, CAT_ENEMY] == 1:
+                    dist = abs(i - player_y) + abs(j - player_x)
+                    if dist < min_dist:
+                        min_dist = dist
+    return has_player, (player_y, player_x), num_enemies, has_player and num_enemies > 0, min_dist
+
+
+@numba.njit(cache=True)
+def _fill_irl_transition(states, actions, next_states, num_actions, out, n):
     """
-    Loads expert data and uses an SVM classifier to find the
-    implied reward function weights.
+    Row n * num_actions is the expert transition n, the next num_actions - 1 rows are the other
+    actions in increasing order, as find_reward_weights used to append them.
     """
+    prev_has_player, prev_pos, prev_num_enemies, prev_has_dist, prev_min_dist = _entity_summary(states[n])
+    has_player, pos, num_enemies, has_dist, min_dist = _entity_summary(next_states[n])
+
+    # action independent features
+    f_kill = 1.0 if num_enemies < prev_num_enemies else 0.0
+    f_proximity = 1.0 if (has_dist and min_dist <= 2) else 0.0
+    f_hunting = 1.0 if (prev_has_dist and has_dist and min_dist < prev_min_dist) else 0.0
+    f_death = 1.0 if (not has_player and prev_has_player) else 0.0
+    player_stayed = (has_player and prev_has_player and pos[0] == prev_pos[0] and pos[1] == prev_pos[1])
+
+    expert = actions[n]
+    row = n * num_actions
+    for k in range(num_actions):
+        if k == 0:
+            action = expert
+        else:
+            # the other actions, skipping the expert one
+            action = k - 1 if k - 1 < expert else k
+        is_move = 2 <= action <= 9
+        out[row + k, 0] = 0.0 if is_move else 1.0
+        out[row + k, 1] = 1.0 if (is_move and player_stayed) else 0.0
+        out[row + k, 2] = f_kill
+        out[row + k, 3] = f_proximity
+        out[row + k, 4] = f_hunting
+        out[row + k, 5] = f_death
+        out[row + k, 6] = 1.0
+
+
+@numba.njit(parallel=True, cache=True)
+def _fill_irl_features_parallel(states, actions, next_states, num_actions, out):
+    for n in numba.prange(actions.shape[0]):
+        _fill_irl_transition(states, actions, next_states, num_actions, out, n)
+
+
+@numba.njit(cache=True)
+def _fill_irl_features_serial(states, actions, next_states, num_actions, out):
+    for n in range(actions.shape[0]):
+        _fill_irl_transition(states, actions, next_states, num_actions, out, n)
+
+
+def extract_features_batch(states, actions, next_states, num_actions=18, single_thread=False):
+    """
+    extract_features for every transition and every action at once. The entities of each state are found
+    once instead of once per action, and the rows are written into one preallocated matrix.
+    Rows are independent, so the result is the same with or without threads, single_thread only avoids
+    starting numba's thread pool.
+    :return: X (N * num_actions, 7) float32, y (N * num_actions,) labels, 1 for the expert rows
+    """
+    actions = np.asarray(actions)
+    if actions.size > 0 and (actions.min() < 0 or actions.max() >= num_actions):
+        raise ValueError(f"Actions must be in [0, {num_actions}), got [{actions.min()}, {actions.max()}]")
+    out = np.empty((len(actions) * num_actions, 7), dtype=np.float32)
+    fill = _fill_irl_features_serial if single_thread else _fill_irl_features_parallel
+    fill(np.ascontiguousarray(states), actions, np.ascontiguousarray(next_states), num_actions, out)
+
+    labels = np.zeros(len(actions) * num_actions, dtype=np.int64)
+    labels[::num_actions] = 1
+    return out, labels
+
+
+FEATURE_NAMES = [
+    "Inaction (NOOP/FIRE)",
+    "Wall Collision",
+    "Kill Enemy",
+    "Proximity Penalty (<= 2)",
+    "Hunting (Closer to Enemy)",
+    "Death",
+    "Bias (Living Penalty)"
+]
+
+
+def print_reward_weights(weights):
+    print("\n--- 🏆 Implied Reward Weights ---")
+    print("These are the 'penalties' and 'bonuses' learned from your gameplay:")
+
+    for name, weight in zip(FEATURE_NAMES, weights):
+        print(f"  - {name + ':':<25} {weight:+.4f}")
+
+
+def _load_expert_data(data_file):
     print(f"Loading expert data from {data_file}...")
     try:
-        data = np.load(data_file)
-        states = data['states']
-        actions = data['actions']
-        next_states = data['next_states']
+        data = load_combined(data_file) if os.path.isdir(data_file) else np.load(data_file)
+        return data['states'], data['actions'], data['next_states']
     except Exception as e:
         print(f"Error loading {data_file}: {e}")
+        return None
+
+
+# --- Main IRL Function ---
+def find_reward_weights(data_file="combined_expert_data", num_actions=18, single_thread=False):
+    """
+    Loads expert data (an .npz file or a combine_datasets_streaming directory)
+    and uses an SVM classifier to find the implied reward function weights.
+    :param single_thread: build the features without numba threads (see extract_features_batch)
+    """
+    loaded = _load_expert_data(data_file)
+    if loaded is None:
         return
+    states, actions, next_states = loaded
 
     num_transitions = len(actions)
     if num_transitions == 0:
@@ -137,36 +262,8 @@ def find_reward_weights(data_file="combined_expert_data.npz", num_actions=18):
 
     print(f"Loaded {num_transitions} expert transitions.")
 
-    feature_vectors = []
-    labels = []
-
-    print("Generating feature vectors... This may take a moment.")
-
-    # Process the data (this is the slowest part)
-    for i in range(num_transitions):
-        if i % 5000 == 0:
-            print(f"  ...processing transition {i}/{num_transitions}")
-
-        s = states[i]
-        a_expert = actions[i]
-        s_next = next_states[i]
-
-        # 1. Add the "expert" feature vector
-        phi_expert = extract_features(s, a_expert, s_next)
-        feature_vectors.append(phi_expert)
-        labels.append(1)  # Label as "good"
-
-        # 2. Add "bad" feature vectors (all other actions)
-        for a_bad in range(num_actions):
-            if a_bad != a_expert:
-                # We assume "bad" actions would also lead to s_next
-                # This is a simplification, but effective
-                phi_bad = extract_features(s, a_bad, s_next)
-                feature_vectors.append(phi_bad)
-                labels.append(0)  # Label as "bad"
-
-    X = np.array(feature_vectors)
-    y = np.array(labels)
+    print("Generating feature vectors...")
+    X, y = extract_features_batch(states, actions, next_states, num_actions, single_thread)
 
     print(f"Generated {len(y)} total feature examples ({num_transitions} expert).")
 
@@ -184,26 +281,58 @@ def find_reward_weights(data_file="combined_expert_data.npz", num_actions=18):
 
     print("Training complete.")
 
-    # --- Print the Report ---
-    feature_names = [
-        "Inaction (NOOP/FIRE)",
-        "Wall Collision",
-        "Kill Enemy",
-        "Proximity Penalty (<= 2)",
-        "Hunting (Closer to Enemy)",
-        "Death",
-        "Bias (Living Penalty)"
-    ]
+    print_reward_weights(weights)
 
-    print("\n--- 🏆 Implied Reward Weights ---")
-    print("These are the 'penalties' and 'bonuses' learned from your gameplay:")
+    return weights
 
-    for name, weight in zip(feature_names, weights):
-        print(f"  - {name + ':':<25} {weight:+.4f}")
 
+def find_reward_weights_streaming(data_file="combined_expert_data", num_actions=18, chunk_size=20000,
+                                  epochs=3, alpha=None, seed=0, single_thread=False):
+    """
+    find_reward_weights trained chunk by chunk with a hinge-loss SGDClassifier.partial_fit, so only
+    chunk_size transitions and their features are in memory at a time (use a combine_datasets_streaming
+    directory, an .npz file is loaded whole by numpy). Every transition adds one expert and
+    num_actions - 1 other rows, so LinearSVC's class_weight='balanced' is known in advance and is
+    used as a fixed class_weight for every chunk. The weights are printed after every epoch, their
+    direction gets close to LinearSVC's within an epoch while their norm shrinks towards it much slower.
+    The loss is the plain hinge, LinearSVC's default is the squared hinge, so the weights approximate
+    LinearSVC's rather than minimize the same objective.
+    :param alpha: regularization, None for 1 / (rows in the dataset), the weight LinearSVC(C=1) gives it
+    :return: reward weights
+    """
+    loaded = _load_expert_data(data_file)
+    if loaded is None:
+        return
+    states, actions, next_states = loaded
+
+    num_transitions = len(actions)
+    if num_transitions == 0:
+        print("No transitions found.")
+        return
+    print(f"Streaming {num_transitions} expert transitions in chunks of {chunk_size}.")
+
+    num_rows = num_transitions * num_actions
+    class_weight = {1: num_actions / 2.0, 0: num_actions / (2.0 * (num_actions - 1))}
+    model = SGDClassifier(loss="hinge", fit_intercept=False, class_weight=class_weight, average=True,
+                          alpha=1.0 / num_rows if alpha is None else alpha, random_state=seed)
+
+    rng = np.random.default_rng(seed)
+    starts = np.arange(0, num_transitions, chunk_size)
+    for epoch in range(epochs):
+        for chunk, start in enumerate(rng.permutation(starts)):
+            stop = min(start + chunk_size, num_transitions)
+            X, y = extract_features_batch(states[start:stop], actions[start:stop], next_states[start:stop],
+                                          num_actions, single_thread)
+            order = rng.permutation(len(y))
+            model.partial_fit(X[order], y[order], classes=np.array([0, 1]))
+        print(f"  epoch {epoch + 1}/{epochs}: " + " ".join(f"{w:+.4f}" for w in model.coef_[0]))
+
+    weights = model.coef_[0].copy()
+    print("Training complete.")
+    print_reward_weights(weights)
     return weights
 
 
 if __name__ == "__main__":
     # Load the combined data and find the weights
-    learned_weights = find_reward_weights(data_file="combined_expert_data.npz")
\ No newline at end of file
+    learned_weights = find_reward_weights(data_file="combined_expert_data")
\ No newline at end of file
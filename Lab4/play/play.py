@@ -6,6 +6,10 @@ import cv2
 import numba
 import time
 
+from Lab4.env_analizators import make_palette_lut, decode_palette_exact
+from Lab4.play.recorder import EpisodeRecorder, export_npz
+from Lab4.state import CompactState
+
 # --- Constants for State Preprocessing ---
 # (Copied directly from your notebook)
 CONST_COLOR_PLAYER = (240, 170, 103)
@@ -18,32 +22,73 @@ CAT_WALL = 2
 CAT_ENEMY = 3
 
 
+CATEGORICAL_PALETTE_LUT, CATEGORICAL_PALETTE_RGB = make_palette_lut([
+    (CONST_COLOR_PLAYER, CAT_PLAYER),
+    (CONST_COLOR_WALL, CAT_WALL),
+    (CONST_COLOR_ENEMY, CAT_ENEMY),
+])
+
+
 # --- State Preprocessing Function (One-Hot) ---
-# (Copied directly from your notebook)
-@numba.njit
+@numba.njit(cache=True)
 def prepare_state_categorical_inner_onehot(obs_resized, h, w):
     """Converts a 21x21x3 uint8 frame to a 21x21x4 one-hot state."""
+    categories, _ = decode_palette_exact(obs_resized, CATEGORICAL_PALETTE_LUT, CATEGORICAL_PALETTE_RGB, CAT_ENEMY)
     new_obs = np.full((h, w, 4), 0, dtype=np.uint8)
     for i in range(h):
         for j in range(w):
-            pixel = obs_resized[i, j]
-            if (pixel[0] == CONST_COLOR_PLAYER[0] and
-                    pixel[1] == CONST_COLOR_PLAYER[1] and
-                    pixel[2] == CONST_COLOR_PLAYER[2]):
-                new_obs[i, j, CAT_PLAYER] = 1
-            elif (pixel[0] == CONST_COLOR_WALL[0] and
-                  pixel[1] == CONST_COLOR_WALL[1] and
-                  pixel[2] == CONST_COLOR_WALL[2]):
-                new_obs[i, j, CAT_WALL] = 1
-            elif (pixel[0] == CONST_COLOR_ENEMY[0] and
-                  pixel[1] == CONST_COLOR_ENEMY[1] and
-                  pixel[2] == CONST_COLOR_ENEMY[2]):
-                new_obs[i, j, CAT_ENEMY] = 1
-            else:
-                new_obs[i, j, CAT_EMPTY] = 1
+            new_obs[i, j, categories[i, j]] = 1
     return new_obs
 
 
+@numba.njit(cache=True)
+def categorical_active_features(onehot):
+    """
+    Indices into onehot.reshape(-1) of the cells that are not CAT_EMPTY, the active features of a
+    SparseSarsa over the one-hot grid. The empty channel is left out: every cell has exactly one category,
+    so its weights only add a per-action constant, which the bias already is.
+    """
+    n_categories = onehot.shape[2]
+    active = np.empty(onehot.shape[0] * onehot.shape[1], dtype=np.int64)
+    n = 0
+    for i in range(onehot.shape[0]):
+        for j in range(onehot.shape[1]):
+            for c in range(n_categories):
+                if c != CAT_EMPTY and onehot[i, j, c]:
+                    active[n] = (i * onehot.shape[1] + j) * n_categories + c
+                    n += 1
+    return active[:n]
+
+
+@numba.njit(cache=True)
+def categorical_active_features_batch(onehots):
+    """
+    categorical_active_features of every grid, in CSR layout.
+    :return: indices, indptr: the active features of grid n are indices[indptr[n]:indptr[n + 1]]
+    """
+    n_grids, h, w, n_categories = onehots.shape
+    indptr = np.zeros(n_grids + 1, dtype=np.int64)
+    for n in range(n_grids):
+        count = 0
+        for i in range(h):
+            for j in range(w):
+                for c in range(n_categories):
+                    if c != CAT_EMPTY and onehots[n, i, j, c]:
+                        count += 1
+        indptr[n + 1] = indptr[n] + count
+
+    indices = np.empty(indptr[n_grids], dtype=np.int64)
+    for n in range(n_grids):
+        k = indptr[n]
+        for i in range(h):
+            for j in range(w):
+                for c in range(n_categories):
+                    if c != CAT_EMPTY and onehots[n, i, j, c]:
+                        indices[k] = (i * w + j) * n_categories + c
+                        k += 1
+    return indices, indptr
+
+
 def prepare_state_categorical(frame, h=21, w=21):
     """Resize and one-hot encode a raw game frame."""
     obs_resized = cv2.resize(frame, (w, h), interpolation=cv2.INTER_NEAREST)
@@ -94,9 +139,11 @@ def get_human_action(keys):
         return 0  # NOOP (no keys pressed)
 
 
-def record_episodes(num_episodes=5, output_file="expert_data.npz"):
+def record_episodes(num_episodes=5, output_dir="expert_data", chunk_size=4096):
     """
-    Play the game for a number of episodes and save the trajectory data.
+    Play the game for a number of episodes and stream the trajectory data to output_dir
+    (see recorder.EpisodeRecorder). Recording again into the same directory appends episodes,
+    also after an interrupted session. recorder.export_npz converts it to an expert_data*.npz file.
     """
 
     # Initialize Pygame and the environment
@@ -107,24 +154,29 @@ def record_episodes(num_episodes=5, output_file="expert_data.npz"):
 
     env = gym.make("ALE/Berzerk-v5", render_mode="human", frameskip=4)
 
+    recorder = EpisodeRecorder(output_dir, frame_shape=(21, 21, 4), chunk_size=chunk_size, compact_states=True)
+
     print("-" * 50)
     print("Berzerk Data Recorder Initialized.")
     print("Controls: Arrow keys OR WASD to move, SPACE to fire.")
     print(f"Recording {num_episodes} episodes...")
+    if recorder.rows > 0:
+        print(f"Resuming {output_dir}: {recorder.episodes} episodes, {recorder.rows} frames already recorded.")
     print("The game window may take a moment to appear.")
     print("-" * 50)
 
-    # List to hold all transitions (S, A, R, S', Done)
-    trajectory_data = []
+    quit_recording = False
 
     for ep in range(num_episodes):
+        if quit_recording:
+            break
         print(f"Starting Episode {ep + 1}/{num_episodes}...")
 
         # Get the first raw state
         raw_state, _ = env.reset()
 
         # Preprocess it to get the agent's view
-        state = prepare_state_categorical(raw_state)
+        recorder.begin_episode(prepare_state_categorical(raw_state), CompactState(raw_state).compact_row())
 
         done = False
         total_reward = 0
@@ -147,14 +199,11 @@ def record_episodes(num_episodes=5, output_file="expert_data.npz"):
             next_raw_state, reward, terminated, truncated, _ = env.step(action)
             done = terminated or truncated
 
-            # 4. Preprocess the *next* state
-            next_state = prepare_state_categorical(next_raw_state)
-
-            # 5. Store the transition
-            trajectory_data.append((state, action, reward, next_state, done))
+            # 4. Preprocess the *next* state and store the transition,
+            # the recorder keeps each frame once (next_state is the next row's state)
+            recorder.append(action, reward, prepare_state_categorical(next_raw_state), done,
+                            CompactState(next_raw_state).compact_row())
 
-            # 6. Update for next loop
-            state = next_state
             total_reward += reward
 
             # Optional: Add a small delay. The "human" render mode
@@ -162,37 +211,17 @@ def record_episodes(num_episodes=5, output_file="expert_data.npz"):
             # This sleep helps ensure we don't overwhelm the event pump.
             time.sleep(1 / 60)  # Sleep for 1/60th of a second
 
+        recorder.end_episode()
         print(f"Episode {ep + 1} finished. Total Score: {total_reward}")
 
     env.close()
     pygame.quit()
+    recorder.close()
 
-    print("\nRecording complete. Saving data...")
-
-    # --- Save the Data ---
-    # Convert list of tuples into separate NumPy arrays for efficiency
-    try:
-        states = np.array([t[0] for t in trajectory_data], dtype=np.uint8)
-        actions = np.array([t[1] for t in trajectory_data], dtype=np.int32)
-        rewards = np.array([t[2] for t in trajectory_data], dtype=np.float32)
-        next_states = np.array([t[3] for t in trajectory_data], dtype=np.uint8)
-        dones = np.array([t[4] for t in trajectory_data], dtype=bool)
-
-        np.savez_compressed(output_file,
-                            states=states,
-                            actions=actions,
-                            rewards=rewards,
-                            next_states=next_states,
-                            dones=dones)
-
-        print(f"Successfully saved {len(trajectory_data)} transitions to {output_file}")
-
-    except Exception as e:
-        print(f"Error saving data: {e}")
-        print("Saving as a raw .npy file as a fallback.")
-        np.save(output_file.replace('.npz', '.npy'), trajectory_data)
+    print(f"\nRecording complete. {recorder.episodes} episodes, {recorder.rows} frames saved to {output_dir}")
 
 
 if __name__ == "__main__":
-    # Record 5 episodes and save to "expert_data.npz"
-    record_episodes(num_episodes=5, output_file="expert_data.npz")
\ No newline at end of file
+    # Record 5 episodes into "expert_data/" and export them for combineData.py
+    record_episodes(num_episodes=5, output_dir="expert_data")
+    export_npz("expert_data", "expert_data.npz")
\ No newline at end of file
@@ -0,0 +1,179 @@
+﻿import argparse
+import os
+import time
+
+import numpy as np
+
+from Lab4.examinator import Examinator
+from Lab4.play.combineData import load_combined
+from Lab4.play.play import categorical_active_features_batch
+from Lab4.sarsa import Sarsa, SparseSarsa, TileCodedSarsa
+from Lab4.state import _HAS_PLAYER, _IS_EMPTY, compact_rows_as_vectors
+
+# default step sizes: the binary features of the sparse models, and as_vector, whose inverse wall distances
+# reach 1000 (the TD steps of a minibatch of those diverge from about 5e-7 on)
+SPARSE_ALPHA = 1e-3
+VECTOR_ALPHA = 1e-7
+
+
+def open_expert_data(data_file):
+    """
+    :param data_file: combine_datasets_streaming directory (memmaps, streamed) or an expert_data*.npz file
+    :return: dict of states, actions, rewards, next_states, dones
+    """
+    return load_combined(data_file) if os.path.isdir(data_file) else np.load(data_file)
+
+
+def next_actions_in_chunk(data, start, stop):
+    """
+    The action taken in each next_state of rows start..stop, -1 when it is not known: after the last step
+    of an episode, and where the next row does not continue the trajectory (deduplicated or shuffled data).
+    """
+    following_actions = np.asarray(data["actions"][start + 1:stop + 1], dtype=np.int64)
+    n = len(following_actions)
+    continues = np.all(np.asarray(data["states"][start + 1:start + 1 + n]) ==
+                       np.asarray(data["next_states"][start:start + n]), axis=(1, 2, 3))
+    continues &= ~np.asarray(data["dones"][start:start + n], dtype=np.bool_)
+    next_actions = np.full(stop - start, -1, dtype=np.int64)
+    next_actions[:n] = np.where(continues, following_actions, -1)
+    return next_actions
+
+
+def _encode(model, data, key, start, stop):
+    """
+    :param key: "states" or "next_states"
+    :return: features of the rows start..stop for model: the (N, state_dim) as_vector of the compact states
+             for Sarsa, active indices in CSR layout (indices, indptr) for the sparse models, the tiles of
+             as_vector for TileCodedSarsa and the one-hot grids for SparseSarsa
+    """
+    if isinstance(model, SparseSarsa) and not isinstance(model, TileCodedSarsa):
+        return categorical_active_features_batch(np.asarray(data[key][start:stop]))
+    vectors = compact_rows_as_vectors(data[key.replace("states", "compact_states")][start:stop])
+    if not isinstance(model, TileCodedSarsa):
+        return vectors
+    indices = model.tile_coder.encode_batch(vectors)
+    return indices.reshape(-1), np.arange(len(vectors) + 1, dtype=np.int64) * indices.shape[1]
+
+
+def _q_values(model, features, rows):
+    if isinstance(features, tuple):
+        return model.q_values_batch(features[0], features[1], rows)
+    return features[rows].dot(model.w.T) + model.b
+
+
+def _td0_update(model, features, rows, actions, deltas):
+    if isinstance(features, tuple):
+        model.td0_update_batch(features[0], features[1], rows, actions, deltas)
+    else:
+        model.td0_update_batch(features[rows], actions, deltas)
+
+
+def pretrain(data_file="combined_expert_data", model=None, epochs=3, chunk_size=20000, batch_size=256,
+             alpha=None, target="sarsa", reward_scale=1.0 / Examinator.ENV_REWARD_DESCALE, seed=0,
+             num_actions=18):
+    """
+    Offline TD training on the expert data, without an env. The model is a Sarsa (default) or
+    TileCodedSarsa over the as_vector features of the recorded compact states, the features Trainer.train
+    and evaluate use, so the saved weights are a start for them: Trainer().train(Sarsa.load(file), ...).
+    A SparseSarsa is trained on the one-hot grids instead (the 21x21x4 states prepare_state_categorical
+    records), which also older recordings without compact states have; nothing else in the repo plays it.
+    Chunks of chunk_size transitions are read in random order (contiguous reads from the memmaps),
+    encoded in one batch, shuffled and split into minibatches of batch_size, each one
+    td0_update_batch with deltas from the weights before it. With as_vector features, transitions from
+    an empty state are skipped and an empty next state or one without the player ends the episode, as
+    in Trainer.train.
+    :param target: "sarsa" bootstraps from the expert's next action, "q" from the best next action;
+                   "sarsa" falls back to the best action where the next action is not in the data
+    :param alpha: step size of the pretraining, SPARSE_ALPHA for the sparse models and VECTOR_ALPHA for Sarsa
+                  if None; the model gets its own alpha back at the end
+    :param reward_scale: env rewards are scaled like Examinator does before training
+    :return: the model, list of per epoch stats
+    """
+    if target not in ("sarsa", "q"):
+        raise ValueError(f"target must be 'sarsa' or 'q', not {target!r}")
+    data = open_expert_data(data_file)
+    num_transitions = len(data["actions"])
+    if model is None:
+        model = Sarsa(num_actions)
+    grids = isinstance(model, SparseSarsa) and not isinstance(model, TileCodedSarsa)
+    if not grids and "compact_states" not in data:
+        raise ValueError(f"{data_file} was recorded without compact states, only a SparseSarsa over the grids "
+                         f"can be pretrained on it")
+    online_alpha = model.alpha
+    model.alpha = alpha if alpha is not None else SPARSE_ALPHA if isinstance(model, SparseSarsa) else VECTOR_ALPHA
+    model.reset_traces()
+    print(f"Pretraining on {num_transitions} transitions of {data_file}, {epochs} epochs, "
+          f"chunks of {chunk_size}, minibatches of {batch_size}.")
+
+    rng = np.random.default_rng(seed)
+    starts = np.arange(0, num_transitions, chunk_size)
+    history = []
+    for epoch in range(epochs):
+        start_time = time.perf_counter()
+        encode_seconds = 0.0
+        abs_delta = 0.0
+        for start in rng.permutation(starts):
+            stop = min(start + chunk_size, num_transitions)
+            encode_start = time.perf_counter()
+            features = _encode(model, data, "states", start, stop)
+            next_features = _encode(model, data, "next_states", start, stop)
+            actions = np.asarray(data["actions"][start:stop], dtype=np.int64)
+            rewards = np.asarray(data["rewards"][start:stop], dtype=np.float64) * reward_scale
+            not_done = 1.0 - np.asarray(data["dones"][start:stop], dtype=np.float64)
+            order = rng.permutation(stop - start)
+            if not grids:
+                states = np.asarray(data["compact_states"][start:stop])
+                next_states = np.asarray(data["next_compact_states"][start:stop])
+                not_done *= (next_states[:, _IS_EMPTY] == 0) & (next_states[:, _HAS_PLAYER] == 1)
+                order = order[states[order, _IS_EMPTY] == 0]
+            next_actions = next_actions_in_chunk(data, start, stop) if target == "sarsa" else None
+            encode_seconds += time.perf_counter() - encode_start
+
+            for batch_start in range(0, len(order), batch_size):
+                rows = order[batch_start:batch_start + batch_size]
+                q = _q_values(model, features, rows)
+                q_next = _q_values(model, next_features, rows)
+                bootstrap = q_next.max(axis=1)
+                if next_actions is not None:
+                    known = next_actions[rows] >= 0
+                    bootstrap[known] = q_next[known, next_actions[rows][known]]
+                deltas = rewards[rows] + model.gamma * not_done[rows] * bootstrap - q[np.arange(len(rows)),
+                                                                                      actions[rows]]
+                _td0_update(model, features, rows, actions[rows], deltas)
+                abs_delta += np.abs(deltas).sum()
+
+        seconds = time.perf_counter() - start_time
+        stats = {"epoch": epoch + 1, "transitions": num_transitions, "seconds": seconds,
+                 "transitions_per_second": num_transitions / seconds, "encode_seconds": encode_seconds,
+                 "mean_abs_delta": abs_delta / num_transitions}
+        history.append(stats)
+        print(f"  epoch {epoch + 1}/{epochs}: {stats['transitions_per_second']:,.0f} transitions/s "
+              f"({encode_seconds / seconds:.0%} encoding), mean |delta| {stats['mean_abs_delta']:.4f}")
+    model.alpha = online_alpha
+    return model, history
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pretrain a Sarsa policy on recorded expert data.")
+    parser.add_argument("data", nargs="?", default="combined_expert_data",
+                        help="combine_datasets_streaming directory or expert_data*.npz file")
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--chunk-size", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--alpha", type=float, default=None, help="default SPARSE_ALPHA or VECTOR_ALPHA")
+    parser.add_argument("--target", choices=["sarsa", "q"], default="sarsa")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", choices=["sarsa", "tile", "grid"], default="sarsa",
+                        help="Sarsa or TileCodedSarsa over as_vector, SparseSarsa over the one-hot grids")
+    parser.add_argument("-o", "--output", default="sarsa-pretrained.npz")
+    args = parser.parse_args()
+
+    if args.model == "grid":
+        # the 21x21 grids of 4 categories of prepare_state_categorical
+        model = SparseSarsa(18, 21 * 21 * 4)
+    else:
+        model = TileCodedSarsa(18) if args.model == "tile" else Sarsa(18)
+    trained, _ = pretrain(args.data, model, epochs=args.epochs, chunk_size=args.chunk_size,
+                          batch_size=args.batch_size, alpha=args.alpha, target=args.target, seed=args.seed)
+    trained.save(args.output)
+    print(f"Saved weights to {args.output}")
\ No newline at end of file
@@ -0,0 +1,202 @@
+﻿import json
+import os
+
+import numpy as np
+
+from Lab4.state import COMPACT_STATE_SIZE
+
+INDEX_FILE = "index.json"
+NO_ACTION = -1
+
+
+def row_dtype(frame_shape, compact_states=False):
+    """
+    One recorded row: a frame and the transition taken from it. The last frame of an episode has
+    action NO_ACTION, its next frame is the row below otherwise. With compact_states the row also keeps
+    the CompactState row of the env frame (compact_row), what Sarsa's as_vector features are made of.
+    """
+    fields = [
+        ("frame", np.uint8, tuple(frame_shape)),
+        ("action", np.int32),
+        ("reward", np.float32),
+        ("done", np.bool_),
+    ]
+    if compact_states:
+        fields.append(("compact", np.int16, (COMPACT_STATE_SIZE,)))
+    return np.dtype(fields)
+
+
+class EpisodeRecorder:
+    """
+    Streams (state, action, reward, next_state, done) transitions to disk instead of keeping them in memory.
+    Every frame is stored once, next_state being the frame of the following row. Rows go into preallocated
+    memory-mapped shards of chunk_size rows, and index.json records how many rows of each shard are complete.
+    The index is rewritten every flush_every rows and at the end of every episode, opening an existing
+    directory resumes after the last recorded row.
+    compact_states applies to a new directory, an existing one keeps what it was recorded with; the
+    compact rows given to begin_episode / append are ignored if it has none.
+    """
+
+    def __init__(self, path, frame_shape=(21, 21, 4), chunk_size=4096, flush_every=256, compact_states=False):
+        self.path = path
+        self.flush_every = flush_every
+        self._shard = None
+        self._since_flush = 0
+
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            self._index = _read_index(path)
+            if tuple(self._index["frame_shape"]) != tuple(frame_shape):
+                raise ValueError(f"{path} holds frames of shape {tuple(self._index['frame_shape'])}, "
+                                 f"not {tuple(frame_shape)}")
+            self._reopen_last_shard()
+        else:
+            os.makedirs(path, exist_ok=True)
+            self._index = {"frame_shape": list(frame_shape), "chunk_size": chunk_size, "episodes": 0, "shards": [],
+                           "compact_states": compact_states}
+        self.compact_states = self._index.get("compact_states", False)
+        self.dtype = row_dtype(self._index["frame_shape"], self.compact_states)
+
+    @property
+    def rows(self):
+        return sum(shard["rows"] for shard in self._index["shards"])
+
+    @property
+    def episodes(self):
+        return self._index["episodes"]
+
+    def _reopen_last_shard(self):
+        if not self._index["shards"]:
+            return
+        last = self._index["shards"][-1]
+        self._shard = np.lib.format.open_memmap(os.path.join(self.path, last["file"]), mode="r+")
+        if last["rows"] > 0:
+            # rows after the index may have been written before an interruption, the stream ends here now
+            self._shard["action"][last["rows"] - 1] = NO_ACTION
+
+    def _new_shard(self):
+        name = f"shard_{len(self._index['shards']):05d}.npy"
+        self._shard = np.lib.format.open_memmap(os.path.join(self.path, name), mode="w+", dtype=self.dtype,
+                                                shape=(self._index["chunk_size"],))
+        self._index["shards"].append({"file": name, "rows": 0})
+
+    def _append_frame(self, frame, compact_row):
+        if self._shard is None or self._index["shards"][-1]["rows"] == self._shard.shape[0]:
+            if self._shard is not None:
+                self._shard.flush()
+            self._new_shard()
+        last = self._index["shards"][-1]
+        row = self._shard[last["rows"]]
+        row["frame"] = frame
+        row["action"] = NO_ACTION
+        row["reward"] = 0.0
+        row["done"] = False
+        if self.compact_states:
+            if compact_row is None:
+                raise ValueError(f"{self.path} records compact states, pass the compact row of every frame")
+            row["compact"] = compact_row
+        last["rows"] += 1
+
+        self._since_flush += 1
+        if self._since_flush >= self.flush_every:
+            self.flush()
+
+    def _last_row(self):
+        last = self._index["shards"][-1]
+        return self._shard[last["rows"] - 1]
+
+    def begin_episode(self, state, compact_row=None):
+        """
+        :param compact_row: CompactState(env frame).compact_row(), needed if compact_states
+        """
+        self._append_frame(state, compact_row)
+
+    def append(self, action, reward, next_state, done, next_compact_row=None):
+        """
+        Records the transition from the last frame, next_state becomes the last frame.
+        """
+        row = self._last_row()
+        row["action"] = action
+        row["reward"] = reward
+        row["done"] = done
+        self._append_frame(next_state, next_compact_row)
+
+    def end_episode(self):
+        self._index["episodes"] += 1
+        self.flush()
+
+    def flush(self):
+        """
+        Writes the shard pages and then the index, so the index never points at rows that are not on disk.
+        """
+        if self._shard is not None:
+            self._shard.flush()
+        tmp_path = os.path.join(self.path, INDEX_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp_path, os.path.join(self.path, INDEX_FILE))
+        self._since_flush = 0
+
+    def close(self):
+        self.flush()
+        self._shard = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _read_index(path):
+    with open(os.path.join(path, INDEX_FILE)) as f:
+        return json.load(f)
+
+
+def open_shards(path):
+    """
+    :return: list of read-only memmaps with the complete rows of each shard
+    """
+    index = _read_index(path)
+    return [np.load(os.path.join(path, shard["file"]), mmap_mode="r")[:shard["rows"]] for shard in index["shards"]]
+
+
+def _load_rows(path):
+    shards = open_shards(path)
+    if shards:
+        return np.concatenate(shards)
+    index = _read_index(path)
+    return np.empty(0, dtype=row_dtype(index["frame_shape"], index.get("compact_states", False)))
+
+
+def load_recording(path):
+    """
+    :return: frames, actions, rewards, dones of all rows, loaded into memory
+    """
+    rows = _load_rows(path)
+    return rows["frame"], rows["action"], rows["reward"], rows["done"]
+
+
+def load_transitions(path):
+    """
+    The recording in the layout record_episodes used to save: states, actions, rewards, next_states, dones.
+    states and next_states are copies of the frames, this doubles the memory of load_recording.
+    """
+    frames, actions, rewards, dones = load_recording(path)
+    rows = np.flatnonzero(actions != NO_ACTION)
+    return frames[rows], actions[rows], rewards[rows], frames[rows + 1], dones[rows]
+
+
+def export_npz(path, output_file):
+    """
+    Saves the recording as an expert_data*.npz file for combineData / findCoeff, with compact_states and
+    next_compact_states (for pretrain) if it was recorded with them.
+    """
+    states, actions, rewards, next_states, dones = load_transitions(path)
+    arrays = dict(states=states, actions=actions, rewards=rewards, next_states=next_states, dones=dones)
+    rows = _load_rows(path)
+    if "compact" in rows.dtype.names:
+        transitions = np.flatnonzero(rows["action"] != NO_ACTION)
+        arrays.update(compact_states=rows["compact"][transitions],
+                      next_compact_states=rows["compact"][transitions + 1])
+    np.savez_compressed(output_file, **arrays)
+    return len(actions)
\ No newline at end of file
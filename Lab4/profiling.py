@@ -0,0 +1,154 @@
+﻿import json
+import time
+
+import numpy as np
+
+# histogram buckets: SUB_BUCKETS per power of two of nanoseconds, up to 2 ** MAX_BITS ns (about 69 s)
+SUB_BUCKET_BITS = 2
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_BITS = 36
+N_BUCKETS = (MAX_BITS + 1) * SUB_BUCKETS
+
+
+def _bucket_upper_ns():
+    """
+    :return: (N_BUCKETS,) largest duration in ns that falls into each bucket of StageProfiler.lap
+    """
+    upper = np.zeros(N_BUCKETS, dtype=np.float64)
+    for bits in range(MAX_BITS + 1):
+        for sub in range(SUB_BUCKETS):
+            if bits <= SUB_BUCKET_BITS:
+                # below 2 ** SUB_BUCKET_BITS ns the bucket is the duration itself
+                upper[bits * SUB_BUCKETS + sub] = (1 << bits) - 1 if sub == 0 else 0
+            else:
+                shift = bits - 1 - SUB_BUCKET_BITS
+                upper[bits * SUB_BUCKETS + sub] = ((SUB_BUCKETS + sub + 1) << shift) - 1
+    return upper
+
+
+BUCKET_UPPER_NS = _bucket_upper_ns()
+
+
+def percentile_from_histogram(counts, q):
+    """
+    :param counts: (N_BUCKETS,) counts of one stage
+    :return: upper bound in ns of the bucket holding the q-th percentile, within 1 / SUB_BUCKETS of
+             the true value, 0 if there are no samples
+    """
+    total = counts.sum()
+    if total == 0:
+        return 0.0
+    return float(BUCKET_UPPER_NS[np.searchsorted(np.cumsum(counts), q / 100 * total)])
+
+
+class NullProfiler:
+    """
+    The profiler of an uninstrumented run: the hooks cost one method call each and record nothing.
+    """
+    enabled = False
+
+    def start(self):
+        return 0
+
+    def lap(self, stage, start):
+        return 0
+
+    def report(self, episode):
+        pass
+
+    def close(self):
+        pass
+
+
+class StageProfiler:
+    """
+    Durations of the stages of a training step, from the monotonic clock, counted in fixed histograms
+    of N_BUCKETS log-spaced buckets per stage, so recording allocates nothing. Timing a sequence of
+    stages costs one clock read per stage:
+        t = profiler.start()
+        ... env.step ...
+        t = profiler.lap(ENV_STEP, t)
+        ... State ...
+        t = profiler.lap(STATE, t)
+    report prints p50 / p99 per stage over the episodes since the previous report and appends them as one
+    JSON line to file_name.
+    """
+    enabled = True
+
+    def __init__(self, stages, file_name=None):
+        self.stages = list(stages)
+        self.file_name = file_name
+        self._clock = time.perf_counter_ns
+        self._counts = [0] * (len(self.stages) * N_BUCKETS)
+        self._total_ns = [0] * len(self.stages)
+        self._file = open(file_name, "a") if file_name else None
+        self._last_report = self._clock()
+
+    def start(self):
+        return self._clock()
+
+    def lap(self, stage, start):
+        """
+        Records now - start for stage.
+        :return: now, the start of the next stage
+        """
+        now = self._clock()
+        ns = now - start
+        bits = ns.bit_length()
+        if bits > SUB_BUCKET_BITS:
+            bucket = (bits * SUB_BUCKETS + ((ns >> (bits - 1 - SUB_BUCKET_BITS)) & (SUB_BUCKETS - 1))
+                      if bits <= MAX_BITS else N_BUCKETS - 1)
+        else:
+            bucket = bits * SUB_BUCKETS
+        self._counts[stage * N_BUCKETS + bucket] += 1
+        self._total_ns[stage] += ns
+        return now
+
+    def histograms(self):
+        """
+        :return: (n_stages, N_BUCKETS) counts since the last report
+        """
+        return np.array(self._counts, dtype=np.int64).reshape(len(self.stages), N_BUCKETS)
+
+    def summary(self):
+        """
+        :return: per stage calls, total seconds, share of the timed time, mean / p50 / p99 in microseconds
+        """
+        counts = self.histograms()
+        timed_ns = max(1, sum(self._total_ns))
+        stages = {}
+        for s, name in enumerate(self.stages):
+            calls = int(counts[s].sum())
+            stages[name] = {
+                "calls": calls,
+                "seconds": self._total_ns[s] / 1e9,
+                "share": self._total_ns[s] / timed_ns,
+                "mean_us": self._total_ns[s] / max(1, calls) / 1e3,
+                "p50_us": percentile_from_histogram(counts[s], 50) / 1e3,
+                "p99_us": percentile_from_histogram(counts[s], 99) / 1e3,
+            }
+        return stages
+
+    def report(self, episode):
+        """
+        Prints and writes the summary since the last report, then starts a new period.
+        """
+        now = self._clock()
+        stages = self.summary()
+        print(f"  stage timings over {(now - self._last_report) / 1e9:.1f}s:")
+        for name, stats in stages.items():
+            print(f"    {name:<12} {stats['calls']:>8} calls {stats['share']:>6.1%} "
+                  f"p50 {stats['p50_us']:>9.1f}us p99 {stats['p99_us']:>9.1f}us")
+        if self._file is not None:
+            record = {"episode": episode, "wall_seconds": (now - self._last_report) / 1e9,
+                      "stages": stages}
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+        self._counts[:] = [0] * len(self._counts)
+        self._total_ns[:] = [0] * len(self._total_ns)
+        self._last_report = now
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
\ No newline at end of file
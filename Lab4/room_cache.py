@@ -0,0 +1,70 @@
+﻿from collections import OrderedDict
+
+import numpy as np
+
+from Lab4.env_analizators import border_hash, fill_holes_recorded, apply_fill_plan, fill_plan_template
+
+
+class _RoomEntry:
+    def __init__(self, shape, plan):
+        self.shape = shape
+        self.plan = plan
+        self._template = None
+
+    def template(self):
+        if self._template is None:
+            self._template = fill_plan_template(self.shape, self.plan)
+        return self._template
+
+
+class RoomCache:
+    """
+    LRU cache of hole filling per room. fill_holes only reads the border of the index map, so the key is
+    the map shape plus a hash of its border, and the value is the ordered list of rectangles fill_holes
+    filled (walls patched and portals), which is replayed on a hit instead of walking the border again.
+    """
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._rooms = OrderedDict()
+        self._plan_buffer = np.empty((0, 5), dtype=np.int32)
+
+    def __len__(self):
+        return len(self._rooms)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def clear(self):
+        self._rooms.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def fill_holes(self, state):
+        """
+        Same result as env_analizators.fill_holes(state), in place.
+        :return: the room entry, its template() is built on first use
+        """
+        key = (state.shape, int(border_hash(state)))
+        entry = self._rooms.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._rooms.move_to_end(key)
+            apply_fill_plan(state, entry.plan)
+            return entry
+
+        self.misses += 1
+        perimeter = 2 * (state.shape[0] + state.shape[1])
+        if self._plan_buffer.shape[0] < perimeter:
+            self._plan_buffer = np.empty((perimeter, 5), dtype=np.int32)
+        n_rects = fill_holes_recorded(state, self._plan_buffer)
+
+        entry = _RoomEntry(state.shape, self._plan_buffer[:n_rects].copy())
+        self._rooms[key] = entry
+        if len(self._rooms) > self.capacity:
+            self._rooms.popitem(last=False)
+        return entry
\ No newline at end of file
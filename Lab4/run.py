@@ -1,38 +1,22 @@
 ﻿import numpy as np
-from ale_py import ALEInterface
-import gymnasium as gym
 
-from Lab4.state import State
-from sarsa import Sarsa
+from Lab4.evaluate import load_agent, make_env, run_episode
+from Lab4.room_cache import RoomCache
+from Lab4.state import IncrementalStateBuilder
 
-agent = Sarsa.load("sarsa-weights-berzerk.npz")
+# watches a few episodes, use evaluate.py for scores
+agent = load_agent("sarsa-weights-berzerk.npz")
 
-test_env = gym.make("ALE/Berzerk-v5", render_mode="human")
+test_env = make_env(render_mode="human")
 agent.restrict_exploration()
+builder = IncrementalStateBuilder(room_cache=RoomCache())
 
 n_episodes = 5
 total_rewards = []
 
 for ep in range(n_episodes):
-    state, _ = test_env.reset()
-    done = False
-    ep_reward = 0
-
-    actions_count = np.zeros(test_env.action_space.n, dtype=np.int32)
-    while not done:
-        feature_state = State(state)
-        if feature_state.is_empty:
-            action = 0
-        else:
-            action, _ = agent.epsilon_greedy(feature_state.as_vector())
-        actions_count[action] += 1
-        next_state, reward, terminated, truncated, _ = test_env.step(action)
-        done = terminated or truncated
-
-        state = next_state
-        ep_reward += reward
-
-    # test_env.render()
+    ep_reward, _, actions_count = run_episode(test_env, agent, builder)
+
     print(f"Episode {ep + 1}: Total Reward = {ep_reward}")
     print(f'Action count during round: {actions_count}')
     print('---------------------------')
@@ -1,6 +1,148 @@
-﻿import numpy as np
+﻿import numba
+import numpy as np
 
 from Lab4.state import VECTOR_STATE_SIZE
+from Lab4.tile_coding import TileCoder
+
+
+@numba.njit(cache=True)
+def _td_step(w, b, z_w, z_b, features, action, delta, alpha, trace_decay, weight_keep, z_clip):
+    """
+    In-place SARSA(lambda) step: decay traces, add phi(s, a), update and decay weights, clip traces.
+    Matches the float32 arithmetic of the numpy version without allocating phi_w / phi_b.
+    """
+    step = alpha * delta
+    for a in range(w.shape[0]):
+        for j in range(w.shape[1]):
+            z = trace_decay * z_w[a, j]
+            if a == action:
+                z += features[j]
+            w[a, j] = (w[a, j] + step * z) * weight_keep
+            z_w[a, j] = min(max(z, -z_clip), z_clip)
+
+        z = trace_decay * z_b[a]
+        if a == action:
+            z += np.float32(1.0)
+        b[a] = (b[a] + step * z) * weight_keep
+        z_b[a] = min(max(z, -z_clip), z_clip)
+
+
+# SparseSarsa keeps w = weight_scale * (u + trace_gain * y) and z = trace_scale * y, see SparseSarsa
+TRACE_SCALE = 0
+WEIGHT_SCALE = 1
+TRACE_GAIN = 2
+# scales below this are folded back into u and y, before 1 / scale costs precision
+FOLD_THRESHOLD = 1e-6
+# traces that decayed below this are dropped when folding, their weight updates are below float32 resolution
+TRACE_DROP = 1e-9
+
+
+@numba.njit(cache=True)
+def _sparse_q_values(u, y, scales, active, out):
+    """
+    Q of every action for the binary features active (plus the bias column), reading only those columns.
+    """
+    bias = u.shape[1] - 1
+    gain = scales[TRACE_GAIN]
+    for a in range(u.shape[0]):
+        q = u[a, bias] + gain * y[a, bias]
+        for j in active:
+            q += u[a, j] + gain * y[a, j]
+        out[a] = scales[WEIGHT_SCALE] * q
+
+
+@numba.njit(cache=True)
+def _sparse_fold_traces(u, y, scales, touched, n_touched, keep_traces):
+    """
+    Writes trace_scale and trace_gain into the nonzero traces (listed in touched) so both start again
+    from 1 and 0. Traces that decayed below TRACE_DROP, or all of them if not keep_traces, are zeroed
+    and leave the list.
+    """
+    gain = scales[TRACE_GAIN]
+    scale = scales[TRACE_SCALE]
+    kept = 0
+    for i in range(n_touched[0]):
+        a, j = divmod(touched[i], u.shape[1])
+        u[a, j] += gain * y[a, j]
+        z = scale * y[a, j]
+        if keep_traces and z >= TRACE_DROP:
+            y[a, j] = z
+            touched[kept] = touched[i]
+            kept += 1
+        else:
+            y[a, j] = 0.0
+    n_touched[0] = kept
+    scales[TRACE_SCALE] = 1.0
+    scales[TRACE_GAIN] = 0.0
+
+
+@numba.njit(cache=True)
+def _sparse_td_step(u, y, scales, touched, n_touched, active, action, delta, alpha, trace_decay, weight_keep):
+    """
+    _td_step for binary features given by their indices, touching only those columns of the taken action.
+    Decaying all traces is trace_scale *= trace_decay, adding phi(s, a) is y += 1 / trace_scale on the
+    active columns (with u compensated so w does not move), w += alpha * delta * z is
+    trace_gain += alpha * delta * trace_scale / weight_scale, and the weight decay is weight_scale *= weight_keep.
+    """
+    bias = u.shape[1] - 1
+    scale = scales[TRACE_SCALE] * trace_decay
+    step = 1.0 / scale
+    shift = scales[TRACE_GAIN] * step
+    for k in range(active.shape[0] + 1):
+        j = active[k] if k < active.shape[0] else bias
+        if y[action, j] == 0.0:
+            touched[n_touched[0]] = action * u.shape[1] + j
+            n_touched[0] += 1
+        y[action, j] += step
+        u[action, j] -= shift
+
+    scales[TRACE_SCALE] = scale
+    scales[TRACE_GAIN] += alpha * delta * scale / scales[WEIGHT_SCALE]
+    scales[WEIGHT_SCALE] *= weight_keep
+    if scale < FOLD_THRESHOLD:
+        _sparse_fold_traces(u, y, scales, touched, n_touched, True)
+    if scales[WEIGHT_SCALE] < FOLD_THRESHOLD:
+        _sparse_fold_weights(u, y, scales, touched, n_touched)
+
+
+@numba.njit(cache=True)
+def _sparse_fold_weights(u, y, scales, touched, n_touched):
+    """
+    Writes weight_scale into u, the only O(all features) step, about every 1.4M steps with the default
+    weight decay.
+    """
+    _sparse_fold_traces(u, y, scales, touched, n_touched, True)
+    u *= scales[WEIGHT_SCALE]
+    scales[WEIGHT_SCALE] = 1.0
+
+
+@numba.njit(cache=True)
+def _sparse_q_values_rows(u, y, scales, indices, indptr, rows, out):
+    """
+    _sparse_q_values of the CSR rows given, into out[n] for rows[n].
+    """
+    for n in range(rows.shape[0]):
+        _sparse_q_values(u, y, scales, indices[indptr[rows[n]]:indptr[rows[n] + 1]], out[n])
+
+
+@numba.njit(cache=True)
+def _sparse_td0_rows(u, y, scales, touched, n_touched, indices, indptr, rows, actions, deltas, alpha,
+                     weight_keep):
+    """
+    w[actions[n], active features of rows[n]] += alpha * deltas[n] for every n (all computed with the
+    weights before the batch), then one weight decay per row. The traces are not used.
+    """
+    bias = u.shape[1] - 1
+    for n in range(rows.shape[0]):
+        # w = weight_scale * (u + ...), so u moves by the step over weight_scale
+        step = alpha * deltas[n] / scales[WEIGHT_SCALE]
+        action = actions[n]
+        for k in range(indptr[rows[n]], indptr[rows[n] + 1]):
+            u[action, indices[k]] += step
+        u[action, bias] += step
+    scales[WEIGHT_SCALE] *= weight_keep ** rows.shape[0]
+    if scales[WEIGHT_SCALE] < FOLD_THRESHOLD:
+        _sparse_fold_weights(u, y, scales, touched, n_touched)
 
 
 class Sarsa:
@@ -10,6 +152,8 @@ class Sarsa:
     lmbda = 0.9
     weight_decay = 1e-5
     z_clip = 10.0
+    # settings kept in checkpoints with the weights
+    HYPERPARAMETERS = ("alpha", "gamma", "lmbda", "weight_decay", "z_clip")
 
     def __init__(self, n_actions):
         self.state_dim = VECTOR_STATE_SIZE
@@ -42,8 +186,111 @@ class Sarsa:
 
         return action, q_vals
 
+    def epsilon_greedy_batch(self, features):
+        """
+        epsilon_greedy for a (K, state_dim) batch, exploring independently per row.
+        :return: actions (K,), q-values (K, n_actions)
+        """
+        eps = float(getattr(self, "epsilon", 0.0))
+        eps = max(0.0, min(1.0, eps))
+
+        q_vals = features.astype(np.float32).dot(self.w.T) + self.b
+
+        actions = np.argmax(q_vals, axis=1)
+        explore = np.random.rand(len(actions)) < eps
+        actions[explore] = np.random.randint(self.n_actions, size=int(explore.sum()))
+
+        return actions, q_vals
+
+    def td_update_batch(self, z_w, z_b, rows, features, actions, deltas):
+        """
+        Applies one SARSA(lambda) step for several envs at once.
+        :param z_w: (n_envs, n_actions, state_dim) per-env traces, updated in place
+        :param z_b: (n_envs, n_actions) per-env traces, updated in place
+        :param rows: indices of the envs that made a step, no duplicates
+        :param features: (len(rows), state_dim) features of the states the actions were taken in
+        """
+        decay = self.gamma * self.lmbda
+        z_w[rows] *= decay
+        z_b[rows] *= decay
+        z_w[rows, actions] += features
+        z_b[rows, actions] += 1.0
+
+        self.w += self.alpha * np.tensordot(deltas, z_w[rows], axes=1)
+        self.b += self.alpha * deltas.dot(z_b[rows])
+
+        self.w *= (1.0 - self.weight_decay) ** len(rows)
+        self.b *= (1.0 - self.weight_decay) ** len(rows)
+
+        z_w[rows] = np.clip(z_w[rows], -self.z_clip, self.z_clip)
+        z_b[rows] = np.clip(z_b[rows], -self.z_clip, self.z_clip)
+
+    def td0_update_batch(self, features, actions, deltas):
+        """
+        Batched semi-gradient TD(0) for offline training: w[a] += alpha * delta * features summed over the
+        rows, then one weight decay per row, like td_update_batch without the traces.
+        :param features: (N, state_dim) features of the states the actions were taken in
+        :param deltas: TD errors computed with the weights before this update
+        """
+        steps = self.alpha * np.asarray(deltas, dtype=np.float32)
+        np.add.at(self.w, actions, steps[:, None] * features)
+        np.add.at(self.b, actions, steps)
+        self.w *= (1.0 - self.weight_decay) ** len(actions)
+        self.b *= (1.0 - self.weight_decay) ** len(actions)
+
+    def td_update(self, features, action, delta):
+        """
+        One SARSA(lambda) step on the model's own traces, done in place by a compiled kernel.
+        :param features: features of the state the action was taken in
+        :param delta: TD error r + gamma * Q(s', a') - Q(s, a)
+        """
+        _td_step(self.w, self.b, self.z_w, self.z_b,
+                 np.asarray(features, dtype=np.float32), int(action), np.float32(delta),
+                 np.float32(self.alpha), np.float32(self.gamma * self.lmbda),
+                 np.float32(1.0 - self.weight_decay), np.float32(self.z_clip))
+
+    def scale_bias(self, action, factor):
+        self.b[action] *= factor
+
     def save(self, file_name="sarsa_weights.npz"):
-        np.savez(file_name, w=self.w.reshape(-1), b=self.b, n_actions=self.n_actions, state_dim=self.state_dim)
+        np.savez(file_name, **self._weight_arrays())
+
+    def _weight_arrays(self):
+        return dict(w=self.w.reshape(-1), b=self.b, n_actions=self.n_actions, state_dim=self.state_dim,
+                    **self._save_config())
+
+    def state_arrays(self):
+        """
+        :return: copies of the weights (as save writes them), traces and epsilon, for a checkpoint;
+                 Sarsa.load of the checkpoint followed by load_state gives back this model exactly
+        """
+        arrays = {name: np.array(value) for name, value in self._weight_arrays().items()}
+        arrays.update(z_w=self.z_w.copy(), z_b=self.z_b.copy(), epsilon=self.epsilon)
+        arrays.update(self._hyperparameter_arrays())
+        return arrays
+
+    def _hyperparameter_arrays(self):
+        return {f"hp_{name}": getattr(self, name) for name in self.HYPERPARAMETERS}
+
+    def _load_hyperparameters(self, data):
+        for name in self.HYPERPARAMETERS:
+            if f"hp_{name}" in data:
+                setattr(self, name, float(data[f"hp_{name}"]))
+
+    def load_state(self, data):
+        """
+        Restores the traces, epsilon and HYPERPARAMETERS of state_arrays, the weights come from load.
+        """
+        self.z_w = data['z_w'].astype(np.float32)
+        self.z_b = data['z_b'].astype(np.float32)
+        self.epsilon = float(data['epsilon'])
+        self._load_hyperparameters(data)
+
+    def _save_config(self):
+        """
+        :return: extra arrays saved with the weights, what load needs to rebuild a subclass
+        """
+        return {}
 
     def restrict_exploration(self):
         self.epsilon = 0.0
@@ -54,10 +301,18 @@ class Sarsa:
 
     @staticmethod
     def load(file_name="sarsa_weights.npz"):
+        """
+        :return: the model saved in file_name, a SparseSarsa or TileCodedSarsa if one was saved there (see
+                 their limits)
+        """
         data = np.load(file_name)
         n_actions = int(data['n_actions'])
         state_dim = int(data['state_dim'])
 
+        if 'tile_n_features' in data:
+            return TileCodedSarsa.load(file_name)
+        if 'sparse' in data:
+            return SparseSarsa.load(file_name)
         if state_dim != VECTOR_STATE_SIZE:
             raise ValueError(
                 f"Loaded weights have state_dim={state_dim}, "
@@ -71,4 +326,198 @@ class Sarsa:
         agent.b = data['b'].astype(np.float32) if 'b' in data else np.zeros(n_actions, dtype=np.float32)
         agent.z_w = np.zeros_like(agent.w, dtype=np.float32)
         agent.z_b = np.zeros_like(agent.b, dtype=np.float32)
-        return agent
\ No newline at end of file
+        return agent
+
+
+class SparseSarsa(Sarsa):
+    """
+    Sarsa over many binary features (the one-hot grids of play/play.py) given as arrays of active
+    feature indices, everywhere Sarsa takes a feature vector. Q and the TD step cost O(active features).
+    The weights and traces are kept in a scaled form: w = weight_scale * (u + trace_gain * y),
+    z = trace_scale * y, so decaying every trace and adding alpha * delta * z to every weight only
+    update the three scales. The scales are folded back into the nonzero traces (about every
+    log(FOLD_THRESHOLD) / log(gamma * lambda) steps, and on reset_traces), and traces that decayed
+    below TRACE_DROP are dropped then, so the traces kept stay those of recently active features.
+    Traces are not clipped: a binary feature's trace stays below 1 / (1 - gamma * lambda), under z_clip
+    for the default gamma and lambda.
+    """
+
+    def __init__(self, n_actions, n_features):
+        self.state_dim = n_features
+        self.n_actions = n_actions
+        # the last column is the bias, a feature active in every state
+        self._u = np.zeros((n_actions, n_features + 1), dtype=np.float64)
+        self._y = np.zeros_like(self._u)
+        self._scales = np.array([1.0, 1.0, 0.0])
+        # flat indices into _u of the nonzero traces
+        self._touched = np.empty(self._u.size, dtype=np.int64)
+        self._n_touched = np.zeros(1, dtype=np.int64)
+        self._q_values = np.empty(n_actions, dtype=np.float64)
+
+    @property
+    def w(self):
+        """
+        :return: dense (n_actions, n_features) float32 weights, a copy
+        """
+        return self._weights()[:, :-1]
+
+    @property
+    def b(self):
+        return self._weights()[:, -1]
+
+    @property
+    def z_w(self):
+        return (self._scales[TRACE_SCALE] * self._y[:, :-1]).astype(np.float32)
+
+    @property
+    def z_b(self):
+        return (self._scales[TRACE_SCALE] * self._y[:, -1]).astype(np.float32)
+
+    def _weights(self):
+        return (self._scales[WEIGHT_SCALE] * (self._u + self._scales[TRACE_GAIN] * self._y)).astype(np.float32)
+
+    def phi_from_state_action(self, features, action):
+        """
+        :param features: int array of active feature indices
+        :return: the dense 0/1 phi_w, phi_b of Sarsa
+        """
+        phi_w = np.zeros((self.n_actions, self.state_dim), dtype=np.float32)
+        phi_w[action, features] = 1.0
+        phi_b = np.zeros(self.n_actions, dtype=np.float32)
+        phi_b[action] = 1.0
+        return phi_w, phi_b
+
+    def _q_values_all_actions(self, state_features):
+        """
+        :param state_features: int array of active feature indices, no duplicates
+        """
+        _sparse_q_values(self._u, self._y, self._scales, state_features, self._q_values)
+        return self._q_values.copy()
+
+    def epsilon_greedy_batch(self, features):
+        """
+        epsilon_greedy for a list of active index arrays.
+        :return: actions (K,), q-values (K, n_actions)
+        """
+        q_vals = np.array([self._q_values_all_actions(active) for active in features])
+        eps = max(0.0, min(1.0, float(getattr(self, "epsilon", 0.0))))
+
+        actions = np.argmax(q_vals, axis=1)
+        explore = np.random.rand(len(actions)) < eps
+        actions[explore] = np.random.randint(self.n_actions, size=int(explore.sum()))
+
+        return actions, q_vals
+
+    def td_update_batch(self, z_w, z_b, rows, features, actions, deltas):
+        # the scaled form has one trace set, the per-env dense traces of the batched loops do not fit it;
+        # Trainer.train_vectorized and train_actor_learner reject sparse models before getting here
+        raise TypeError(f"{type(self).__name__} has no td_update_batch, train it with Trainer.train")
+
+    def td_update(self, features, action, delta):
+        """
+        One SARSA(lambda) step on the active features, the same arithmetic as Sarsa.td_update on the
+        dense 0/1 vector (in float64, and without the trace clipping that does not trigger).
+        :param features: int array of the active feature indices of the state the action was taken in
+        :param delta: TD error r + gamma * Q(s', a') - Q(s, a)
+        """
+        _sparse_td_step(self._u, self._y, self._scales, self._touched, self._n_touched, features, int(action),
+                        float(delta), float(self.alpha), float(self.gamma * self.lmbda),
+                        float(1.0 - self.weight_decay))
+
+    def q_values_batch(self, indices, indptr, rows):
+        """
+        :param indices, indptr: active features of many states in CSR layout
+        :param rows: which of those states
+        :return: (len(rows), n_actions) Q values
+        """
+        out = np.empty((len(rows), self.n_actions), dtype=np.float64)
+        _sparse_q_values_rows(self._u, self._y, self._scales, indices, indptr, rows, out)
+        return out
+
+    def td0_update_batch(self, indices, indptr, rows, actions, deltas):
+        """
+        Batched semi-gradient TD(0) for offline training: w[a, features of s] += alpha * delta summed over
+        the rows, like td_update_batch without the traces (which do not carry over between unrelated rows).
+        :param indices, indptr: active features of many states in CSR layout
+        :param rows: the states the actions were taken in
+        :param deltas: TD errors computed with the weights before this update
+        """
+        _sparse_td0_rows(self._u, self._y, self._scales, self._touched, self._n_touched, indices, indptr,
+                         rows, actions, deltas, float(self.alpha), float(1.0 - self.weight_decay))
+
+    def reset_traces(self):
+        _sparse_fold_traces(self._u, self._y, self._scales, self._touched, self._n_touched, False)
+
+    def scale_bias(self, action, factor):
+        # with the traces folded trace_gain is 0, so b = weight_scale * u[:, bias]
+        _sparse_fold_traces(self._u, self._y, self._scales, self._touched, self._n_touched, True)
+        self._u[action, -1] *= factor
+
+    def _save_config(self):
+        return {"sparse": True}
+
+    def state_arrays(self):
+        """
+        The scaled form itself, w and z are not exact after a round trip through float32.
+        """
+        arrays = {name: np.array(value) for name, value in self._weight_arrays().items()}
+        arrays.update(sparse_u=self._u.copy(), sparse_y=self._y.copy(), sparse_scales=self._scales.copy(),
+                      sparse_touched=self._touched[:self._n_touched[0]].copy(), epsilon=self.epsilon)
+        arrays.update(self._hyperparameter_arrays())
+        return arrays
+
+    def load_state(self, data):
+        self._u[:] = data['sparse_u']
+        self._y[:] = data['sparse_y']
+        self._scales[:] = data['sparse_scales']
+        self._n_touched[0] = len(data['sparse_touched'])
+        self._touched[:self._n_touched[0]] = data['sparse_touched']
+        self.epsilon = float(data['epsilon'])
+        self._load_hyperparameters(data)
+
+    def _load_weights(self, data):
+        self._u[:, :-1] = data['w'].reshape((self.n_actions, self.state_dim))
+        self._u[:, -1] = data['b'] if 'b' in data else 0.0
+
+    @staticmethod
+    def load(file_name="sarsa_weights.npz"):
+        data = np.load(file_name)
+        agent = SparseSarsa(int(data['n_actions']), int(data['state_dim']))
+        agent._load_weights(data)
+        return agent
+
+
+class TileCodedSarsa(SparseSarsa):
+    """
+    SparseSarsa over the tile coding of the State fields, taking as_vector() like Sarsa does, so it can be
+    trained by Trainer.train and played by evaluate / run in place of Sarsa. Like SparseSarsa it has no
+    td_update_batch, Trainer.train_vectorized and train_actor_learner refuse it. The tile indices are written
+    into a preallocated buffer, the TD step allocates nothing.
+    """
+
+    def __init__(self, n_actions, tile_coder=None):
+        self.tile_coder = tile_coder if tile_coder is not None else TileCoder()
+        super().__init__(n_actions, self.tile_coder.n_features)
+        self._active = np.empty(self.tile_coder.n_active, dtype=np.int64)
+
+    def _q_values_all_actions(self, state_features):
+        """
+        :param state_features: as_vector() of the state
+        """
+        return super()._q_values_all_actions(self.tile_coder.encode(state_features, self._active))
+
+    def td_update(self, features, action, delta):
+        """
+        :param features: as_vector() of the state the action was taken in
+        """
+        super().td_update(self.tile_coder.encode(features, self._active), action, delta)
+
+    def _save_config(self):
+        return self.tile_coder.config()
+
+    @staticmethod
+    def load(file_name="sarsa_weights.npz"):
+        data = np.load(file_name)
+        agent = TileCodedSarsa(int(data['n_actions']), TileCoder.from_config(data))
+        agent._load_weights(data)
+        return agent
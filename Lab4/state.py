@@ -1,33 +1,14 @@
-﻿import numpy as np
-from env_analizators import *
+﻿import numba
+import numpy as np
+from Lab4.env_analizators import *
 
 VECTOR_STATE_SIZE = 16
 
-class State:
-    def __init__(self, frame):
-        frame = cut_empty_layers_in_frame(frame)
-        state, enemy_pixels = rgb_to_index(frame)
-        self.is_empty = len(state) == 0 or len(state[0]) == 0
-        if not self.is_empty:
-            fill_holes(state)
-            self.state = state
-            self.state_h = state.shape[0]
-            self.state_w = state.shape[1]
-            self.player_box = find_player_box(state)
-            obs = basic_observation(state, self.player_box) if not self.player_box is None else None
-
-            self.left_wall = obs[0] if obs is not None and obs[0] is not None else (0, 0)
-            self.right_wall = obs[1] if obs is not None and obs[1] is not None else (0, 0)
-            self.up_wall = obs[2] if obs is not None and obs[2] is not None else (0, 0)
-            self.down_wall = obs[3] if obs is not None and obs[3] is not None else (0, 0)
-            self.closest_enemy = obs[4] if obs is not None and obs[4] is not None else None
-            self.closest_portal = obs[5] if obs is not None and obs[5] is not None else None
-            self.enemies = np.round(float(enemy_pixels) / AVG_PIXELS_IN_ENEMY).astype(np.int32)
-
-            self.area = self.state_h * self.state_w
-        else:
-            self.player_box = None
-            self.area = 0
+class StateFeatures:
+    """
+    Features computed from the observation attributes, shared by State and CompactState.
+    """
+    __slots__ = ()
 
     def has_enemy(self):
         return self.enemies > 0 or self.closest_enemy is not None
@@ -145,4 +126,426 @@ class State:
             elif j > right_up_corner[1]:
                 return RIGHT_DIRECTION
             else:
-                return -1
\ No newline at end of file
+                return -1
+
+    def to_record(self):
+        record = np.zeros((), dtype=COMPACT_STATE_DTYPE)
+        record["is_empty"] = self.is_empty
+        if self.is_empty:
+            # an empty State has no other fields, all zero as in _fill_compact_row
+            return record
+        record["state_h"] = self.state_h
+        record["state_w"] = self.state_w
+        record["enemies"] = self.enemies
+        record["has_player"] = self.player_box is not None
+        if self.player_box is not None:
+            record["player_box"] = self.player_box
+        record["left_wall"] = self.left_wall
+        record["right_wall"] = self.right_wall
+        record["up_wall"] = self.up_wall
+        record["down_wall"] = self.down_wall
+        record["has_enemy"] = self.closest_enemy is not None
+        if self.closest_enemy is not None:
+            record["closest_enemy"] = self.closest_enemy
+        record["has_portal"] = self.closest_portal is not None
+        if self.closest_portal is not None:
+            record["closest_portal"] = self.closest_portal
+        return record
+
+    def compact_row(self):
+        """
+        :return: to_record as an (COMPACT_STATE_SIZE,) int16 row, the input of the Examinator kernels
+        """
+        return np.frombuffer(self.to_record().tobytes(), dtype=np.int16)
+
+
+class State(StateFeatures):
+    def __init__(self, frame, room_cache=None):
+        """
+        :param room_cache: optional RoomCache, reuses the hole filling of rooms seen before
+        """
+        frame = cut_empty_layers_in_frame(frame)
+        state, enemy_pixels = rgb_to_index(frame)
+        if len(state) != 0 and len(state[0]) != 0:
+            if room_cache is not None:
+                room_cache.fill_holes(state)
+            else:
+                fill_holes(state)
+        self._observe(state, enemy_pixels)
+
+    @staticmethod
+    def from_index_map(state, enemy_pixels, player_box=None, player_box_known=False, observation=None):
+        """
+        Builds a State from an already decoded and hole-filled index map.
+        :param player_box_known: player_box is already computed (None meaning no player), skip find_player_box
+        :param observation: basic_observation(state, player_box) if already computed
+        """
+        featured_state = State.__new__(State)
+        featured_state._observe(state, enemy_pixels, player_box, player_box_known, observation)
+        return featured_state
+
+    def _observe(self, state, enemy_pixels, player_box=None, player_box_known=False, observation=None):
+        self.is_empty = len(state) == 0 or len(state[0]) == 0
+        if not self.is_empty:
+            self.state = state
+            self.state_h = state.shape[0]
+            self.state_w = state.shape[1]
+            self.player_box = player_box if player_box_known else find_player_box(state)
+            if observation is not None:
+                obs = observation
+            else:
+                obs = basic_observation(state, self.player_box) if not self.player_box is None else None
+
+            self.left_wall = obs[0] if obs is not None and obs[0] is not None else (0, 0)
+            self.right_wall = obs[1] if obs is not None and obs[1] is not None else (0, 0)
+            self.up_wall = obs[2] if obs is not None and obs[2] is not None else (0, 0)
+            self.down_wall = obs[3] if obs is not None and obs[3] is not None else (0, 0)
+            self.closest_enemy = obs[4] if obs is not None and obs[4] is not None else None
+            self.closest_portal = obs[5] if obs is not None and obs[5] is not None else None
+            self.enemies = np.round(float(enemy_pixels) / AVG_PIXELS_IN_ENEMY).astype(np.int32)
+
+            self.area = self.state_h * self.state_w
+        else:
+            self.player_box = None
+            self.area = 0
+
+
+class IncrementalStateBuilder:
+    """
+    Builds States for consecutive frames of one env, re-decoding only the pixels that changed since the
+    previous frame. The room's hole filling is kept as a template and reused until the walls change.
+    A full rebuild (same work as State(frame)) happens on the first frame, when the crop changes, when
+    a wall or portal pixel changes, when more than room_change_fraction of the pixels changed, and while a
+    sprite touches the border (hole filling then depends on more than the walls).
+    Walls and portals are found with distance fields of the room template instead of stepping pixel by
+    pixel. The fields are built on the first frame of a room that needs them, and patched on rebuilds
+    of the same room that changed a few walls.
+    """
+
+    def __init__(self, room_change_fraction=0.1, room_cache=None):
+        self.room_change_fraction = room_change_fraction
+        self.room_cache = room_cache
+        self.full_rebuilds = 0
+        self.incremental_updates = 0
+        self.reset()
+
+    def reset(self):
+        self._prev_red = None
+        self._state = None
+        self._template = None
+        self._fields = None
+        self._fields_valid = False
+        self._enemy_pixels = 0
+        self._player_box = None
+
+    def build(self, frame):
+        frame = cut_empty_layers_in_frame(frame)
+        if frame.shape[0] == 0 or frame.shape[1] == 0:
+            self.reset()
+            return State.from_index_map(np.zeros(frame.shape[:2], dtype=np.uint8), 0)
+
+        if not self._try_incremental_update(frame):
+            self._rebuild(frame)
+
+        return State.from_index_map(self._state.copy(), self._enemy_pixels, self._player_box, True,
+                                    self._observation())
+
+    def _observation(self):
+        """
+        basic_observation of the current state using the room's distance fields, None if there is no player
+        or the fields can not be used for this room.
+        """
+        if self._player_box is None or not self._fields_valid:
+            return None
+        if self._fields is None:
+            self._fields = distance_fields(self._state, self._template)
+        l_wall, r_wall, u_wall, d_wall, has_enemy, closest_enemy, has_portal, closest_portal = field_observation(
+            self._state, self._player_box, self._fields, self._enemy_pixels > 0)
+        return (l_wall, r_wall, u_wall, d_wall,
+                closest_enemy if has_enemy else None,
+                closest_portal if has_portal else None)
+
+    def _rebuild(self, frame):
+        self.full_rebuilds += 1
+        old_state, old_template, old_fields_valid = self._state, self._template, self._fields_valid
+        state, self._enemy_pixels = rgb_to_index(frame)
+        clean_border = not sprites_on_border(frame)
+        # fields come from the template, they match the state only if hole filling saw just the walls
+        # and no sprite is drawn in the portal color
+        self._fields_valid = clean_border and not np.any(state == PORTAL_INDEX)
+        if self.room_cache is not None and clean_border:
+            self._template = self.room_cache.fill_holes(state).template()
+        else:
+            self._template = fill_template(state)
+            if self.room_cache is not None:
+                self.room_cache.fill_holes(state)
+            else:
+                fill_holes(state)
+        if (self._fields is not None and old_fields_valid and self._fields_valid and
+                old_state.shape == state.shape):
+            # same room with a few walls changed (shots), patch the fields instead of building them again
+            update_distance_fields(self._fields, state, self._template, old_state, old_template)
+        else:
+            self._fields = None
+        self._state = state
+        self._prev_red = np.ascontiguousarray(frame[:, :, 0])
+        self._player_box = find_player_box(state)
+
+    def _try_incremental_update(self, frame):
+        if self._state is None or self._state.shape != frame.shape[:2] or sprites_on_border(frame):
+            return False
+
+        walls_changed, changed, enemy_delta, player_changed, box = patch_changed_pixels(
+            frame, self._prev_red, self._state, self._template)
+        if walls_changed or changed > self.room_change_fraction * self._state.size:
+            return False
+
+        self.incremental_updates += 1
+        self._enemy_pixels += enemy_delta
+        if player_changed:
+            i_min, j_min, i_max, j_max = box
+            if self._player_box is not None:
+                i_min = min(i_min, self._player_box[0])
+                j_min = min(j_min, self._player_box[1])
+                i_max = max(i_max, self._player_box[2])
+                j_max = max(j_max, self._player_box[3])
+            has_player, player_box = find_player_box_in(self._state, i_min, j_min, i_max, j_max)
+            self._player_box = player_box if has_player else None
+        return True
+
+@numba.njit(cache=True)
+def _fill_state_vector(frame, out):
+    """
+    Same pipeline as State(frame).as_vector(), written into a preallocated row.
+    :return: False if the frame is empty (out is left zeroed)
+    """
+    frame = cut_empty_layers_in_frame(frame)
+    state, enemy_pixels = rgb_to_index(frame)
+    if state.shape[0] == 0 or state.shape[1] == 0:
+        return False
+
+    fill_holes(state)
+    state_h = state.shape[0]
+    state_w = state.shape[1]
+    has_player, box = find_player_box_in(state, 0, 0, state_h - 1, state_w - 1)
+
+    p_i, p_j = 0, 0
+    up_i, down_i, left_j, right_j = 0, 0, 0, 0
+    enemy_visible, portal_visible = False, False
+    enemy_i, enemy_j = 0, 0
+    portal_i, portal_j = 0, 0
+
+    if has_player:
+        p_i = (box[0] + box[2]) // 2
+        p_j = (box[1] + box[3]) // 2
+        obs = scan_observation(state, box)
+        left_j = obs[0][1]
+        right_j = obs[1][1]
+        up_i = obs[2][0]
+        down_i = obs[3][0]
+        enemy_visible = obs[4]
+        enemy_i, enemy_j = obs[5]
+        portal_visible = obs[6]
+        portal_i, portal_j = obs[7]
+
+    enemies = np.rint(enemy_pixels / AVG_PIXELS_IN_ENEMY)
+
+    dist_up_norm = (p_i - up_i) / state_h
+    dist_down_norm = (down_i - p_i) / state_h
+    dist_left_norm = (p_j - left_j) / state_w
+    dist_right_norm = (right_j - p_j) / state_w
+
+    epsilon = 1e-3
+    out[0] = p_i / state_h
+    out[1] = p_j / state_w
+    out[2] = dist_up_norm
+    out[3] = dist_down_norm
+    out[4] = dist_left_norm
+    out[5] = dist_right_norm
+    out[6] = 1.0 / (dist_up_norm + epsilon)
+    out[7] = 1.0 / (dist_down_norm + epsilon)
+    out[8] = 1.0 / (dist_left_norm + epsilon)
+    out[9] = 1.0 / (dist_right_norm + epsilon)
+    out[10] = enemy_i / state_h if enemy_visible else 0.0
+    out[11] = enemy_j / state_w if enemy_visible else 0.0
+    out[12] = 1.0 if enemy_visible else 0.0
+    out[13] = enemies / MAX_ENEMIES
+    out[14] = portal_i / state_h if portal_visible else 0.0
+    out[15] = portal_j / state_w if portal_visible else 0.0
+    return True
+
+
+@numba.njit(parallel=True, cache=True)
+def _fill_state_vectors(frames, out, empty):
+    for n in numba.prange(frames.shape[0]):
+        empty[n] = not _fill_state_vector(frames[n], out[n])
+
+
+def states_as_vectors(frames, return_empty_mask=False):
+    """
+    Batch version of State(frame).as_vector() over an (N, 210, 160, 3) uint8 array.
+    Rows of empty frames (State.is_empty) are left as zeros.
+    :return: (N, VECTOR_STATE_SIZE) float32 matrix[, (N,) bool mask of empty frames]
+    """
+    frames = np.ascontiguousarray(frames, dtype=np.uint8)
+    if frames.ndim != 4 or frames.shape[3] != 3:
+        raise ValueError(f"Expected frames of shape (N, H, W, 3), got {frames.shape}")
+
+    out = np.zeros((frames.shape[0], VECTOR_STATE_SIZE), dtype=np.float32)
+    empty = np.zeros(frames.shape[0], dtype=np.bool_)
+    _fill_state_vectors(frames, out, empty)
+
+    if return_empty_mask:
+        return out, empty
+    return out
+
+# Observation of a State as one record of int16 fields (flags are 0 / 1), so it can be filled as a plain
+# int16 row by numba and batches of states fit in one contiguous structured array.
+COMPACT_STATE_DTYPE = np.dtype([
+    ("is_empty", np.int16),
+    ("state_h", np.int16),
+    ("state_w", np.int16),
+    ("has_player", np.int16),
+    ("player_box", np.int16, (4,)),
+    ("left_wall", np.int16, (2,)),
+    ("right_wall", np.int16, (2,)),
+    ("up_wall", np.int16, (2,)),
+    ("down_wall", np.int16, (2,)),
+    ("has_enemy", np.int16),
+    ("closest_enemy", np.int16, (2,)),
+    ("has_portal", np.int16),
+    ("closest_portal", np.int16, (2,)),
+    ("enemies", np.int16),
+])
+COMPACT_STATE_SIZE = COMPACT_STATE_DTYPE.itemsize // 2
+
+(_IS_EMPTY, _STATE_H, _STATE_W, _HAS_PLAYER, _PLAYER_BOX, _LEFT_WALL, _RIGHT_WALL, _UP_WALL, _DOWN_WALL, _HAS_ENEMY,
+ _CLOSEST_ENEMY, _HAS_PORTAL, _CLOSEST_PORTAL, _ENEMIES) = (
+    COMPACT_STATE_DTYPE.fields[name][1] // 2 for name in COMPACT_STATE_DTYPE.names)
+
+
+@numba.njit(cache=True)
+def _fill_compact_row(frame, out):
+    """
+    Same pipeline as State(frame), the observation written into an int16 row in COMPACT_STATE_DTYPE layout.
+    :return: the hole-filled index map
+    """
+    frame = cut_empty_layers_in_frame(frame)
+    state, enemy_pixels = rgb_to_index(frame)
+    out[:] = 0
+    if state.shape[0] == 0 or state.shape[1] == 0:
+        out[_IS_EMPTY] = 1
+        return state
+
+    fill_holes(state)
+    out[_STATE_H] = state.shape[0]
+    out[_STATE_W] = state.shape[1]
+    out[_ENEMIES] = np.rint(enemy_pixels / AVG_PIXELS_IN_ENEMY)
+
+    has_player, box = find_player_box_in(state, 0, 0, state.shape[0] - 1, state.shape[1] - 1)
+    if has_player:
+        out[_HAS_PLAYER] = 1
+        out[_PLAYER_BOX], out[_PLAYER_BOX + 1], out[_PLAYER_BOX + 2], out[_PLAYER_BOX + 3] = box
+        l_wall, r_wall, u_wall, d_wall, has_enemy, closest_enemy, has_portal, closest_portal = scan_observation(
+            state, box)
+        out[_LEFT_WALL], out[_LEFT_WALL + 1] = l_wall
+        out[_RIGHT_WALL], out[_RIGHT_WALL + 1] = r_wall
+        out[_UP_WALL], out[_UP_WALL + 1] = u_wall
+        out[_DOWN_WALL], out[_DOWN_WALL + 1] = d_wall
+        out[_CLOSEST_ENEMY], out[_CLOSEST_ENEMY + 1] = closest_enemy
+        out[_CLOSEST_PORTAL], out[_CLOSEST_PORTAL + 1] = closest_portal
+        out[_HAS_ENEMY] = has_enemy
+        out[_HAS_PORTAL] = has_portal
+    return state
+
+
+@numba.njit(parallel=True, cache=True)
+def _fill_compact_rows(frames, out):
+    for n in numba.prange(frames.shape[0]):
+        _fill_compact_row(frames[n], out[n])
+
+
+def compact_states(frames):
+    """
+    Batch version of CompactState(frame).to_record() over an (N, 210, 160, 3) uint8 array.
+    :return: (N,) array of COMPACT_STATE_DTYPE records
+    """
+    frames = np.ascontiguousarray(frames, dtype=np.uint8)
+    if frames.ndim != 4 or frames.shape[3] != 3:
+        raise ValueError(f"Expected frames of shape (N, H, W, 3), got {frames.shape}")
+
+    out = np.zeros((frames.shape[0], COMPACT_STATE_SIZE), dtype=np.int16)
+    _fill_compact_rows(frames, out)
+    return out.view(COMPACT_STATE_DTYPE)[:, 0]
+
+
+class CompactState(StateFeatures):
+    """
+    State with __slots__ instead of an instance __dict__, keeping the index map only if keep_index_map
+    (state is None otherwise). Converts to and from COMPACT_STATE_DTYPE records, see compact_states and
+    pack_states for batches.
+    """
+    __slots__ = ("is_empty", "state_h", "state_w", "area", "player_box", "left_wall", "right_wall", "up_wall",
+                 "down_wall", "closest_enemy", "closest_portal", "enemies", "state", "_row")
+
+    def __init__(self, frame, keep_index_map=False):
+        row = np.empty(COMPACT_STATE_SIZE, dtype=np.int16)
+        state = _fill_compact_row(frame, row)
+        self._load(row)
+        self.state = state if keep_index_map and not self.is_empty else None
+
+    @staticmethod
+    def from_record(record):
+        return CompactState.from_row(np.frombuffer(record.tobytes(), dtype=np.int16))
+
+    @staticmethod
+    def from_row(row):
+        """
+        :param row: (COMPACT_STATE_SIZE,) int16 row as returned by compact_row, copied
+        """
+        compact_state = CompactState.__new__(CompactState)
+        compact_state._load(np.array(row, dtype=np.int16))
+        compact_state.state = None
+        return compact_state
+
+    def _load(self, record_row):
+        self._row = record_row
+        row = record_row.tolist()
+        self.is_empty = row[_IS_EMPTY] == 1
+        self.state_h = row[_STATE_H]
+        self.state_w = row[_STATE_W]
+        self.area = self.state_h * self.state_w
+        self.enemies = row[_ENEMIES]
+        self.player_box = tuple(row[_PLAYER_BOX:_PLAYER_BOX + 4]) if row[_HAS_PLAYER] else None
+        self.left_wall = (row[_LEFT_WALL], row[_LEFT_WALL + 1])
+        self.right_wall = (row[_RIGHT_WALL], row[_RIGHT_WALL + 1])
+        self.up_wall = (row[_UP_WALL], row[_UP_WALL + 1])
+        self.down_wall = (row[_DOWN_WALL], row[_DOWN_WALL + 1])
+        self.closest_enemy = (row[_CLOSEST_ENEMY], row[_CLOSEST_ENEMY + 1]) if row[_HAS_ENEMY] else None
+        self.closest_portal = (row[_CLOSEST_PORTAL], row[_CLOSEST_PORTAL + 1]) if row[_HAS_PORTAL] else None
+
+    def compact_row(self):
+        # the row the fields were loaded from, CompactStates are not changed after that
+        return self._row
+
+
+def compact_rows_as_vectors(rows):
+    """
+    :param rows: (N, COMPACT_STATE_SIZE) int16 rows, as recorded by recorder.EpisodeRecorder
+    :return: (N, VECTOR_STATE_SIZE) as_vector of every row, zeros for empty states
+    """
+    out = np.zeros((len(rows), VECTOR_STATE_SIZE), dtype=np.float32)
+    for n, row in enumerate(np.asarray(rows, dtype=np.int16)):
+        if row[_IS_EMPTY] == 0:
+            out[n] = CompactState.from_row(row).as_vector()
+    return out
+
+
+def pack_states(states):
+    """
+    :return: (N,) array of COMPACT_STATE_DTYPE records of the CompactStates
+    """
+    records = np.zeros(len(states), dtype=COMPACT_STATE_DTYPE)
+    for n, compact_state in enumerate(states):
+        records[n] = compact_state.to_record()
+    return records
\ No newline at end of file
@@ -0,0 +1,224 @@
+﻿import argparse
+import contextlib
+import csv
+import json
+import math
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from Lab4.evaluate import ENV_ID, make_env
+
+# parameter names are <target>.<attribute>: Sarsa.HYPERPARAMETERS, the epsilon schedule of Trainer and the
+# Examinator COEFFICIENT_NAMES
+SARSA_PREFIX = "sarsa."
+TRAINER_PREFIX = "trainer."
+EXAMINATOR_PREFIX = "examinator."
+TRAINER_PARAMETERS = ("epsilon_min", "epsilon_decay_fraction", "initial_epsilon")
+
+# a space of the constants tuned by hand so far, a list is a choice, (low, high) uniform, ("log", low, high)
+# log-uniform
+DEFAULT_SPACE = {
+    "sarsa.alpha": ("log", 1e-6, 1e-4),
+    "sarsa.lmbda": [0.8, 0.9, 0.95],
+    "trainer.epsilon_decay_fraction": (0.5, 0.999),
+    "examinator.NOT_SHOOT_ENEMY_PENALTY": (-3.0, -0.5),
+    "examinator.DEATH_PENALTY": [-50, -25, -10],
+    "examinator.FIRE_ENEMY_BONUS": (0.5, 2.0),
+    "examinator.FIND_PORTAL_BONUS": (5.0, 25.0),
+}
+
+
+def check_parameter(name):
+    from Lab4.examinator import COEFFICIENT_NAMES
+    from Lab4.sarsa import Sarsa
+
+    known = ([SARSA_PREFIX + p for p in Sarsa.HYPERPARAMETERS] + [TRAINER_PREFIX + p for p in TRAINER_PARAMETERS] +
+             [EXAMINATOR_PREFIX + p for p in COEFFICIENT_NAMES])
+    if name not in known:
+        raise ValueError(f"Unknown sweep parameter {name!r}, expected one of {known}")
+
+
+def sample_configs(space, n_configs, seed=0):
+    """
+    :param space: dict of parameter name to a list of values, (low, high) or ("log", low, high)
+    :return: n_configs dicts of parameter name to value
+    """
+    for name in space:
+        check_parameter(name)
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(n_configs):
+        config = {}
+        for name, values in space.items():
+            if isinstance(values, list):
+                config[name] = values[rng.integers(len(values))]
+            elif values[0] == "log":
+                config[name] = float(np.exp(rng.uniform(np.log(values[1]), np.log(values[2]))))
+            else:
+                config[name] = float(rng.uniform(values[0], values[1]))
+        configs.append(config)
+    return configs
+
+
+def space_from_json(obj):
+    """
+    JSON has no tuples: {"choice": [values]} is a list of values, [low, high] and ["log", low, high] ranges.
+    """
+    return {name: list(values["choice"]) if isinstance(values, dict) else tuple(values) for name, values in obj.items()}
+
+
+def rung_budgets(min_episodes, n_episodes, eta):
+    """
+    :return: episodes trained by the end of each rung, min_episodes * eta ** k up to n_episodes
+    """
+    budgets = [min_episodes]
+    while budgets[-1] * eta < n_episodes:
+        budgets.append(budgets[-1] * eta)
+    if budgets[-1] < n_episodes:
+        budgets.append(n_episodes)
+    return budgets
+
+
+def _new_model(config, n_actions):
+    from Lab4.sarsa import Sarsa
+
+    model = Sarsa(n_actions)
+    for name, value in config.items():
+        if name.startswith(SARSA_PREFIX):
+            setattr(model, name[len(SARSA_PREFIX):], value)
+    return model
+
+
+def _new_trainer(config):
+    from Lab4.trainer import Trainer
+
+    trainer = Trainer(examinator_coefficients={name[len(EXAMINATOR_PREFIX):]: value for name, value in config.items()
+                                               if name.startswith(EXAMINATOR_PREFIX)})
+    for name, value in config.items():
+        if name.startswith(TRAINER_PREFIX):
+            setattr(trainer, name[len(TRAINER_PREFIX):], value)
+    return trainer
+
+
+# per worker process, set by _init_worker
+_worker = None
+
+
+def _init_worker(env_id):
+    global _worker
+    _worker = {"env": make_env("rgb_array", env_id)}
+
+
+def _run_trial(task):
+    """
+    Trains one configuration (or continues it from its checkpoint, if resume) until stop_after episodes in
+    the worker's env, with the output of the trainer in the trial's log file.
+    :return: trial id, rewards of all episodes so far, seconds
+    """
+    trial, config, seed, n_episodes, stop_after, resume, work_dir = task
+    from Lab4.trainer import Trainer
+
+    env = _worker["env"]
+    name = f"trial-{trial:03d}"
+    checkpoint_file = os.path.join(work_dir, f"{name}.npz")
+    start = time.perf_counter()
+    with open(os.path.join(work_dir, f"{name}.log"), "a") as log, contextlib.redirect_stdout(log):
+        if resume:
+            Trainer().resume(env, name, checkpoint_every=n_episodes, checkpoint_file=checkpoint_file,
+                             stop_after=stop_after)
+        else:
+            np.random.seed(seed + trial)
+            _new_trainer(config).train(_new_model(config, env.action_space.n), env, name, n_episodes, seed=seed,
+                                       checkpoint_every=n_episodes, checkpoint_file=checkpoint_file,
+                                       stop_after=stop_after)
+    rewards = np.load(checkpoint_file)["progress_rewards"]
+    return trial, rewards, time.perf_counter() - start
+
+
+def rolling_reward(rewards, window):
+    return float(np.mean(rewards[-window:])) if len(rewards) else 0.0
+
+
+def sweep(configs, n_episodes=200, min_episodes=25, eta=2, window=20, n_workers=None, seed=0, work_dir="sweep",
+          env_id=ENV_ID):
+    """
+    Successive halving over the configurations: every rung trains the remaining configurations (in parallel,
+    one env per worker process) up to its episode budget, then keeps the best 1 / eta of them by the mean
+    reward of their last window episodes. Each configuration is one run of Trainer.train with the epsilon
+    schedule of n_episodes, continued from rung to rung through its checkpoint in work_dir. All of them play
+    the same env seeds (episode i: seed + i), so they are compared on the same episodes.
+    :return: one result dict per configuration, best first
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    n_workers = n_workers or os.cpu_count()
+    budgets = rung_budgets(min_episodes, n_episodes, eta)
+    results = [{"trial": trial, **config, "episodes": 0, "rung": 0, "rolling_reward": 0.0, "mean_reward": 0.0,
+                "max_reward": 0.0, "seconds": 0.0} for trial, config in enumerate(configs)]
+    alive = list(range(len(configs)))
+    start = time.perf_counter()
+
+    # spawn: workers start clean of the parent's numba threads and load the kernels from the cache
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(n_workers, initializer=_init_worker, initargs=(env_id,)) as pool:
+        for rung, budget in enumerate(budgets):
+            tasks = [(trial, configs[trial], seed, n_episodes, budget, rung > 0, work_dir) for trial in alive]
+            for trial, rewards, seconds in pool.imap_unordered(_run_trial, tasks):
+                results[trial].update(episodes=len(rewards), rung=rung, rolling_reward=rolling_reward(rewards, window),
+                                      mean_reward=float(np.mean(rewards)), max_reward=float(np.max(rewards)))
+                results[trial]["seconds"] += seconds
+
+            alive.sort(key=lambda trial: results[trial]["rolling_reward"], reverse=True)
+            print(f"rung {rung + 1}/{len(budgets)}: {len(alive)} configurations at {budget} episodes, "
+                  f"best rolling reward {results[alive[0]]['rolling_reward']:.1f}, "
+                  f"{time.perf_counter() - start:.0f}s")
+            if rung + 1 < len(budgets):
+                alive = alive[:max(1, math.ceil(len(alive) / eta))]
+
+    return sorted(results, key=lambda result: (result["episodes"], result["rolling_reward"]), reverse=True)
+
+
+def write_table(results, file_name):
+    with open(file_name, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def print_table(results, top=10):
+    parameters = [name for name in results[0] if "." in name]
+    print(f"{'trial':>5} {'episodes':>8} {'rolling':>9} {'mean':>9}  " + "  ".join(parameters))
+    for result in results[:top]:
+        values = "  ".join(f"{result[name]:.4g}" for name in parameters)
+        print(f"{result['trial']:>5} {result['episodes']:>8} {result['rolling_reward']:>9.1f} "
+              f"{result['mean_reward']:>9.1f}  {values}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Successive halving sweep over Sarsa, Trainer and Examinator "
+                                                 "settings.")
+    parser.add_argument("space", nargs="?", default=None, help="JSON file of parameter -> {\"choice\": [values]}, "
+                                                               "[low, high] or [\"log\", low, high]; default DEFAULT_SPACE")
+    parser.add_argument("-n", "--configs", type=int, default=16)
+    parser.add_argument("--episodes", type=int, default=200, help="episodes of a configuration that is never stopped")
+    parser.add_argument("--min-episodes", type=int, default=25, help="episodes of the first rung")
+    parser.add_argument("--eta", type=int, default=2, help="keep 1 / eta of the configurations per rung")
+    parser.add_argument("--window", type=int, default=20, help="episodes of the rolling reward")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="processes, default one per cpu")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default="sweep", help="checkpoints and logs of the trials")
+    parser.add_argument("-o", "--output", default="sweep-results.csv")
+    args = parser.parse_args()
+
+    if args.space:
+        with open(args.space) as f:
+            space = space_from_json(json.load(f))
+    else:
+        space = DEFAULT_SPACE
+    results = sweep(sample_configs(space, args.configs, args.seed), args.episodes, args.min_episodes, args.eta,
+                    args.window, args.workers, args.seed, args.work_dir)
+    print_table(results)
+    write_table(results, args.output)
+    print(f"Results of {len(results)} configurations in {args.output}")
\ No newline at end of file
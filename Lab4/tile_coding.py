@@ -0,0 +1,193 @@
+﻿import numba
+import numpy as np
+
+# inputs of the tile coder, derived from StateFeatures.as_vector() and scaled to [0, 1]
+TILE_INPUTS = ["wall_up", "wall_down", "wall_left", "wall_right",
+               "enemy_dy", "enemy_dx", "enemy_visible", "enemy_count",
+               "portal_dy", "portal_dx", "portal_visible"]
+
+# (inputs crossed in one tiling, tiles per input), each group gets n_tilings tilings
+DEFAULT_GROUPS = [
+    (("wall_up", "wall_down"), 8),
+    (("wall_left", "wall_right"), 8),
+    (("wall_up", "wall_down", "wall_left", "wall_right"), 4),
+    (("enemy_dy", "enemy_dx", "enemy_visible"), 8),
+    (("enemy_count", "enemy_visible"), 8),
+    (("portal_dy", "portal_dx", "portal_visible"), 6),
+]
+
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# saved with the weights, the indices of a tile change with the hash
+HASH_VERSION = 2
+
+
+@numba.njit(cache=True)
+def _fill_tile_inputs(vector, out):
+    """
+    TILE_INPUTS from the 16 values of as_vector(). Offsets are (object - player) mapped from [-1, 1] to
+    [0, 1], 0.5 when the object is not visible.
+    """
+    player_y = vector[0]
+    player_x = vector[1]
+    for k in range(4):
+        out[k] = min(max(vector[2 + k], 0.0), 1.0)
+
+    enemy_visible = vector[12] > 0.0
+    out[4] = min(max((vector[10] - player_y) * 0.5 + 0.5, 0.0), 1.0) if enemy_visible else 0.5
+    out[5] = min(max((vector[11] - player_x) * 0.5 + 0.5, 0.0), 1.0) if enemy_visible else 0.5
+    out[6] = 1.0 if enemy_visible else 0.0
+    out[7] = min(max(vector[13], 0.0), 1.0)
+
+    # as_vector has no portal flag, a missing portal is (0, 0)
+    portal_visible = vector[14] != 0.0 or vector[15] != 0.0
+    out[8] = min(max((vector[14] - player_y) * 0.5 + 0.5, 0.0), 1.0) if portal_visible else 0.5
+    out[9] = min(max((vector[15] - player_x) * 0.5 + 0.5, 0.0), 1.0) if portal_visible else 0.5
+    out[10] = 1.0 if portal_visible else 0.0
+
+
+@numba.njit(cache=True)
+def _fmix64(h):
+    """
+    The murmur3 finalizer: every input bit flips about half of the output bits.
+    """
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xFF51AFD7ED558CCD)
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xC4CEB9FE1A85EC53)
+    h ^= h >> np.uint64(33)
+    return h
+
+
+@numba.njit(cache=True)
+def _encode_tiles(vector, inputs, group_inputs, group_tiles, offsets, seed, n_features, out):
+    """
+    One hashed tile index per (group, tiling) into out, in [0, n_features) and all different: a tile
+    whose index is taken by an earlier tile of the state moves to the next free index.
+    :return: number of tiles moved
+    """
+    _fill_tile_inputs(vector, inputs)
+    n_tilings = offsets.shape[1]
+    k = 0
+    moved = 0
+    for g in range(group_inputs.shape[0]):
+        for t in range(n_tilings):
+            h = (seed ^ np.uint64(k + 1)) * _HASH_MULTIPLIER
+            for d in range(group_inputs.shape[1]):
+                dim = group_inputs[g, d]
+                if dim < 0:
+                    break
+                coord = np.int64(inputs[dim] * group_tiles[g] + offsets[g, t, d])
+                h = (h ^ np.uint64(coord)) * _HASH_MULTIPLIER
+            index = np.int64(_fmix64(h) % np.uint64(n_features))
+            collided = True
+            while collided:
+                collided = False
+                for j in range(k):
+                    if out[j] == index:
+                        collided = True
+                        index = (index + 1) % n_features
+                        break
+                if collided:
+                    moved += 1
+            out[k] = index
+            k += 1
+    return moved
+
+
+@numba.njit(cache=True)
+def _encode_tiles_batch(vectors, inputs, group_inputs, group_tiles, offsets, seed, n_features, out):
+    moved = 0
+    for n in range(vectors.shape[0]):
+        moved += _encode_tiles(vectors[n], inputs, group_inputs, group_tiles, offsets, seed, n_features, out[n])
+    return moved
+
+
+class TileCoder:
+    """
+    Hashed tile coding of the State fields into n_features binary features. Every group of TILE_INPUTS
+    is covered by n_tilings grids shifted by asymmetric offsets (tiling t, input d: t * (2d + 1) / n_tilings
+    of a tile), and the (group, tiling, tile) of the state is hashed into the feature table, so a state
+    has n_active = len(groups) * n_tilings different active features whatever n_features is (tiles of a
+    state that hash to the same index are moved apart, see moved_tiles).
+    """
+
+    def __init__(self, n_features=10000, n_tilings=8, groups=DEFAULT_GROUPS, seed=0):
+        if n_features < len(groups) * n_tilings:
+            raise ValueError(f"n_features={n_features} is less than the {len(groups) * n_tilings} active tiles")
+        self.n_features = n_features
+        self.n_tilings = n_tilings
+        self.groups = [(tuple(names), int(tiles)) for names, tiles in groups]
+        self.seed = seed
+        self._seed = np.uint64(seed)
+
+        width = max(len(names) for names, _ in self.groups)
+        self._group_inputs = np.full((len(self.groups), width), -1, dtype=np.int64)
+        for g, (names, _) in enumerate(self.groups):
+            self._group_inputs[g, :len(names)] = [TILE_INPUTS.index(name) for name in names]
+        self._group_tiles = np.array([tiles for _, tiles in self.groups], dtype=np.float64)
+
+        dims = np.arange(width)
+        tilings = np.arange(n_tilings)
+        offsets = (tilings[:, None] * (2 * dims[None, :] + 1)) % n_tilings / n_tilings
+        self._offsets = np.broadcast_to(offsets, (len(self.groups), n_tilings, width)).copy()
+
+        self._inputs = np.empty(len(TILE_INPUTS), dtype=np.float64)
+
+    @property
+    def n_active(self):
+        return len(self.groups) * self.n_tilings
+
+    def encode(self, vector, out=None):
+        """
+        :param vector: as_vector() of a State
+        :param out: optional (n_active,) int64 buffer, nothing is allocated when given
+        :return: the active feature indices
+        """
+        if out is None:
+            out = np.empty(self.n_active, dtype=np.int64)
+        _encode_tiles(vector, self._inputs, self._group_inputs, self._group_tiles, self._offsets,
+                      self._seed, self.n_features, out)
+        return out
+
+    def encode_batch(self, vectors):
+        """
+        :param vectors: (N, VECTOR_STATE_SIZE) as from states_as_vectors
+        :return: (N, n_active) int64 active feature indices
+        """
+        out = np.empty((len(vectors), self.n_active), dtype=np.int64)
+        _encode_tiles_batch(vectors, self._inputs, self._group_inputs, self._group_tiles, self._offsets,
+                            self._seed, self.n_features, out)
+        return out
+
+    def moved_tiles(self, vectors):
+        """
+        :return: mean tiles per state moved off an index an other tile of the state hashed to, about
+                 n_active * (n_active - 1) / (2 * n_features) for a well mixed hash
+        """
+        out = np.empty((len(vectors), self.n_active), dtype=np.int64)
+        moved = _encode_tiles_batch(vectors, self._inputs, self._group_inputs, self._group_tiles, self._offsets,
+                                    self._seed, self.n_features, out)
+        return moved / max(1, len(vectors))
+
+    def config(self):
+        """
+        :return: arrays that TileCoder.from_config turns back into this coder, for saving with the weights
+        """
+        return {
+            "tile_n_features": self.n_features,
+            "tile_n_tilings": self.n_tilings,
+            "tile_seed": self.seed,
+            "tile_groups": np.array(["+".join(names) for names, _ in self.groups]),
+            "tile_group_tiles": self._group_tiles.astype(np.int64),
+            "tile_hash_version": HASH_VERSION,
+        }
+
+    @staticmethod
+    def from_config(data):
+        version = int(data["tile_hash_version"]) if "tile_hash_version" in data else 1
+        if version != HASH_VERSION:
+            raise ValueError(f"Tile coded weights of hash version {version}, the tiles are now hashed with "
+                             f"version {HASH_VERSION}; retrain")
+        groups = [(str(names).split("+"), int(tiles)) for names, tiles in zip(data["tile_groups"],
+                                                                             data["tile_group_tiles"])]
+        return TileCoder(int(data["tile_n_features"]), int(data["tile_n_tilings"]), groups, int(data["tile_seed"]))
\ No newline at end of file
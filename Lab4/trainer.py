@@ -0,0 +1,577 @@
+﻿import time
+
+import numpy as np
+import plotly.express as px
+
+from Lab4.checkpoint import CheckpointWriter, random_state_arrays, restore_random_state
+from Lab4.examinator import COEFFICIENT_NAMES, Examinator
+from Lab4.exploration_tracker import ExplorationTracker
+from Lab4.profiling import NullProfiler, StageProfiler
+from Lab4.sarsa import Sarsa, SparseSarsa
+from Lab4.state import CompactState
+from Lab4.utils import file_exist
+
+INITIAL_NOOP_STEPS = 6
+ACTION_DUPLICATE_TOLERANCE = 8
+
+# stages of a Trainer.train step timed with profile_file
+PROFILE_STAGES = ["env_step", "state", "policy", "exploration", "shaping", "update"]
+ENV_STEP_STAGE, STATE_STAGE, POLICY_STAGE, EXPLORATION_STAGE, SHAPING_STAGE, UPDATE_STAGE = range(len(PROFILE_STAGES))
+
+
+class LastActionTracker:
+    def __init__(self, space_size):
+        self.space_size = space_size
+        self.actions = []
+
+    def rec(self, action):
+        self.actions.append(action)
+        if len(self.actions) > self.space_size:
+            self.actions.pop(0)
+
+    def last_same_count(self):
+        if not self.actions:
+            return 0
+        last_action = self.actions[-1]
+        count = 0
+        for action in reversed(self.actions):
+            if action == last_action:
+                count += 1
+            else:
+                break
+        return count
+
+
+class _EnvEpisode:
+    """
+    Per-env bookkeeping of the running episode in Trainer.train_vectorized.
+    """
+
+    def __init__(self, featured_state, action, q_values, exploration_tracker):
+        self.featured_state = featured_state
+        self.state_vector = featured_state.as_vector()
+        self.action = action
+        self.q_values = q_values
+        self.distance_to_closest_enemy = featured_state.distance_from_player(
+            featured_state.closest_enemy) if featured_state.closest_enemy is not None else -1
+        self.last_action_tracker = LastActionTracker(space_size=ACTION_DUPLICATE_TOLERANCE)
+        self.exploration_tracker = exploration_tracker
+        self.exploration_tracker.reset()
+        self.reward = 0
+        self.visited_percentages = []
+        self.scanned_percentages = []
+
+
+class _TrainingProgress:
+    """
+    What Trainer.train carries from one episode to the next besides the model and numpy's random state,
+    saved in its checkpoints.
+    """
+
+    def __init__(self, class_name, n_episodes, n_actions, seed):
+        self.class_name = class_name
+        self.n_episodes = n_episodes
+        self.seed = seed
+        # the next episode to play
+        self.episode = 0
+        self.action_counts = np.zeros(n_actions, dtype=np.float32)
+        self.rewards = []
+        self.w_changes = []
+        self.scanned_percentages = []
+        self.visited_percentages = []
+
+    def arrays(self):
+        return {
+            "progress_class_name": self.class_name,
+            "progress_n_episodes": self.n_episodes,
+            "progress_seed": self.seed,
+            "progress_episode": self.episode,
+            "progress_action_counts": self.action_counts.copy(),
+            "progress_rewards": np.array(self.rewards, dtype=np.float64),
+            "progress_w_changes": np.array(self.w_changes, dtype=np.float64),
+            "progress_scanned_percentages": np.array(self.scanned_percentages, dtype=np.float64),
+            "progress_visited_percentages": np.array(self.visited_percentages, dtype=np.float64),
+        }
+
+    @staticmethod
+    def from_arrays(data):
+        progress = _TrainingProgress(str(data["progress_class_name"]), int(data["progress_n_episodes"]),
+                                     len(data["progress_action_counts"]), int(data["progress_seed"]))
+        progress.episode = int(data["progress_episode"])
+        progress.action_counts[:] = data["progress_action_counts"]
+        progress.rewards = data["progress_rewards"].tolist()
+        progress.w_changes = data["progress_w_changes"].tolist()
+        progress.scanned_percentages = data["progress_scanned_percentages"].tolist()
+        progress.visited_percentages = data["progress_visited_percentages"].tolist()
+        return progress
+
+
+class Trainer:
+    def __init__(self, epsilon_min=0.05, epsilon_decay_fraction=0.999, initial_epsilon=1.0, alpha=1e-5,
+                 examinator_coefficients=None):
+        """
+        :param examinator_coefficients: dict of Examinator coefficients to change, see COEFFICIENT_NAMES
+        """
+        self.epsilon_min = epsilon_min
+        self.epsilon_decay_fraction = epsilon_decay_fraction
+        self.initial_epsilon = initial_epsilon
+        self.examinator_coefficients = examinator_coefficients
+
+    @staticmethod
+    def _file_name_for_class(class_name):
+        return f"sarsa-weights-{class_name.lower()}.npz"
+
+    @staticmethod
+    def _checkpoint_name_for_class(class_name):
+        return f"sarsa-checkpoint-{class_name.lower()}.npz"
+
+    def train_if_needed(self, model, env, class_name, n_episodes=1000):
+        file_name = Trainer._file_name_for_class(class_name)
+        print(f'Checking for existing model file: {file_name}')
+        if not file_exist(file_name):
+            if file_exist(Trainer._checkpoint_name_for_class(class_name)):
+                return self.resume(env, class_name)
+            self.train(model, env, class_name, n_episodes)
+            return model
+
+        return Sarsa.load(file_name)
+
+    def _epsilon_decay(self, n_episodes):
+        decay_episodes = int(n_episodes * self.epsilon_decay_fraction)
+        if decay_episodes > 0:
+            epsilon_decay_step = (self.initial_epsilon - self.epsilon_min) / decay_episodes
+        else:
+            epsilon_decay_step = 0
+        return decay_episodes, epsilon_decay_step
+
+    def _epsilon_schedule(self, model, n_episodes):
+        model.epsilon = self.initial_epsilon
+        decay_episodes, epsilon_decay_step = self._epsilon_decay(n_episodes)
+        print(f"Epsilon will decay from {self.initial_epsilon} to {self.epsilon_min} over {decay_episodes} episodes.")
+        return decay_episodes, epsilon_decay_step
+
+    @staticmethod
+    def _shape_reward(examinator, model, featured_state, next_featured_state, action, next_action, reward,
+                      last_action_tracker, distance_to_closest_enemy, scanned_pixels, visited_pixels):
+        """
+        :return: shaped reward, new distance to closest enemy
+        """
+        shaped_reward = examinator.examine(next_featured_state, action, model, reward, featured_state, scanned_pixels, visited_pixels)
+
+        if last_action_tracker.last_same_count() >= ACTION_DUPLICATE_TOLERANCE and action == next_action:
+            shaped_reward += -0.2
+
+        new_distance_to_closest_enemy = next_featured_state.distance_from_player(
+            next_featured_state.closest_enemy) if next_featured_state.closest_enemy is not None else -1
+
+        if new_distance_to_closest_enemy != -1 and distance_to_closest_enemy != -1 and distance_to_closest_enemy - new_distance_to_closest_enemy > 0 and new_distance_to_closest_enemy < 20:
+            shaped_reward += -0.02
+
+        return shaped_reward, new_distance_to_closest_enemy
+
+    @staticmethod
+    def _check_batched_model(model):
+        """
+        The batched loops keep per-env traces as dense (n_envs, n_actions, state_dim) arrays updated by
+        Sarsa.td_update_batch, the sparse models have one trace set and train with train only.
+        """
+        if isinstance(model, SparseSarsa):
+            raise TypeError(f"{type(model).__name__} has no td_update_batch, train it with Trainer.train")
+
+    @staticmethod
+    def _rebalance_action_biases(model, action_counts, n_actions, episode, decay_episodes):
+        action_freq = action_counts / max(1, action_counts.sum())
+        action_entropy = -np.sum(action_freq * np.log(action_freq + 1e-10))
+        target_entropy = np.log(n_actions) * 0.65
+
+        if action_entropy < target_entropy and episode < decay_episodes:
+            most_used = np.argmax(action_counts)
+            second_most = np.argsort(action_counts)[-2]
+
+            # Penalize top 2 most-used actions
+            model.scale_bias(most_used, 0.85)
+            model.scale_bias(second_most, 0.92)
+
+            # Boost least-used actions
+            least_used_indices = np.where(action_freq < 0.02)[0]
+            for idx in least_used_indices:
+                model.scale_bias(idx, 1.05)
+
+            if episode % 50 == 0:
+                print(
+                    f"  [Episode {episode}] Entropy={action_entropy:.2f}, most_used={most_used} ({action_freq[most_used] * 100:.1f}%), bias_penalty applied")
+
+    @staticmethod
+    def _report(n_episodes, n_actions, action_counts, rewards, w_changes, scanned_pixels_by_episode_percentage, visited_pixels_by_episode_percentage):
+        px.line(x=np.arange(1, n_episodes + 1), y=w_changes, labels={'x': 'Episode', 'y': 'Mean |Δw|'},
+                title='Mean Weight Change over Episodes').show()
+        px.line(x=np.arange(1, n_episodes + 1), y=rewards, labels={'x': 'Episode', 'y': 'Reward'},
+                title='Episode Rewards over Time').show()
+
+        px.line(x=np.arange(1, n_episodes + 1), y=scanned_pixels_by_episode_percentage, labels={'x': 'Episode', 'y': 'Scanned Pixels Percentage'}, title='Scanned Pixels Percentage over Episodes').show()
+        px.line(x=np.arange(1, n_episodes + 1), y=visited_pixels_by_episode_percentage, labels={'x': 'Episode', 'y': 'Visited Pixels Percentage'}, title='Visited Pixels Percentage over Episodes').show()
+
+        action_freq = action_counts / action_counts.sum()
+        entropy = -np.sum(action_freq * np.log(action_freq + 1e-10))
+        print(f'Action distribution during training: {action_counts}')
+        print(f'Action entropy: {entropy:.3f} (max={np.log(n_actions):.3f})')
+        print(f'Most used action: {np.argmax(action_counts)} ({action_counts.max() / action_counts.sum() * 100:.1f}%)')
+        print(f"Training completed. Max score ever: {np.max(rewards)}")
+
+    def train(self, model, env, class_name, n_episodes=1000, seed=None, checkpoint_every=50, checkpoint_file=None,
+              profile_file=None, stop_after=None):
+        """
+        Episode i starts from env.reset(seed=seed + i), so with the checkpoint (taken after every
+        checkpoint_every episodes, 0 for none) the run can be continued exactly by resume.
+        :param seed: of the first episode, drawn from numpy's generator if None
+        :param checkpoint_file: default sarsa-checkpoint-<class_name>.npz
+        :param profile_file: if given, the PROFILE_STAGES of every step are timed, and their p50 / p99 are
+                             printed every log_step episodes and appended to this file as JSON lines
+        :param stop_after: stop after this many episodes (of the n_episodes schedule), with a checkpoint to resume
+                           from and without the report and the saved weights of a finished run
+        """
+        print(f"Training {class_name} agent...")
+        if seed is None:
+            seed = int(np.random.randint(2 ** 31 - 1))
+        progress = _TrainingProgress(class_name, n_episodes, env.action_space.n, seed)
+        self._epsilon_schedule(model, n_episodes)
+        self._train_episodes(model, env, progress, checkpoint_every, checkpoint_file, profile_file, stop_after)
+
+    def resume(self, env, class_name, checkpoint_every=50, checkpoint_file=None, profile_file=None, stop_after=None):
+        """
+        Continues the run of train saved in the checkpoint: model, epsilon schedule, numpy's random state
+        and the statistics of the episodes played so far.
+        :return: the model
+        """
+        checkpoint_file = checkpoint_file or self._checkpoint_name_for_class(class_name)
+        data = np.load(checkpoint_file)
+        model = Sarsa.load(checkpoint_file)
+        model.load_state(data)
+        progress = _TrainingProgress.from_arrays(data)
+        self.epsilon_min = float(data['trainer_epsilon_min'])
+        self.epsilon_decay_fraction = float(data['trainer_epsilon_decay_fraction'])
+        self.initial_epsilon = float(data['trainer_initial_epsilon'])
+        self.examinator_coefficients = dict(zip(COEFFICIENT_NAMES, data['trainer_examinator_coefficients'].tolist()))
+        restore_random_state(data)
+        print(f"Resuming {class_name} training at episode {progress.episode + 1}/{progress.n_episodes}...")
+        self._train_episodes(model, env, progress, checkpoint_every, checkpoint_file, profile_file, stop_after)
+        return model
+
+    def _checkpoint_arrays(self, model, progress, examinator):
+        arrays = model.state_arrays()
+        arrays.update(progress.arrays())
+        arrays.update(random_state_arrays())
+        arrays.update(trainer_epsilon_min=self.epsilon_min, trainer_epsilon_decay_fraction=self.epsilon_decay_fraction,
+                      trainer_initial_epsilon=self.initial_epsilon, trainer_examinator_coefficients=examinator.coefficients)
+        return arrays
+
+    def _train_episodes(self, model, env, progress, checkpoint_every, checkpoint_file, profile_file, stop_after=None):
+        class_name = progress.class_name
+        n_episodes = progress.n_episodes
+        last_episode = n_episodes if stop_after is None else min(stop_after, n_episodes)
+        action_counts = progress.action_counts
+
+        examinator = Examinator(self.examinator_coefficients)
+
+        rewards = progress.rewards
+        w_changes = progress.w_changes
+        previous_w = model.w.copy()
+
+        decay_episodes, epsilon_decay_step = self._epsilon_decay(n_episodes)
+
+        log_step = max(1, n_episodes // 100)
+
+        scanned_pixels_by_episode_percentage = progress.scanned_percentages
+        visited_pixels_by_episode_percentage = progress.visited_percentages
+
+        exploration_tracker = ExplorationTracker(160, 210)
+        checkpoints = CheckpointWriter(checkpoint_file or self._checkpoint_name_for_class(class_name)) \
+            if checkpoint_every > 0 else None
+        profiler = StageProfiler(PROFILE_STAGES, profile_file) if profile_file else NullProfiler()
+
+        for episode in range(progress.episode, last_episode):
+            _ = env.reset(seed=progress.seed + episode)
+
+            for j in range(0, INITIAL_NOOP_STEPS):  # skip initial no-op frames
+                _ = env.step(0)
+
+            last_action_tracker = LastActionTracker(space_size=ACTION_DUPLICATE_TOLERANCE)
+            exploration_tracker.reset()
+
+            state = env.render()
+            featured_state = CompactState(state)
+            state_vector = featured_state.as_vector()
+            distance_to_closest_enemy = featured_state.distance_from_player(
+                featured_state.closest_enemy) if featured_state.closest_enemy is not None else -1
+            model.reset_traces()
+
+            action, q_values = model.epsilon_greedy(state_vector)
+            action_counts[action] += 1
+
+            done = False
+            ep_reward = 0
+
+            visited_pixels_percantages = []
+            scanned_pixels_percantages = []
+
+            while not done:
+                t = profiler.start()
+                next_state, reward, terminated, truncated, _ = env.step(action)
+                t = profiler.lap(ENV_STEP_STAGE, t)
+                next_featured_state = CompactState(next_state)
+                t = profiler.lap(STATE_STAGE, t)
+
+                #end episode if no player box (death) or empty state
+                if next_featured_state.is_empty:
+                    done = True
+                    shaped_reward = reward + Examinator.DEATH_PENALTY
+                    q_next = 0.0
+                    next_action = None
+                else:
+                    done = terminated or truncated or next_featured_state.player_box is None
+                    next_features = next_featured_state.as_vector()
+                    next_action, next_q_values = model.epsilon_greedy(next_features)
+                    t = profiler.lap(POLICY_STAGE, t)
+
+                    visited_pixels, scanned_pixels = exploration_tracker.cover(next_featured_state)
+
+                    visited_percentage = next_featured_state.percentage_from_area(visited_pixels)
+                    scanned_percentage = next_featured_state.percentage_from_area(scanned_pixels)
+                    visited_pixels_percantages.append(visited_percentage)
+                    scanned_pixels_percantages.append(scanned_percentage)
+                    t = profiler.lap(EXPLORATION_STAGE, t)
+
+                    shaped_reward, distance_to_closest_enemy = self._shape_reward(
+                        examinator, model, featured_state, next_featured_state, action, next_action, reward,
+                        last_action_tracker, distance_to_closest_enemy, scanned_pixels, visited_pixels)
+                    t = profiler.lap(SHAPING_STAGE, t)
+
+                    q_next = 0.0 if done else next_q_values[next_action]
+
+                q = q_values[action]
+                delta = shaped_reward + model.gamma * q_next - q
+
+                model.td_update(state_vector, action, delta)
+                profiler.lap(UPDATE_STAGE, t)
+
+                if not done:
+                    featured_state = next_featured_state
+                    state_vector = next_features
+                    action = next_action
+                    q_values = next_q_values
+                    action_counts[action] += 1
+                    last_action_tracker.rec(action)
+
+                ep_reward += reward
+
+            scanned_pixels_by_episode_percentage.append(np.max(scanned_pixels_percantages) if scanned_pixels_percantages else 0.0)
+            visited_pixels_by_episode_percentage.append(np.max(visited_pixels_percantages) if visited_pixels_percantages else 0.0)
+
+            if episode > 0 and episode % 5 == 0:
+                self._rebalance_action_biases(model, action_counts, env.action_space.n, episode, decay_episodes)
+
+            model.epsilon = max(self.epsilon_min, model.epsilon - epsilon_decay_step)
+
+            w_change = np.mean(np.abs(model.w - previous_w))
+            w_changes.append(w_change)
+            previous_w = model.w.copy()
+            rewards.append(ep_reward)
+
+            if (episode + 1) % log_step == 0:
+                recent_max = float(np.max(rewards[-log_step:])) if len(rewards) > 0 else float(ep_reward)
+                print(
+                    f"Episode {episode + 1}/{n_episodes}: Max reward for period={recent_max:.2f}, Eps={model.epsilon:.4f}")
+                profiler.report(episode + 1)
+
+            progress.episode = episode + 1
+            if checkpoints is not None and (progress.episode % checkpoint_every == 0 or progress.episode == last_episode):
+                checkpoints.submit(self._checkpoint_arrays(model, progress, examinator))
+
+        if checkpoints is not None:
+            checkpoints.close()
+        if last_episode % log_step:
+            profiler.report(last_episode)
+        profiler.close()
+        if stop_after is not None:
+            return
+
+        self._report(n_episodes, env.action_space.n, action_counts, rewards, w_changes,
+                     scanned_pixels_by_episode_percentage, visited_pixels_by_episode_percentage)
+
+        model.save(self._file_name_for_class(class_name))
+
+    def train_vectorized(self, model, envs, class_name, n_episodes=1000, seed=None):
+        """
+        Same training loop as train, but over the K sub-envs of a gymnasium VectorEnv
+        (SyncVectorEnv / AsyncVectorEnv) created with autoreset_mode=AutoresetMode.DISABLED.
+        Every env keeps its own eligibility traces; the TD updates of one vector step are
+        applied together by Sarsa.td_update_batch, using q-values computed before that step.
+        If the envs are wrapped in FeaturizeObservation (featurized_env.make_vector_env), the states,
+        features and exploration coverage come from their observations instead of the RGB frames.
+        """
+        from Lab4.featurized_env import COMPACT_KEY, COVERAGE_KEY, FEATURES_KEY, is_featurized
+
+        self._check_batched_model(model)
+        featurized = is_featurized(envs.single_observation_space)
+        n_envs = envs.num_envs
+        n_actions = envs.single_action_space.n
+        print(f"Training {class_name} agent on {n_envs} environments...")
+        action_counts = np.zeros(n_actions, dtype=np.float32)
+
+        examinator = Examinator(self.examinator_coefficients)
+
+        rewards = []
+        w_changes = []
+        previous_w = model.w.copy()
+
+        decay_episodes, epsilon_decay_step = self._epsilon_schedule(model, n_episodes)
+
+        log_step = max(1, n_episodes // 100)
+
+        scanned_pixels_by_episode_percentage = []
+        visited_pixels_by_episode_percentage = []
+
+        z_w = np.zeros((n_envs,) + model.w.shape, dtype=np.float32)
+        z_b = np.zeros((n_envs,) + model.b.shape, dtype=np.float32)
+
+        episodes = [None] * n_envs
+        exploration_trackers = [ExplorationTracker(160, 210) for _ in range(n_envs)]
+        noop_steps_left = np.full(n_envs, INITIAL_NOOP_STEPS, dtype=np.int32)
+        actions = np.zeros(n_envs, dtype=np.int64)
+
+        observations, _ = envs.reset(seed=seed)
+        finished_episodes = 0
+        env_steps = 0
+        start_time = time.perf_counter()
+
+        while finished_episodes < n_episodes:
+            for k in range(n_envs):
+                actions[k] = episodes[k].action if episodes[k] is not None else 0
+
+            observations, env_rewards, terminated, truncated, _ = envs.step(actions)
+            env_steps += n_envs
+
+            reset_mask = np.zeros(n_envs, dtype=np.bool_)
+            learning_envs = []
+            next_featured_states = []
+
+            for k in range(n_envs):
+                if episodes[k] is None:
+                    if terminated[k] or truncated[k]:
+                        reset_mask[k] = True
+                        continue
+                    noop_steps_left[k] -= 1
+                    if noop_steps_left[k] == 0:
+                        featured_state = (CompactState.from_row(observations[COMPACT_KEY][k]) if featurized
+                                          else CompactState(observations[k]))
+                        if featured_state.is_empty:
+                            reset_mask[k] = True
+                            continue
+                        action, q_values = model.epsilon_greedy(featured_state.as_vector())
+                        episodes[k] = _EnvEpisode(featured_state, action, q_values, exploration_trackers[k])
+                        z_w[k].fill(0.0)
+                        z_b[k].fill(0.0)
+                        action_counts[action] += 1
+                    continue
+
+                learning_envs.append(k)
+                next_featured_states.append(CompactState.from_row(observations[COMPACT_KEY][k]) if featurized
+                                            else CompactState(observations[k]))
+
+            if not learning_envs:
+                if reset_mask.any():
+                    observations, _ = envs.reset(options={"reset_mask": reset_mask})
+                    noop_steps_left[reset_mask] = INITIAL_NOOP_STEPS
+                continue
+
+            rows = np.array(learning_envs, dtype=np.int64)
+            non_empty = [not s.is_empty for s in next_featured_states]
+            next_features = np.zeros((len(rows), model.state_dim), dtype=np.float32)
+            if featurized:
+                next_features[:] = observations[FEATURES_KEY][rows]
+            else:
+                for i, next_featured_state in enumerate(next_featured_states):
+                    if non_empty[i]:
+                        next_features[i] = next_featured_state.as_vector()
+            next_actions, next_q_values = model.epsilon_greedy_batch(next_features)
+
+            features = np.empty((len(rows), model.state_dim), dtype=np.float32)
+            taken_actions = np.empty(len(rows), dtype=np.int64)
+            deltas = np.empty(len(rows), dtype=np.float32)
+
+            for i, k in enumerate(learning_envs):
+                episode = episodes[k]
+                next_featured_state = next_featured_states[i]
+                reward = env_rewards[k]
+
+                if not non_empty[i]:
+                    done = True
+                    shaped_reward = reward + Examinator.DEATH_PENALTY
+                    q_next = 0.0
+                else:
+                    done = terminated[k] or truncated[k] or next_featured_state.player_box is None
+
+                    if featurized:
+                        visited_pixels, scanned_pixels = observations[COVERAGE_KEY][k].tolist()
+                    else:
+                        visited_pixels, scanned_pixels = episode.exploration_tracker.cover(next_featured_state)
+                    episode.visited_percentages.append(next_featured_state.percentage_from_area(visited_pixels))
+                    episode.scanned_percentages.append(next_featured_state.percentage_from_area(scanned_pixels))
+
+                    shaped_reward, episode.distance_to_closest_enemy = self._shape_reward(
+                        examinator, model, episode.featured_state, next_featured_state, episode.action, next_actions[i], reward,
+                        episode.last_action_tracker, episode.distance_to_closest_enemy, scanned_pixels, visited_pixels)
+
+                    q_next = 0.0 if done else next_q_values[i, next_actions[i]]
+
+                features[i] = episode.state_vector
+                taken_actions[i] = episode.action
+                deltas[i] = shaped_reward + model.gamma * q_next - episode.q_values[episode.action]
+                episode.reward += reward
+
+                if not done:
+                    episode.featured_state = next_featured_state
+                    episode.state_vector = next_features[i]
+                    episode.action = next_actions[i]
+                    episode.q_values = next_q_values[i]
+                    action_counts[episode.action] += 1
+                    episode.last_action_tracker.rec(episode.action)
+                    continue
+
+                episodes[k] = None
+                reset_mask[k] = True
+
+                scanned_pixels_by_episode_percentage.append(np.max(episode.scanned_percentages) if episode.scanned_percentages else 0.0)
+                visited_pixels_by_episode_percentage.append(np.max(episode.visited_percentages) if episode.visited_percentages else 0.0)
+
+                if finished_episodes > 0 and finished_episodes % 5 == 0:
+                    self._rebalance_action_biases(model, action_counts, n_actions, finished_episodes, decay_episodes)
+
+                model.epsilon = max(self.epsilon_min, model.epsilon - epsilon_decay_step)
+
+                w_change = np.mean(np.abs(model.w - previous_w))
+                w_changes.append(w_change)
+                previous_w = model.w.copy()
+                rewards.append(episode.reward)
+                finished_episodes += 1
+
+                if finished_episodes % log_step == 0:
+                    recent_max = float(np.max(rewards[-log_step:]))
+                    steps_per_second = env_steps / (time.perf_counter() - start_time)
+                    print(
+                        f"Episode {finished_episodes}/{n_episodes}: Max reward for period={recent_max:.2f}, Eps={model.epsilon:.4f}, {steps_per_second:.1f} env steps/s")
+
+            model.td_update_batch(z_w, z_b, rows, features, taken_actions, deltas)
+
+            if reset_mask.any():
+                observations, _ = envs.reset(options={"reset_mask": reset_mask})
+                noop_steps_left[reset_mask] = INITIAL_NOOP_STEPS
+
+        elapsed = time.perf_counter() - start_time
+        self.steps_per_second = env_steps / elapsed
+        print(f"Throughput: {env_steps} env steps in {elapsed:.1f}s ({self.steps_per_second:.1f} env steps/s)")
+
+        self._report(finished_episodes, n_actions, action_counts, rewards, w_changes,
+                     scanned_pixels_by_episode_percentage, visited_pixels_by_episode_percentage)
+
+        model.save(self._file_name_for_class(class_name))
\ No newline at end of file
@@ -0,0 +1,139 @@
+﻿import argparse
+import glob
+import os
+import time
+
+import numba
+import numpy as np
+
+from Lab4.env_info import WALL_COLOR, ENEMY_COLOR, PLAYER_COLOR
+
+LAB_DIR = os.path.dirname(os.path.abspath(__file__))
+# modules with cache=True kernels, their cache files are named <module>.<function>-<line>.<python>.nb[ic]
+CACHED_MODULES = ["env_analizators", "state", "exploration_tracker", "examinator", "sarsa", "findCoeff", "play"]
+
+
+def synthetic_frame():
+    """
+    A 210x160 RGB frame laid out like a Berzerk room: a wall outline with an exit on the left,
+    one inner wall, the player and an enemy. Kernels compile per argument type, so any frame of the
+    same dtype and layout compiles the same code as the real screens.
+    """
+    frame = np.zeros((210, 160, 3), dtype=np.uint8)
+    frame[4:8, 4:156] = WALL_COLOR
+    frame[180:184, 4:156] = WALL_COLOR
+    frame[4:80, 4:8] = WALL_COLOR
+    frame[110:184, 4:8] = WALL_COLOR
+    frame[4:184, 152:156] = WALL_COLOR
+    frame[60:64, 40:120] = WALL_COLOR
+    frame[100:120, 60:64] = PLAYER_COLOR
+    frame[30:48, 110:118] = ENEMY_COLOR
+    return frame
+
+
+def warmup_state():
+    """
+    Compiles the frame -> State pipeline: State, CompactState, the batched vectors, the incremental builder
+    with a room cache (first frame, moved player, changed wall), the exploration tracker and the reward shaping.
+    """
+    from Lab4.examinator import Examinator
+    from Lab4.exploration_tracker import ExplorationTracker
+    from Lab4.room_cache import RoomCache
+    from Lab4.sarsa import Sarsa
+    from Lab4.state import State, CompactState, IncrementalStateBuilder, states_as_vectors, compact_states
+
+    frame = synthetic_frame()
+    moved = frame.copy()
+    moved[100:120, 60:64] = 0
+    moved[100:120, 66:70] = PLAYER_COLOR
+    shot = moved.copy()
+    shot[62, 90] = 0
+
+    state = State(frame)
+    State(frame, room_cache=RoomCache())
+    features = state.as_vector()
+    CompactState(frame).as_vector()
+    states_as_vectors(np.stack([frame, moved]), return_empty_mask=True)
+    compact_states(np.stack([frame, moved]))
+
+    builder = IncrementalStateBuilder(room_cache=RoomCache())
+    for f in (frame, frame, moved, shot):
+        built = builder.build(f)
+
+    tracker = ExplorationTracker(built.state_h, built.state_w)
+    visited_pixels, scanned_pixels = tracker.cover(built)
+
+    examinator = Examinator()
+    compact = CompactState(moved)
+    examinator.examine(compact, 2, None, 0.0, CompactState(frame), scanned_pixels, visited_pixels)
+    records = compact_states(np.stack([frame, moved]))
+    examinator.examine_batch(records[1:], [2], [0.0], records[:1])
+
+    Sarsa(18).td_update(features, 0, 0.0)
+
+
+def warmup_irl():
+    """
+    Compiles the IRL feature extraction of play/findCoeff, serial and parallel.
+    """
+    from Lab4.play.findCoeff import extract_features, extract_features_batch
+
+    states = np.zeros((2, 21, 21, 4), dtype=np.uint8)
+    states[:, :, :, 0] = 1
+    states[:, 10, 10] = (0, 1, 0, 0)
+    states[:, 3, 3] = (0, 0, 0, 1)
+    actions = np.array([2, 1], dtype=np.int64)
+    extract_features(states[0], actions[0], states[1])
+    extract_features_batch(states, actions, states, single_thread=True)
+    extract_features_batch(states, actions, states)
+
+
+def warmup(include_irl=False):
+    """
+    Compiles (or loads from the numba cache) every kernel the training loop uses.
+    :return: dict of seconds spent per group
+    """
+    timings = {}
+    start = time.perf_counter()
+    warmup_state()
+    timings["state"] = time.perf_counter() - start
+    if include_irl:
+        start = time.perf_counter()
+        warmup_irl()
+        timings["irl"] = time.perf_counter() - start
+    return timings
+
+
+def _cache_dirs():
+    if numba.config.CACHE_DIR:
+        return [numba.config.CACHE_DIR]
+    return [os.path.join(root, "__pycache__") for root, _, _ in os.walk(LAB_DIR)]
+
+
+def clear_cache():
+    """
+    Deletes the compiled kernels of this package. numba checks only the source file of a kernel, not the
+    modules of the kernels it calls, so after editing env_analizators the kernels of state.py that inline
+    it would still load the old code from the cache.
+    :return: number of deleted files
+    """
+    removed = 0
+    for cache_dir in _cache_dirs():
+        for ext in ("nbi", "nbc"):
+            for path in glob.glob(os.path.join(cache_dir, "**", f"*.{ext}"), recursive=True):
+                if os.path.basename(path).split(".")[0] in CACHED_MODULES:
+                    os.remove(path)
+                    removed += 1
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the numba kernels into the on-disk cache.")
+    parser.add_argument("--clear", action="store_true", help="delete the cached kernels first")
+    parser.add_argument("--irl", action="store_true", help="also compile the play/findCoeff kernels")
+    args = parser.parse_args()
+
+    if args.clear:
+        print(f"removed {clear_cache()} cache files")
+    for group, seconds in warmup(include_irl=args.irl).items():
+        print(f"{group:<6} {seconds:6.2f}s")
\ No newline at end of file